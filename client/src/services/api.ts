@@ -86,6 +86,10 @@ export interface DocContent {
 export interface SearchResult {
   path: string
   name: string
+  id?: string
+  anchor?: string
+  heading?: string
+  headings?: string[]
   matches: Array<{
     type: string
     text: string
@@ -100,6 +104,12 @@ export interface Breadcrumb {
   path: string
 }
 
+export interface RelatedDoc {
+  name: string
+  path: string
+  score: number
+}
+
 export interface SearchResponse {
   results: SearchResult[]
   total: number
@@ -107,6 +117,8 @@ export interface SearchResponse {
   page: number
   per_page: number
   total_pages: number
+  // 分面分布: { 属性: { 取值: 文档数 } }，属性为 type / category_lvl0 / category_lvl1 / course
+  facet_distribution?: Record<string, Record<string, number>>
 }
 
 export interface SearchParams {
@@ -118,6 +130,10 @@ export interface SearchParams {
   doc_type?: string
   date_from?: string
   date_to?: string
+  category?: string
+  course?: string
+  // hybrid: 关键词结果与语义结果融合（需要服务端启用语义搜索）
+  mode?: 'keyword' | 'hybrid'
 }
 
 export const docApi = {
@@ -153,6 +169,14 @@ export const docApi = {
     return response.data
   },
   
+  // 获取相关阅读
+  getRelatedDocs: async (path: string, limit: number = 5) => {
+    const response = await api.get<RelatedDoc[]>(`/docs/related/${path}`, {
+      params: { limit }
+    })
+    return response.data
+  },
+
   // 获取在线阅读人数
   getOnlineReadersCount: async () => {
     const response = await api.get<{count: number}>('/docs/stats/online-readers')
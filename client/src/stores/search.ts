@@ -5,6 +5,10 @@ import { searchDocs } from '../services/api'
 interface SearchResult {
   path: string
   name: string
+  id?: string
+  anchor?: string
+  heading?: string
+  headings?: string[]
   matches: Array<{
     type: string
     text: string
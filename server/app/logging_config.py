@@ -0,0 +1,109 @@
+"""日志配置
+
+所有日志记录先放入内存队列，由后台线程写入终端和日志文件，请求处理中的日志调用不会因 I/O 阻塞。
+通过环境变量配置:
+
+- LOG_LEVEL: 全局日志级别（默认 INFO）
+- LOG_LEVELS: 按模块设置级别，例如 "app.services.doc_service=DEBUG,httpx=INFO"
+- LOG_FILE: 同时写入按大小轮转的日志文件（默认不写文件）
+- LOG_QUEUE_SIZE: 队列容量，队列满时丢弃新记录而不是阻塞（默认 10000）
+"""
+import os
+import sys
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional
+
+DEFAULT_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+# 第三方库的调试日志量很大（例如 httpx 每个请求一条），默认只输出警告
+DEFAULT_MODULE_LEVELS: Dict[str, str] = {
+    "httpx": "WARNING",
+    "httpcore": "WARNING",
+    "watchdog": "WARNING",
+    "multipart": "WARNING",
+    "asyncio": "WARNING",
+    "PIL": "WARNING",
+}
+
+_listeners: List[QueueListener] = []
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """队列满时丢弃记录的 QueueHandler，记录丢弃的条数"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_module_levels(spec: str) -> Dict[str, str]:
+    """解析 "模块=级别,模块=级别" 格式的按模块日志级别"""
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def queued_handler(*handlers: logging.Handler, queue_size: Optional[int] = None) -> NonBlockingQueueHandler:
+    """返回一个写入队列的处理器，由后台线程把记录交给 handlers 输出"""
+    if queue_size is None:
+        queue_size = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    if not _listeners:
+        atexit.register(shutdown_logging)
+    _listeners.append(listener)
+    return NonBlockingQueueHandler(log_queue)
+
+
+def setup_logging(level: Optional[str] = None, module_levels: Optional[Dict[str, str]] = None,
+                  log_file: Optional[str] = None) -> logging.Logger:
+    """配置根日志记录器，重复调用不会重复添加处理器"""
+    root = logging.getLogger()
+    if any(isinstance(handler, NonBlockingQueueHandler) for handler in root.handlers):
+        return root
+
+    level = (level or os.environ.get("LOG_LEVEL", "INFO")).upper()
+    levels = dict(DEFAULT_MODULE_LEVELS)
+    levels.update(parse_module_levels(os.environ.get("LOG_LEVELS", "")))
+    levels.update(module_levels or {})
+    log_file = log_file or os.environ.get("LOG_FILE")
+
+    formatter = logging.Formatter(os.environ.get("LOG_FORMAT", DEFAULT_FORMAT))
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        handlers.append(RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # 替换已有的处理器（例如 basicConfig 添加的同步处理器）
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queued_handler(*handlers))
+    root.setLevel(level)
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+    return root
+
+
+def shutdown_logging():
+    """停止后台线程，输出队列中剩余的记录"""
+    while _listeners:
+        listener = _listeners.pop()
+        try:
+            listener.stop()
+        except Exception:
+            pass
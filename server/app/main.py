@@ -1,15 +1,28 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder
 import time
 import os
 import asyncio
 import logging
 import gc
 import psutil
+from functools import partial
+from app.logging_config import setup_logging, shutdown_logging
+
+# 在导入服务模块之前配置日志，模块加载时的日志也经由队列输出
+setup_logging()
+
 from app.services.doc_service import DocService
-from app.services.meilisearch_service import MeiliSearchService
-from app.routers import docs, search, announcements, feedback, admin
+from app.services.meilisearch_service import meili_search_service
+from app.services.pdf_linearize_service import PdfLinearizeService
+from app.services.job_service import job_service
+from app.services.stats_service import stats_service
+from app.routers import docs, search, announcements, feedback, admin, jobs
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="AI Library API",
@@ -35,8 +48,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class SelectiveGZipResponder(GZipResponder):
+    """PDF 和范围响应原样发送：PDF 本身已压缩，压缩后 Content-Length/Content-Range 也不再对应原文件的字节"""
+    NO_GZIP_TYPES = ("application/pdf",)
+
+    async def send_with_gzip(self, message):
+        await super().send_with_gzip(message)
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+            if content_type in self.NO_GZIP_TYPES or "content-range" in headers:
+                # 与已设置 Content-Encoding 的响应一样直接透传
+                self.content_encoding_set = True
+
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            responder = SelectiveGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
 # 启用压缩 - 优化压缩设置
-app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=6)
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=500, compresslevel=6)
 
 # 包含路由
 app.include_router(docs.router, prefix="/api/docs", tags=["docs"])
@@ -44,6 +80,7 @@ app.include_router(search.router, prefix="/api/search", tags=["search"])
 app.include_router(announcements.router, prefix="/api/announcements", tags=["announcements"])
 app.include_router(feedback.router, prefix="/api/feedback", tags=["feedback"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
 
 # 性能监控中间件
 @app.middleware("http")
@@ -71,7 +108,6 @@ async def health_check(request: Request):
 async def detailed_health_check():
     """详细的健康检查，包括服务状态"""
     doc_service = DocService()
-    meili_search_service = MeiliSearchService()
     
     # 检查文件监视器状态
     watcher_status = "unknown"
@@ -90,13 +126,14 @@ async def detailed_health_check():
         "locks_count": len(doc_service._cache_locks)
     }
     
-    # 检查MeiliSearch状态
+    # 检查MeiliSearch状态（共用单例客户端的连接池，不再每次新建客户端）
     search_status = {"using": "meilisearch"}
     try:
         meili_status = await meili_search_service.check_status()
         search_status.update(meili_status)
     except Exception as e:
         search_status["error"] = str(e)
+    search_status["monitor"] = search.search_health_monitor.snapshot()
     
     # 获取内存使用情况
     process = psutil.Process()
@@ -126,7 +163,7 @@ async def perform_maintenance():
     
     while True:
         try:
-            logging.info("执行定期维护任务...")
+            logger.info("执行定期维护任务...")
             
             # 执行DocService维护
             await doc_service.perform_maintenance()
@@ -137,14 +174,14 @@ async def perform_maintenance():
             
             # 如果内存使用超过70%，执行额外的清理
             if memory_percent > 70:
-                logging.warning(f"内存使用率过高: {memory_percent:.1f}%，执行额外清理")
+                logger.warning("内存使用率过高: %.1f%%，执行额外清理", memory_percent)
                 # 强制执行垃圾回收
                 gc.collect()
                 
-            logging.info("维护任务完成")
+            logger.info("维护任务完成")
             
         except Exception as e:
-            logging.error(f"维护任务出错: {str(e)}")
+            logger.error("维护任务出错: %s", e)
         
         # 每天执行一次
         await asyncio.sleep(86400)
@@ -155,45 +192,87 @@ async def startup_event():
     # 启动定期维护任务
     asyncio.create_task(perform_maintenance())
     
+    # 访问事件由后台任务写入事件日志并定期压缩
+    asyncio.create_task(stats_service.run_writer_loop())
+    
     # 在后台任务中检查MeiliSearch状态
     asyncio.create_task(check_meilisearch_status())
     
-    print("Application started with maintenance tasks.")
+    # 后台定期检查MeiliSearch健康状态，搜索请求只读取缓存的状态
+    asyncio.create_task(search.search_health_monitor.run())
+    
+    # 文件变化时增量更新搜索索引
+    DocService().add_change_listener(search.incremental_indexer.mark_dirty)
+    asyncio.create_task(search.incremental_indexer.run_watch_loop())
+    
+    # 构建进程内自动补全索引，文件变化后在下次查询时后台重建
+    DocService().add_change_listener(search.autocomplete_service.mark_dirty)
+    asyncio.create_task(search.autocomplete_service.refresh())
+    
+    # 本地全文索引不存在时在后台构建，作为MeiliSearch的降级方案
+    if search.search_service.fulltext.doc_count == 0:
+        asyncio.create_task(search.search_service.build_fulltext_index())
+    DocService().add_change_listener(search.search_service.mark_dirty)
+    asyncio.create_task(search.search_service.run_watch_loop())
+    
+    # 启用语义搜索时在后台构建语义索引，文档变化后定期增量重建
+    if search.semantic_service.enabled and search.semantic_service.available:
+        # 预先启动进程池并加载模型，第一个混合搜索请求不必等待冷启动
+        asyncio.create_task(search.semantic_service.warm_up())
+        if not search.semantic_service.is_ready:
+            search.submit_semantic_rebuild()
+        DocService().add_change_listener(search.semantic_service.mark_dirty)
+        asyncio.create_task(search.semantic_service.run_watch_loop(search.submit_semantic_rebuild))
+    
+    # 相关阅读查找表不存在时在后台计算，文档变化后定期增量刷新
+    if docs.related_service.available:
+        if not docs.related_service.is_ready:
+            docs.submit_related_rebuild()
+        DocService().add_change_listener(docs.related_service.mark_dirty)
+        asyncio.create_task(docs.related_service.run_watch_loop(docs.submit_related_rebuild))
+    
+    # 启用时在后台为大型PDF生成线性化副本
+    pdf_linearize_service = PdfLinearizeService()
+    if pdf_linearize_service.enabled:
+        async def linearize_pdfs(job):
+            return await pdf_linearize_service.linearize_all(progress=job.report)
+        job_service.submit("pdf_linearize", linearize_pdfs, description="PDF线性化", exclusive=False)
+    
+    logger.info("Application started with maintenance tasks.")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时取消后台任务，释放MeiliSearch客户端的连接池"""
+    await job_service.shutdown()
+    await stats_service.close()
+    search.semantic_service.close()
+    await meili_search_service.close()
+    shutdown_logging()
 
 async def check_meilisearch_status():
     """异步检查MeiliSearch状态的后台任务"""
     try:
-        meili_search_service = MeiliSearchService()
-        print("[INFO] 检查MeiliSearch服务状态...")
+        logger.info("检查MeiliSearch服务状态...")
+        status = await meili_search_service.check_status()
+        if status.get("status") != "available":
+            logger.warning("MeiliSearch服务不可用: %s", status)
+            return
+        logger.info("MeiliSearch服务可用: %s", status)
         
-        # 检查MeiliSearch状态
-        try:
-            status = await meili_search_service.check_status()
-            if status.get("status") == "available":
-                print(f"[INFO] MeiliSearch服务可用: {status}")
-                # 检查是否需要构建索引
-                if not status.get("index_exists") or status.get("document_count", 0) == 0:
-                    print("[INFO] MeiliSearch索引不存在或为空，即将在后台构建索引...")
-                    try:
-                        # 使用较长的超时防止大型索引构建被中断
-                        await asyncio.wait_for(meili_search_service.build_index(), timeout=3600)  # 1小时超时
-                        print("[INFO] MeiliSearch索引构建完成")
-                    except asyncio.TimeoutError:
-                        print("[ERROR] MeiliSearch索引构建超时，请手动重建索引")
-                    except Exception as e:
-                        import traceback
-                        print(f"[ERROR] MeiliSearch索引构建失败: {str(e)}")
-                        traceback.print_exc()
-                else:
-                    print(f"[INFO] MeiliSearch索引已存在，包含 {status.get('document_count', 0)} 个文档")
-            else:
-                print(f"[WARNING] MeiliSearch服务不可用: {status}")
-        except Exception as e:
-            print(f"[ERROR] 连接MeiliSearch失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
+        if not status.get("index_exists") or status.get("document_count", 0) == 0:
+            # 作为 rebuild_index 任务提交：持有写锁，与手动重建、增量同步串行执行，
+            # 启动期间调用 /rebuild-index 会返回同一个任务
+            logger.info("MeiliSearch索引不存在或为空，在后台构建索引...")
+            job = job_service.submit(
+                "rebuild_index",
+                partial(search.run_rebuild, include_local=False),
+                description="构建搜索索引（启动时索引为空）"
+            )
+            logger.info("索引构建任务已提交: %s", job.id)
+        else:
+            logger.info("MeiliSearch索引已存在，包含 %s 个文档，开始增量同步...", status.get('document_count', 0))
+            async with job_service.writer_lock:
+                await search.incremental_indexer.sync()
     except Exception as e:
-        print(f"[ERROR] 检查MeiliSearch状态时出错: {str(e)}")
         # 记录详细错误信息，但允许应用继续启动
-        import traceback
-        traceback.print_exc()
\ No newline at end of file
+        logger.exception("检查MeiliSearch状态时出错: %s", e)
@@ -2,21 +2,17 @@ from fastapi import APIRouter, Depends, HTTPException, status, Body
 from typing import List, Dict, Any, Optional
 import logging
 from datetime import datetime
-import os
 
 from ..services.announcement_service import AnnouncementService
 from ..services.doc_service import DocService
-from ..services.stats_service import StatsService
+from ..services.stats_service import StatsService, stats_service
+from ..services.search_metrics import search_metrics
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 logger = logging.getLogger(__name__)
 
-# 初始化服务
-data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
-os.makedirs(data_dir, exist_ok=True)  # 确保数据目录存在
-
+# 初始化服务（统计服务使用与文档路由共用的模块级实例）
 announcement_service = AnnouncementService()
-stats_service = StatsService(data_dir=data_dir)
 
 # 获取服务实例
 def get_announcement_service():
@@ -28,15 +24,20 @@ def get_doc_service():
 def get_stats_service():
     return stats_service
 
+# 热门文档的滚动窗口
+POPULAR_RANGES = {"7d": 7, "30d": 30, "90d": 90}
+
 # 热门阅读API
 @router.get("/popular", response_model=List[Dict[str, Any]])
 async def get_popular_docs(
     limit: int = 10,
+    range: Optional[str] = None,
     stats_service: StatsService = Depends(get_stats_service)
 ):
-    """获取热门阅读文档列表"""
+    """获取热门阅读文档列表，range 为 7d/30d/90d 时按滚动窗口内的访问量排序"""
     try:
-        popular_docs = stats_service.get_popular_docs(limit)
+        days = POPULAR_RANGES.get(range) if range else None
+        popular_docs = stats_service.get_popular_docs(limit, days)
         return popular_docs
     except Exception as e:
         logger.error(f"获取热门阅读文档失败: {str(e)}")
@@ -122,15 +123,17 @@ async def get_stats():
         raise HTTPException(status_code=500, detail=f"获取统计数据失败: {str(e)}")
 
 @router.get("/popular-docs", response_model=List[Dict[str, Any]])
-async def get_popular_docs(limit: int = 10):
+async def get_popular_docs(limit: int = 10, range: Optional[str] = None):
     """
     获取热门阅读文档列表
     
     Args:
         limit: 返回的文档数量
+        range: 7d/30d/90d 时按滚动窗口内的访问量排序，默认按累计访问量
     """
     try:
-        return stats_service.get_popular_docs(limit=limit)
+        days = POPULAR_RANGES.get(range) if range else None
+        return stats_service.get_popular_docs(limit=limit, days=days)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取热门文档失败: {str(e)}")
 
@@ -199,4 +202,26 @@ async def reset_cache(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"重置缓存失败: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+# 搜索延迟统计API
+@router.get("/search-latency", response_model=Dict[str, Any])
+async def get_search_latency(slow_limit: int = 20):
+    """获取各搜索阶段的延迟直方图（p50/p90/p99）和最近的慢查询"""
+    try:
+        data = search_metrics.snapshot()
+        data["recent_slow_queries"] = search_metrics.recent_slow_queries(slow_limit)
+        return data
+    except Exception as e:
+        logger.error(f"获取搜索延迟统计失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取搜索延迟统计失败: {str(e)}"
+        )
+
+# 重置搜索延迟统计API
+@router.post("/search-latency/reset", response_model=Dict[str, Any])
+async def reset_search_latency():
+    """清空延迟直方图（慢查询日志保留）"""
+    search_metrics.reset()
+    return {"success": True, "message": "搜索延迟统计已重置"}
@@ -1,13 +1,18 @@
 from fastapi import APIRouter, HTTPException, Request, Depends, Response
 from fastapi.responses import FileResponse, JSONResponse
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 import os
+import anyio
+from starlette.datastructures import Headers
 import json
 import logging
 import time
 from datetime import datetime, timedelta
 from app.services.doc_service import DocService
-from app.services.stats_service import StatsService
+from app.services.stats_service import StatsService, stats_service
+from app.services.pdf_linearize_service import PdfLinearizeService
+from app.services.related_service import RelatedDocsService
+from app.services.job_service import Job, job_service
 
 router = APIRouter(prefix="", tags=["docs"])
 logger = logging.getLogger(__name__)
@@ -34,17 +39,114 @@ class CompressedJSONResponse(JSONResponse):
         
         super().__init__(content, status_code, headers, **kwargs)
 
+def parse_byte_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个字节范围 "bytes=start-end" / "bytes=start-" / "bytes=-suffix"
+    
+    Returns:
+        包含两端的 (start, end)；不支持的格式（例如多个范围）返回 None，按完整文件响应
+        
+    Raises:
+        ValueError: 范围超出文件大小，应返回 416
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_str, sep, end_str = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start_str == "":
+            # 后缀范围：文件末尾的若干字节
+            suffix = int(end_str)
+            # "bytes=-0" 无法满足，start 置为文件大小以返回 416
+            start = max(file_size - suffix, 0) if suffix > 0 else file_size
+            end = file_size - 1
+        else:
+            start = int(start_str)
+            end = int(end_str) if end_str else file_size - 1
+    except ValueError:
+        # 格式错误的 Range 头按没有 Range 处理
+        return None
+    if start < 0 or start >= file_size or end < start:
+        raise ValueError(range_header)
+    return start, min(end, file_size - 1)
+
+class RangeFileResponse(FileResponse):
+    """支持单个 Range 请求的文件响应
+
+    当前 starlette 的 FileResponse 忽略 Range 头，总是返回完整文件；PDF 查看器按需加载时
+    需要 206 Partial Content，才能只下载首页所需的部分。
+    """
+    async def __call__(self, scope, receive, send):
+        request_headers = Headers(scope=scope)
+        range_header = request_headers.get("range")
+        if range_header is None:
+            return await super().__call__(scope, receive, send)
+        
+        stat_result = self.stat_result or await anyio.to_thread.run_sync(os.stat, self.path)
+        self.stat_result = stat_result
+        self.set_stat_headers(stat_result)
+        file_size = stat_result.st_size
+        
+        # If-Range 与当前版本不一致时文件已更新，返回完整文件
+        if_range = request_headers.get("if-range")
+        if if_range and if_range not in (self.headers.get("etag"), self.headers.get("last-modified")):
+            return await super().__call__(scope, receive, send)
+        try:
+            byte_range = parse_byte_range(range_header, file_size)
+        except ValueError:
+            await send({
+                "type": "http.response.start",
+                "status": 416,
+                "headers": [(b"content-range", f"bytes */{file_size}".encode()), (b"content-length", b"0")],
+            })
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if byte_range is None:
+            return await super().__call__(scope, receive, send)
+        
+        start, end = byte_range
+        self.status_code = 206
+        self.headers["content-length"] = str(end - start + 1)
+        self.headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    # 文件在读取过程中被截断
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
+
 def get_doc_service():
     return DocService()
 
+# 相关阅读查找表由后台任务离线计算，请求时只做查找
+# （模块导入时可能还没有事件循环，不能在这里创建 DocService）
+static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "static")
+related_service = RelatedDocsService(os.path.join(static_dir, "docs"), os.path.join(static_dir, "cache"))
+
+def submit_related_rebuild(full: bool = False) -> Job:
+    """提交相关阅读查找表的刷新任务（默认只重新计算变化的文档）"""
+    async def run(job: Job):
+        return await related_service.refresh(full=full, progress=job.report)
+    # 只写相关阅读查找表，不需要持有索引写锁
+    return job_service.submit("related_docs", run, description="计算相关阅读", exclusive=False)
+
 def get_stats_service():
-    # 获取项目根目录
-    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-    # 创建数据目录路径
-    data_dir = os.path.join(project_root, 'server', 'static', 'stats')
-    # 确保目录存在
-    os.makedirs(data_dir, exist_ok=True)
-    return StatsService(data_dir)
+    # 所有请求共用同一个统计服务，访问事件在内存中累积后由后台任务写入
+    return stats_service
 
 @router.get("/tree")
 async def get_doc_tree():
@@ -60,22 +162,22 @@ async def get_doc_tree():
 async def get_doc_subtree(path: str):
     """获取指定路径的子树"""
     try:
-        logger.info(f"正在获取子树: {path}")
+        logger.info("正在获取子树: %s", path)
         result = await get_doc_service().get_doc_subtree(path)
         if "error" in result:
-            logger.error(f"获取子树失败: {path}, 错误: {result['error']}")
+            logger.error("获取子树失败: %s, 错误: %s", path, result['error'])
             raise HTTPException(status_code=400, detail=result["error"])
-        logger.info(f"子树获取成功: {path}, 子节点数量: {len(result.get('children', []))}")
+        logger.info("子树获取成功: %s, 子节点数量: %s", path, len(result.get('children', [])))
         return CompressedJSONResponse(result, max_age=3600)  # 缓存1小时
     except Exception as e:
-        logger.error(f"获取子树失败: {path}, 错误: {str(e)}")
+        logger.error("获取子树失败: %s, 错误: %s", path, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/debug/tree-has-children/{path:path}")
 async def debug_tree_has_children(path: str) -> Dict:
     """调试端点：检查路径是否设置了has_children标记"""
     try:
-        logger.info(f"调试：检查路径是否有子内容: {path}")
+        logger.info("调试：检查路径是否有子内容: %s", path)
         # 构建一个简单的树，只加载顶层内容
         tree = await get_doc_service().get_doc_tree()
         
@@ -107,7 +209,7 @@ async def debug_tree_has_children(path: str) -> Dict:
             "name": node.get("name", ""),
         }
     except Exception as e:
-        logger.error(f"调试has_children检查失败: {str(e)}")
+        logger.error("调试has_children检查失败: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/content/{path:path}")
@@ -119,14 +221,14 @@ async def get_doc_content(path: str, request: Request):
         if forwarded_for:
             # X-Forwarded-For格式为: client, proxy1, proxy2, ...
             ip_address = forwarded_for.split(",")[0].strip()
-            logger.debug(f"文档访问 - 从X-Forwarded-For获取IP: {ip_address}")
+            logger.debug("文档访问 - 从X-Forwarded-For获取IP: %s", ip_address)
         else:
             ip_address = request.client.host
-            logger.debug(f"文档访问 - 从client.host获取IP: {ip_address}")
+            logger.debug("文档访问 - 从client.host获取IP: %s", ip_address)
         
         # 更新在线状态
         await get_doc_service().update_reader(ip_address, path)
-        logger.debug(f"已更新用户状态: {ip_address} 访问文档 {path}")
+        logger.debug("已更新用户状态: %s 访问文档 %s", ip_address, path)
         
         # 获取文件路径和MIME类型
         file_path, mime_type = await get_doc_service().get_file_response(path)
@@ -138,8 +240,13 @@ async def get_doc_content(path: str, request: Request):
             
         # 如果是PDF文件，返回文件和正确的Content-Type
         if mime_type == 'application/pdf':
-            response = FileResponse(
-                file_path,
+            # 优先使用线性化副本，查看器一次范围请求即可渲染首页
+            pdf_linearize_service = PdfLinearizeService()
+            linearized_path = pdf_linearize_service.get_linearized_path(path)
+            if linearized_path is None:
+                pdf_linearize_service.schedule(path)
+            response = RangeFileResponse(
+                linearized_path or file_path,
                 media_type=mime_type,
                 filename=os.path.basename(file_path),
                 headers={
@@ -163,7 +270,7 @@ async def get_doc_content(path: str, request: Request):
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        logger.error(f"获取文档内容失败: {str(e)}")
+        logger.error("获取文档内容失败: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/metadata/{path:path}")
@@ -207,25 +314,35 @@ async def get_online_readers(request: Request):
         if forwarded_for:
             # X-Forwarded-For格式为: client, proxy1, proxy2, ...
             ip_address = forwarded_for.split(",")[0].strip()
-            logger.debug(f"从X-Forwarded-For获取IP: {ip_address}")
+            logger.debug("从X-Forwarded-For获取IP: %s", ip_address)
         else:
             ip_address = request.client.host
-            logger.debug(f"从client.host获取IP: {ip_address}")
+            logger.debug("从client.host获取IP: %s", ip_address)
         
         # 更新在线状态
         await get_doc_service().update_reader(ip_address, "homepage")
-        logger.debug(f"已更新用户状态: {ip_address} 在首页")
+        logger.debug("已更新用户状态: %s 在首页", ip_address)
         
         # 获取总数
         count = await get_doc_service().get_online_readers_count()
-        logger.debug(f"当前在线用户数: {count}")
+        logger.debug("当前在线用户数: %s", count)
         
         # 在线读者数据频繁变化，使用短缓存
         return CompressedJSONResponse({"count": count}, max_age=60)  # 缓存1分钟
     except Exception as e:
-        logger.error(f"获取在线读者数量出错: {str(e)}")
+        logger.error("获取在线读者数量出错: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/related/{path:path}")
+async def get_related_docs(path: str, limit: int = 5):
+    """获取文档的相关阅读（必须注册在通配路由之前）"""
+    if not related_service.available:
+        raise HTTPException(status_code=503, detail="未安装 numpy / scipy，无法提供相关阅读")
+    limit = max(1, min(limit, related_service.top_n))
+    data = related_service.get_related(path, limit)
+    # 查找表只在后台任务刷新后变化
+    return CompressedJSONResponse(data, max_age=3600)  # 缓存1小时
+
 @router.get("/{doc_path:path}")
 async def get_doc(
     doc_path: str,
@@ -253,7 +370,7 @@ async def get_doc(
             
         return CompressedJSONResponse(doc, max_age=max_age)
     except Exception as e:
-        logger.error(f"获取文档失败: {str(e)}")
+        logger.error("获取文档失败: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"获取文档失败: {str(e)}"
@@ -324,9 +441,9 @@ def add_cache_headers(response: Response, max_age: int = 3600):
                 elif hasattr(response, "body"):
                     response.headers["ETag"] = f"\"{hash(str(response.body)) & 0xffffffff:08x}\""
             except Exception as e:
-                logger.warning(f"无法为响应生成ETag: {str(e)}")
+                logger.warning("无法为响应生成ETag: %s", e)
         
         return response
     except Exception as e:
-        logger.error(f"添加缓存头时出错: {str(e)}")
+        logger.error("添加缓存头时出错: %s", e)
         return response
\ No newline at end of file
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Dict, List, Optional
+from app.services.job_service import Job, job_service
+from app.services.pdf_linearize_service import PdfLinearizeService
+
+router = APIRouter()
+
+
+@router.get("/")
+async def list_jobs(kind: Optional[str] = Query(None, description="任务类型")) -> List[Dict]:
+    """列出最近的后台任务"""
+    return job_service.list_jobs(kind)
+
+
+@router.post("/pdf-linearize")
+async def start_pdf_linearize(force: bool = Query(False, description="重新生成已是最新的副本")) -> Dict:
+    """在后台为所有大型PDF生成线性化副本"""
+    service = PdfLinearizeService()
+    if not service.available:
+        raise HTTPException(status_code=400, detail="未安装 PyMuPDF，无法生成线性化PDF")
+
+    async def run(job: Job):
+        return await service.linearize_all(force=force, progress=job.report)
+
+    # 只写缓存目录，不需要持有索引写锁
+    job = job_service.submit("pdf_linearize", run, description="PDF线性化", exclusive=False)
+    return {"status": "accepted", "job_id": job.id, "job": job.to_dict()}
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str) -> Dict:
+    """获取任务状态、进度、吞吐量和预计剩余时间"""
+    job = job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.to_dict()
+
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str) -> Dict:
+    """取消正在运行或等待中的任务"""
+    job = job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if not job_service.cancel(job_id):
+        return {"status": "error", "message": f"任务已结束: {job.state}", "job": job.to_dict()}
+    return {"status": "success", "message": "已请求取消任务", "job_id": job_id}
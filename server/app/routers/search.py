@@ -1,13 +1,78 @@
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
 from typing import List, Dict, Optional
 from datetime import datetime
+from functools import partial
 import os
 import asyncio
-from app.services.meilisearch_service import MeiliSearchService
+import logging
+from app.services.meilisearch_service import meili_search_service
+from app.services.meili_indexer import IncrementalIndexer
+from app.services.search_health import SearchHealthMonitor
+from app.services.autocomplete_service import AutocompleteService
+from app.services.stats_service import stats_service
+from app.services.search_service import SearchService
+from app.services.job_service import Job, job_service
+from app.services.semantic_service import SemanticSearchService
+from app.services.search_metrics import search_metrics, stage, current_trace
 
 router = APIRouter()
-# 只初始化MeiliSearch服务
-meili_search_service = MeiliSearchService()
+logger = logging.getLogger(__name__)
+# MeiliSearch服务使用模块级单例，与应用其他部分共用客户端和连接池
+# 增量索引器，根据文件清单只同步变化的文件
+incremental_indexer = IncrementalIndexer(meili_search_service)
+# 后台健康监控和熔断器，请求路径不再实时检查状态
+search_health_monitor = SearchHealthMonitor(meili_search_service)
+# 进程内自动补全索引，按文档访问量加权（与文档路由共用统计服务）
+autocomplete_service = AutocompleteService(meili_search_service.docs_dir, stats_service)
+# 本地嵌入式全文索引，MeiliSearch不可用时降级使用
+search_service = SearchService()
+# 可选的语义搜索，mode=hybrid 时与关键词结果融合
+semantic_service = SemanticSearchService(meili_search_service.docs_dir, search_service.cache_dir)
+
+async def hybrid_search(search_fn, q: str, page: int, per_page: int, **params) -> Dict:
+    """混合搜索：取关键词和语义结果的前若干名，用倒数排名融合后分页
+
+    关键词搜索失败时直接抛出（由调用方计入熔断器并降级），语义搜索失败时只使用关键词结果。
+    """
+    depth = page * per_page
+    filters = {key: params.get(key) for key in ("doc_type", "category", "course", "date_from", "date_to")}
+
+    async def semantic_hits():
+        try:
+            with stage("semantic"):
+                return await semantic_service.search(q, limit=depth, **filters)
+        except asyncio.TimeoutError:
+            logger.warning("语义查询向量计算超时（%s 秒），只使用关键词结果", semantic_service.query_timeout)
+            return []
+        except Exception as e:
+            logger.warning("语义搜索失败，只使用关键词结果: %s", e)
+            return []
+
+    keyword_result, hits = await asyncio.gather(search_fn(q, page=1, per_page=depth, **params), semantic_hits())
+    return semantic_service.fuse(keyword_result, hits, page, per_page)
+
+async def keyword_or_hybrid(search_fn, q: str, page: int, per_page: int, hybrid: bool, **params) -> Dict:
+    """按相关度排序且语义索引可用时使用混合搜索，否则只使用关键词搜索"""
+    if hybrid and params.get("sort_by", "relevance") == "relevance" and semantic_service.can_query \
+            and page * per_page <= semantic_service.max_candidates:
+        return await hybrid_search(search_fn, q, page, per_page, **params)
+    return await search_fn(q, page=page, per_page=per_page, **params)
+
+async def local_search(q: str, hybrid: bool = False, **kwargs) -> Optional[Dict]:
+    """使用本地全文索引搜索，本地索引为空或搜索失败时返回 None"""
+    if search_service.fulltext.doc_count == 0:
+        return None
+    trace = current_trace()
+    if trace is not None:
+        trace.backend = "local"
+    try:
+        result = await keyword_or_hybrid(search_service.search, q, hybrid=hybrid, **kwargs)
+        result["fallback"] = "local"
+        return result
+    except Exception as e:
+        logger.error("本地全文索引搜索失败: %s", e)
+        return None
 
 @router.get("/")
 async def search_docs(
@@ -18,9 +83,39 @@ async def search_docs(
     sort_order: str = Query("desc", regex="^(asc|desc)$", description="排序顺序"),
     doc_type: Optional[str] = Query(None, description="文档类型"),
     date_from: Optional[str] = Query(None, description="开始日期 (ISO格式)"),
-    date_to: Optional[str] = Query(None, description="结束日期 (ISO格式)")
+    date_to: Optional[str] = Query(None, description="结束日期 (ISO格式)"),
+    category: Optional[str] = Query(None, description="分类（一级分类，或 \"一级分类/二级分类\"）"),
+    course: Optional[str] = Query(None, description="课程目录"),
+    mode: str = Query("keyword", regex="^(keyword|hybrid)$", description="搜索模式：关键词或混合（关键词 + 语义）")
+) -> JSONResponse:
+    """搜索文档，支持分页、高级搜索和分面过滤，结果中附带分面分布
+
+    各阶段耗时计入延迟直方图，超过阈值的查询写入慢查询日志。
+    """
+    params = dict(
+        page=page, per_page=per_page, sort_by=sort_by, sort_order=sort_order, doc_type=doc_type,
+        date_from=date_from, date_to=date_to, category=category, course=course, mode=mode
+    )
+    with search_metrics.trace("search", q, **params):
+        result = await execute_search(q, **params)
+        # 在这里序列化响应，以便计入序列化耗时
+        with stage("serialization"):
+            return JSONResponse(result)
+
+async def execute_search(
+    q: str,
+    page: int,
+    per_page: int,
+    sort_by: str,
+    sort_order: str,
+    doc_type: Optional[str],
+    date_from: Optional[str],
+    date_to: Optional[str],
+    category: Optional[str],
+    course: Optional[str],
+    mode: str
 ) -> Dict:
-    """搜索文档，支持分页和高级搜索"""
+    """执行搜索：优先使用MeiliSearch，不可用或失败时降级到本地全文索引"""
     try:
         # 验证日期格式
         if date_from:
@@ -52,12 +147,39 @@ async def search_docs(
         
         # 直接使用MeiliSearch，不再回退到本地索引
         try:
-            # 检查MeiliSearch状态
-            status = await meili_search_service.check_status()
-            print(f"[DEBUG] MeiliSearch状态: {status}")
-            
-            if status.get("status") == "available":
-                return await meili_search_service.search(
+            # 使用后台监控缓存的状态，不产生额外的网络请求
+            with stage("status_check"):
+                token = search_health_monitor.allow_request()
+            if token is not None:
+                try:
+                    # 半开探测不能由查询缓存应答，否则 MeiliSearch 未恢复也会关闭熔断器
+                    result = await keyword_or_hybrid(
+                        partial(meili_search_service.search, use_cache=not search_health_monitor.is_probe(token)),
+                        q,
+                        page=page,
+                        per_page=per_page,
+                        sort_by=sort_by,
+                        sort_order=sort_order,
+                        doc_type=doc_type,
+                        date_from=date_from,
+                        date_to=date_to,
+                        category=category,
+                        course=course,
+                        hybrid=mode == "hybrid"
+                    )
+                    search_health_monitor.record_success(token)
+                    return result
+                except Exception as e:
+                    search_health_monitor.record_failure(e, token)
+                    raise
+                finally:
+                    # 请求被取消（客户端断开）时不会记录成功或失败，释放半开探测
+                    search_health_monitor.release_probe(token)
+            else:
+                # MeiliSearch不可用时使用本地全文索引
+                status = search_health_monitor.snapshot()
+                logger.warning("MeiliSearch服务不可用，使用本地全文索引: %s", status)
+                result = await local_search(
                     q,
                     page=page,
                     per_page=per_page,
@@ -65,11 +187,13 @@ async def search_docs(
                     sort_order=sort_order,
                     doc_type=doc_type,
                     date_from=date_from,
-                    date_to=date_to
+                    date_to=date_to,
+                    category=category,
+                    course=course,
+                    hybrid=mode == "hybrid"
                 )
-            else:
-                # MeiliSearch不可用时返回友好的错误信息
-                print(f"[WARNING] MeiliSearch服务不可用: {status}")
+                if result is not None:
+                    return result
                 return {
                     "status": "error",
                     "message": "搜索服务当前不可用。请联系管理员启动MeiliSearch服务。",
@@ -81,9 +205,24 @@ async def search_docs(
                     "total_pages": 0
                 }
         except Exception as e:
-            print(f"[ERROR] 使用MeiliSearch搜索失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("使用MeiliSearch搜索失败: %s", e)
+            
+            # 降级到本地全文索引
+            result = await local_search(
+                q,
+                page=page,
+                per_page=per_page,
+                sort_by=sort_by,
+                sort_order=sort_order,
+                doc_type=doc_type,
+                date_from=date_from,
+                date_to=date_to,
+                category=category,
+                course=course,
+                hybrid=mode == "hybrid"
+            )
+            if result is not None:
+                return result
             
             # 提供更具体的错误信息
             error_message = str(e)
@@ -102,9 +241,7 @@ async def search_docs(
                 "total_pages": 0
             }
     except Exception as e:
-        print(f"[ERROR] 搜索请求处理失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("搜索请求处理失败: %s", e)
         return {
             "status": "error",
             "message": f"服务器错误: {str(e)}",
@@ -123,53 +260,121 @@ async def get_suggestions(
 ) -> List[str]:
     """获取搜索建议，支持文档类型过滤"""
     try:
-        # 直接使用MeiliSearch获取建议
+        # 优先使用进程内的自动补全索引，不经过网络
+        if autocomplete_service.is_ready:
+            return autocomplete_service.suggest(q, limit, doc_type)
+        
+        # 自动补全索引尚未构建完成时使用MeiliSearch获取建议
         try:
-            # 检查MeiliSearch状态
-            status = await meili_search_service.check_status()
-            if status.get("status") == "available":
-                return await meili_search_service.get_suggestions(q, limit, doc_type)
+            # 使用后台监控缓存的状态，不产生额外的网络请求
+            token = search_health_monitor.allow_request()
+            if token is not None:
+                try:
+                    suggestions = await meili_search_service.get_suggestions(
+                        q, limit, doc_type, use_cache=not search_health_monitor.is_probe(token)
+                    )
+                    search_health_monitor.record_success(token)
+                    return suggestions
+                except Exception as e:
+                    search_health_monitor.record_failure(e, token)
+                    raise
+                finally:
+                    search_health_monitor.release_probe(token)
             else:
                 # MeiliSearch不可用时返回空列表
-                print(f"[WARNING] MeiliSearch服务不可用: {status}")
+                logger.warning("MeiliSearch服务不可用: %s", search_health_monitor.snapshot())
                 return []
         except Exception as e:
-            print(f"[ERROR] 使用MeiliSearch获取建议失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("使用MeiliSearch获取建议失败: %s", e)
             return []
     except Exception as e:
-        print(f"[ERROR] 获取建议请求处理失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("获取建议请求处理失败: %s", e)
         return []
 
+async def run_rebuild(job: Job, include_local: bool = True) -> Dict:
+    """重建任务：重建 MeiliSearch 索引（影子索引 + 原子交换）和本地全文索引
+
+    作为 rebuild_index 任务在写锁内执行，其中的增量同步直接调用 sync()（写锁不可重入）。
+    include_local 为 False 时只构建 MeiliSearch 索引（启动时本地索引另有构建任务）。
+    """
+    def build_counts():
+        progress = meili_search_service.get_build_progress() or {}
+        return progress.get("files_processed", 0), progress.get("files_discovered", 0)
+    job.progress_source = build_counts
+
+    meili_result = await meili_search_service.build_index()
+    job.errors = meili_result.get("errors", 0)
+    if not meili_result.get("error_message"):
+        # 构建期间发生的文件变化写入的是旧索引，切换后再增量同步一次
+        await incremental_indexer.sync()
+    result = {"meilisearch": meili_result}
+    if include_local:
+        result["local"] = {"documents": await search_service.build_fulltext_index()}
+    if meili_result.get("error_message"):
+        raise RuntimeError(f"构建MeiliSearch索引失败: {meili_result['error_message']}")
+    return result
+
 @router.post("/rebuild-index")
 async def rebuild_index():
-    """重新构建搜索索引"""
+    """在后台重新构建搜索索引，立即返回任务ID
+
+    重建正在进行时再次调用会返回同一个任务，通过 /api/jobs/{job_id} 查看进度或取消。
+    """
+    job = job_service.submit("rebuild_index", run_rebuild, description="重建搜索索引")
+    return {
+        "status": "accepted",
+        "message": "Index rebuild is running in the background",
+        "job_id": job.id,
+        "job": job.to_dict()
+    }
+
+@router.get("/rebuild-index/status")
+async def rebuild_index_status():
+    """获取最近一次全量重建的进度（影子索引、阶段、已处理文件数等）"""
+    progress = meili_search_service.get_build_progress()
+    if progress is None:
+        return {"status": "idle", "progress": None}
+    return {"status": progress["state"], "progress": progress}
+
+def submit_semantic_rebuild() -> Job:
+    """提交语义索引重建任务（只重新计算内容变化的章节）"""
+    async def run(job: Job):
+        return await semantic_service.build(progress=job.report)
+    # 只写语义索引目录，不需要持有索引写锁
+    return job_service.submit("semantic_index", run, description="构建语义索引", exclusive=False)
+
+@router.post("/semantic/rebuild")
+async def rebuild_semantic_index():
+    """在后台构建语义索引，立即返回任务ID"""
+    if not semantic_service.enabled or not semantic_service.available:
+        raise HTTPException(
+            status_code=400,
+            detail="语义搜索未启用（SEMANTIC_SEARCH_ENABLED）或未安装 numpy / sentence-transformers"
+        )
+    job = submit_semantic_rebuild()
+    return {"status": "accepted", "job_id": job.id, "job": job.to_dict()}
+
+@router.post("/sync-index")
+async def sync_index():
+    """增量同步搜索索引，只上传新增、修改和删除的文件
+
+    持有索引写锁，全量重建进行中时等待重建完成，避免同时修改文件清单。
+    """
     try:
-        # 只构建MeiliSearch索引
-        try:
-            meili_result = await meili_search_service.build_index()
-            return {
-                "status": "success", 
-                "message": "MeiliSearch index rebuilt successfully",
-                "details": {"meilisearch": meili_result}
-            }
-        except Exception as e:
-            print(f"[ERROR] 构建MeiliSearch索引失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return {
-                "status": "error",
-                "message": f"构建MeiliSearch索引失败: {str(e)}",
-                "details": {"error": str(e)}
-            }
+        async with job_service.writer_lock:
+            result = await incremental_indexer.sync()
+        return {
+            "status": "success",
+            "message": "MeiliSearch index synced successfully",
+            "details": {"meilisearch": result}
+        }
     except Exception as e:
-        print(f"[ERROR] rebuild_index端点处理失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return {"status": "error", "message": f"服务器错误: {str(e)}"}
+        logger.exception("增量同步MeiliSearch索引失败: %s", e)
+        return {
+            "status": "error",
+            "message": f"增量同步MeiliSearch索引失败: {str(e)}",
+            "details": {"error": str(e)}
+        }
 
 @router.get("/status")
 async def get_search_status():
@@ -178,11 +383,17 @@ async def get_search_status():
         # 只返回MeiliSearch状态
         try:
             meili_status = await meili_search_service.check_status()
-            return {"meilisearch": meili_status}
+            meili_status["build_progress"] = meili_search_service.get_build_progress()
+            meili_status["monitor"] = search_health_monitor.snapshot()
+            meili_status["query_cache"] = await meili_search_service.get_query_cache_stats()
+            meili_status["autocomplete"] = autocomplete_service.get_stats()
+            return {
+                "meilisearch": meili_status,
+                "local": {"documents": search_service.fulltext.doc_count},
+                "semantic": semantic_service.get_stats()
+            }
         except Exception as e:
-            print(f"[ERROR] 获取MeiliSearch状态失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("获取MeiliSearch状态失败: %s", e)
             return {
                 "meilisearch": {
                     "status": "error",
@@ -190,7 +401,5 @@ async def get_search_status():
                 }
             }
     except Exception as e:
-        print(f"[ERROR] 获取搜索状态失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("获取搜索状态失败: %s", e)
         return {"status": "error", "message": f"服务器错误: {str(e)}"} 
\ No newline at end of file
@@ -0,0 +1,273 @@
+import os
+import re
+import math
+import time
+import heapq
+import logging
+import asyncio
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Any, Set, Tuple
+from app.services.markdown_sections import split_markdown_sections
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:  # 未安装 pypinyin 时不提供拼音补全
+    lazy_pinyin = None
+    Style = None
+
+logger = logging.getLogger(__name__)
+
+CJK_PATTERN = re.compile(r'[\u4e00-\u9fff]')
+# 标题中的分词边界，边界之后的部分也可以作为前缀被匹配，例如 "深入理解 JVM" 可以通过 "jvm" 补全
+WORD_BOUNDARY_PATTERN = re.compile(r'[\s_\-/()（）【】\[\]:：,，、.]+')
+
+
+def normalize_key(text: str) -> str:
+    """规范化补全键：小写并合并空白"""
+    return ' '.join(text.lower().split())
+
+
+class AutocompleteService:
+    """进程内自动补全索引
+
+    从文档目录加载文件标题和 Markdown 章节标题，连同中文标题的全拼和首字母一起
+    放入有序数组，查询时二分查找前缀区间，按 StatsService 的访问量加权排序。
+    匹配键超过 max_scan 个的短前缀（单个字母、拼音首字母等）在构建时预先算好各文档类型的前 top_k 个结果，
+    其余前缀的区间不超过 max_scan，查询时完整扫描，热门标题不会因为字母序靠后而被截掉。
+    索引在线程池中构建，构建期间继续使用旧索引提供服务。
+    """
+
+    TITLE_WEIGHT = 2.0
+    HEADING_WEIGHT = 1.0
+
+    def __init__(
+        self,
+        docs_dir: str,
+        stats_service=None,
+        max_heading_level: int = 3,
+        refresh_interval: float = 600.0,
+        max_scan: int = 2000,
+        top_k: int = 20
+    ):
+        self.docs_dir = docs_dir
+        self.stats_service = stats_service
+        self.max_heading_level = max_heading_level  # 只收录这一级别及以上的章节标题
+        self.refresh_interval = refresh_interval    # 定期重建以更新访问量权重
+        self.max_scan = max_scan                    # 单次查询最多扫描的前缀匹配数
+        self.top_k = top_k                          # 热门前缀预先计算的结果数（不小于查询的 limit 上限）
+
+        # (有序的补全键, 对应的文本编号, 文本表, 热门前缀的结果)，前两个数组一一对应，
+        # 文本表按编号存放 (显示文本, 权重, 所属文档类型)，热门前缀的结果为 {前缀: {文档类型或 None: [文本编号]}}。
+        # 四者作为一个元组整体替换
+        self._index: Tuple[
+            List[str], List[int], List[Tuple[str, float, frozenset]], Dict[str, Dict[Optional[str], List[int]]]
+        ] = ([], [], [], {})
+
+        self.built_at: Optional[float] = None
+        self.build_time: Optional[float] = None
+        self._dirty = False
+        self._dirty_lock = threading.Lock()
+        self._build_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.built_at is not None
+
+    def _text_keys(self, text: str) -> Set[str]:
+        """生成一个文本的全部补全键：原文、分词边界后的后缀、拼音全拼和首字母"""
+        keys = set()
+        normalized = normalize_key(text)
+        if not normalized:
+            return keys
+        keys.add(normalized)
+        for match in WORD_BOUNDARY_PATTERN.finditer(normalized):
+            suffix = normalized[match.end():]
+            if suffix:
+                keys.add(suffix)
+
+        if lazy_pinyin is not None and CJK_PATTERN.search(text):
+            full = ''.join(lazy_pinyin(text)).lower()
+            initials = ''.join(lazy_pinyin(text, style=Style.FIRST_LETTER)).lower()
+            keys.add(''.join(full.split()))
+            keys.add(''.join(initials.split()))
+        return keys
+
+    def _collect_texts(self) -> Dict[str, Dict[str, Any]]:
+        """遍历文档目录，收集标题和章节标题: {文本: {weight, types}}"""
+        visits: Dict[str, int] = {}
+        if self.stats_service is not None:
+            try:
+                visits = self.stats_service.get_doc_visit_counts()
+            except Exception as e:
+                logger.warning("读取文档访问量失败，补全结果不按热度排序: %s", e)
+
+        texts: Dict[str, Dict[str, Any]] = {}
+
+        def add(text: str, weight: float, doc_type: str):
+            text = text.strip()
+            if not text:
+                return
+            item = texts.setdefault(text, {'weight': 0.0, 'types': set()})
+            item['weight'] = max(item['weight'], weight)
+            item['types'].add(doc_type)
+
+        for root, dirs, files in os.walk(self.docs_dir, followlinks=True):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for file_name in files:
+                if file_name.startswith('.'):
+                    continue
+                title, ext = os.path.splitext(file_name)
+                doc_type = ext[1:].lower()
+                if doc_type not in ('md', 'pdf'):
+                    continue
+
+                file_path = os.path.join(root, file_name)
+                rel_path = os.path.relpath(file_path, self.docs_dir).replace('\\', '/')
+                popularity = 1.0 + math.log1p(visits.get(rel_path, 0))
+                add(title, self.TITLE_WEIGHT * popularity, doc_type)
+
+                if doc_type != 'md':
+                    continue
+                try:
+                    try:
+                        with open(file_path, 'r', encoding='utf-8') as f:
+                            content = f.read()
+                    except UnicodeDecodeError:
+                        with open(file_path, 'r', encoding='gbk') as f:
+                            content = f.read()
+                except Exception as e:
+                    logger.warning("读取文件 %s 失败: %s", rel_path, e)
+                    continue
+                for section in split_markdown_sections(content):
+                    if 0 < section['level'] <= self.max_heading_level:
+                        add(section['heading'], self.HEADING_WEIGHT * popularity, doc_type)
+        return texts
+
+    def _build_sync(self):
+        """构建有序数组（在线程池中执行）"""
+        start_time = time.time()
+        texts = self._collect_texts()
+
+        entries: List[Tuple[str, int]] = []
+        text_table: List[Tuple[str, float, frozenset]] = []
+        for text_id, (text, item) in enumerate(texts.items()):
+            text_table.append((text, item['weight'], frozenset(item['types'])))
+            for key in self._text_keys(text):
+                entries.append((key, text_id))
+        entries.sort()
+        keys = [key for key, _ in entries]
+        text_ids = [text_id for _, text_id in entries]
+        popular = self._popular_prefixes(keys, text_ids, text_table)
+
+        # 整体替换引用，查询不会看到构建到一半的数组
+        self._index = (keys, text_ids, text_table, popular)
+        self.built_at = time.time()
+        self.build_time = self.built_at - start_time
+        logger.info(
+            "自动补全索引构建完成: %d 个文本, %d 个键, %d 个热门前缀, 耗时 %.2f秒",
+            len(text_table), len(entries), len(popular), self.build_time
+        )
+
+    @staticmethod
+    def _rank(texts: List[Tuple[str, float, frozenset]]):
+        # 权重高的优先，权重相同时较短的文本优先
+        return lambda t: (-texts[t][1], len(texts[t][0]), texts[t][0])
+
+    def _popular_prefixes(
+        self, keys: List[str], text_ids: List[int], texts: List[Tuple[str, float, frozenset]]
+    ) -> Dict[str, Dict[Optional[str], List[int]]]:
+        """找出匹配键超过 max_scan 个的前缀，计算每个前缀各文档类型权重最高的 top_k 个文本
+
+        这样的前缀的父前缀必然也超过 max_scan，因此从空前缀逐层向下细分即可找全；
+        每一层细分的区间互不重叠，总开销为 键数 x 热门前缀的最大长度。
+        """
+        rank = self._rank(texts)
+        popular: Dict[str, Dict[Optional[str], List[int]]] = {}
+        stack = [('', 0, len(keys))]
+        while stack:
+            prefix, start, end = stack.pop()
+            depth = len(prefix) + 1
+            i = start
+            while i < end:
+                if len(keys[i]) < depth:
+                    # 与父前缀相同的键不属于任何子前缀
+                    i += 1
+                    continue
+                child = keys[i][:depth]
+                j = i + 1
+                while j < end and keys[j].startswith(child):
+                    j += 1
+                if j - i > self.max_scan:
+                    matched = set(text_ids[i:j])
+                    doc_types = set().union(*(texts[t][2] for t in matched))
+                    popular[child] = {None: heapq.nsmallest(self.top_k, matched, key=rank)}
+                    for doc_type in doc_types:
+                        popular[child][doc_type] = heapq.nsmallest(
+                            self.top_k, (t for t in matched if doc_type in texts[t][2]), key=rank
+                        )
+                    stack.append((child, i, j))
+                i = j
+        return popular
+
+    async def refresh(self):
+        """重建自动补全索引"""
+        with self._dirty_lock:
+            self._dirty = False
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, self._build_sync)
+        except Exception as e:
+            logger.error("构建自动补全索引失败: %s", e)
+
+    def mark_dirty(self, file_path: str = None):
+        """文档发生变化时调用（可在文件监视器线程中调用），下次查询时在后台重建"""
+        with self._dirty_lock:
+            self._dirty = True
+
+    def _maybe_refresh(self):
+        """索引过期或有文件变化时在后台重建，不阻塞当前查询"""
+        if self._build_task is not None and not self._build_task.done():
+            return
+        expired = self.built_at is not None and time.time() - self.built_at > self.refresh_interval
+        if self._dirty or expired:
+            self._build_task = asyncio.create_task(self.refresh())
+
+    def suggest(self, q: str, limit: int = 5, doc_type: Optional[str] = None) -> List[str]:
+        """返回以 q 为前缀的补全建议，按权重从高到低排序"""
+        self._maybe_refresh()
+        prefix = normalize_key(q)
+        if not prefix:
+            return []
+        if doc_type == 'all':
+            doc_type = None
+
+        keys, text_ids, texts, popular = self._index
+        if prefix in popular and limit <= self.top_k:
+            return [texts[t][0] for t in popular[prefix].get(doc_type, [])[:limit]]
+
+        # 其余前缀匹配的键不超过 max_scan 个
+        matched: Set[int] = set()
+        i = bisect_left(keys, prefix)
+        end = min(len(keys), i + self.max_scan)
+        while i < end and keys[i].startswith(prefix):
+            text_id = text_ids[i]
+            if doc_type is None or doc_type in texts[text_id][2]:
+                matched.add(text_id)
+            i += 1
+
+        best = heapq.nsmallest(limit, matched, key=self._rank(texts))
+        return [texts[t][0] for t in best]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引统计信息"""
+        keys, _, texts, popular = self._index
+        return {
+            "ready": self.is_ready,
+            "texts": len(texts),
+            "keys": len(keys),
+            "popular_prefixes": len(popular),
+            "pinyin": lazy_pinyin is not None,
+            "built_at": self.built_at,
+            "build_time": self.build_time
+        }
@@ -18,11 +18,8 @@ from pathlib import Path
 import signal
 from collections import OrderedDict
 
-# 设置日志级别为 DEBUG
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# 日志级别和输出由 app.logging_config 统一配置
+logger = logging.getLogger(__name__)
 
 class DocChangeHandler(FileSystemEventHandler):
     def __init__(self, doc_service):
@@ -32,6 +29,9 @@ class DocChangeHandler(FileSystemEventHandler):
         self.modified_files: Set[str] = set()
 
     def on_any_event(self, event):
+        # 变更监听器需要完整的事件流，不受防抖窗口影响
+        self.doc_service.notify_change_listeners(event)
+        
         current_time = time.time()
         if current_time - self.last_event_time > self.debounce_time:
             self.last_event_time = current_time
@@ -185,26 +185,26 @@ class DocService:
         # 获取项目根目录
         project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
         self.docs_dir = os.path.join(project_root, 'server', 'static', 'docs')
-        logging.debug(f"初始化 DocService, 文档目录路径: {self.docs_dir}")
+        logger.debug("初始化 DocService, 文档目录路径: %s", self.docs_dir)
         
         # 检查是否是符号链接
         if os.path.islink(self.docs_dir):
             target = os.readlink(self.docs_dir)
-            logging.debug(f"软链接指向: {target}")
+            logger.debug("软链接指向: %s", target)
         else:
-            logging.warning(f"docs_dir 不是软链接: {self.docs_dir}")
+            logger.warning("docs_dir 不是软链接: %s", self.docs_dir)
             
         # 确保目录存在并可访问
         try:
             if os.path.exists(self.docs_dir):
-                logging.debug(f"目录存在: {self.docs_dir}")
+                logger.debug("目录存在: %s", self.docs_dir)
             else:
-                logging.error(f"目录不存在: {self.docs_dir}")
+                logger.error("目录不存在: %s", self.docs_dir)
                 # 创建目录
                 os.makedirs(self.docs_dir, exist_ok=True)
-                logging.info(f"已创建目录: {self.docs_dir}")
+                logger.info("已创建目录: %s", self.docs_dir)
         except Exception as e:
-            logging.error(f"访问目录失败: {str(e)}")
+            logger.error("访问目录失败: %s", e)
         
         mimetypes.init()
 
@@ -253,6 +253,9 @@ class DocService:
             "breadcrumb": {"hits": 0, "misses": 0}
         }
         
+        # 文件变更监听器（例如增量搜索索引），在文件监视器线程中调用
+        self._change_listeners = []
+        
         # 热门文档集合（用于缓存预热）
         self._hot_documents = set()
         self._hot_document_access_count = {}
@@ -272,9 +275,9 @@ class DocService:
                 DocService._observer.stop()
                 DocService._observer.join(timeout=3)  # 等待最多3秒
                 DocService._observer = None
-                logging.debug("文件监视器已停止")
+                logger.debug("文件监视器已停止")
         except Exception as e:
-            logging.error(f"停止文件监视器时出错: {str(e)}")
+            logger.error("停止文件监视器时出错: %s", e)
             DocService._observer = None
 
     def _setup_file_watcher(self):
@@ -293,9 +296,9 @@ class DocService:
             DocService._observer.schedule(self.event_handler, self.docs_dir, recursive=True)
             DocService._observer.start()
             DocService._last_watcher_check = time.time()
-            logging.debug(f"文件监视器已启动，监视目录: {self.docs_dir}")
+            logger.debug("文件监视器已启动，监视目录: %s", self.docs_dir)
         except Exception as e:
-            logging.error(f"设置文件监视器失败: {str(e)}")
+            logger.error("设置文件监视器失败: %s", e)
             DocService._observer = None
             
     async def check_file_watcher(self):
@@ -311,20 +314,42 @@ class DocService:
         try:
             # 检查文件监视器是否存在且活跃
             if DocService._observer is None or not DocService._observer.is_alive():
-                logging.warning("文件监视器不活跃，尝试重启")
+                logger.warning("文件监视器不活跃，尝试重启")
                 self._setup_file_watcher()
                 return True  # 表示已重启
             return False  # 表示无需重启
         except Exception as e:
-            logging.error(f"检查文件监视器状态时出错: {str(e)}")
+            logger.error("检查文件监视器状态时出错: %s", e)
             try:
                 # 尝试重新设置
                 self._setup_file_watcher()
                 return True
             except Exception as e2:
-                logging.error(f"重启文件监视器失败: {str(e2)}")
+                logger.error("重启文件监视器失败: %s", e2)
                 return False
 
+    def add_change_listener(self, callback):
+        """注册文件变更监听器，回调参数为发生变化的绝对路径"""
+        if callback not in self._change_listeners:
+            self._change_listeners.append(callback)
+
+    def notify_change_listeners(self, event):
+        """把文件系统事件转发给所有监听器"""
+        # 目录的修改事件只表示其中有文件变化，文件本身的创建/删除/移动事件会单独送达；
+        # 转发它会让监听器把整个目录（文档根目录时是全部文档）当作变化重新处理
+        if event.is_directory and event.event_type == 'modified':
+            return
+        paths = [event.src_path]
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path:
+            paths.append(dest_path)
+        for callback in self._change_listeners:
+            for path in paths:
+                try:
+                    callback(path)
+                except Exception as e:
+                    logger.error("文件变更监听器执行失败: %s", e)
+
     @asynccontextmanager
     async def _cache_lock(self, cache_key: str):
         """获取特定缓存项的锁"""
@@ -373,11 +398,11 @@ class DocService:
                 del self._cache_locks[k]
                 
             if unused_locks:
-                logging.debug(f"已清理 {len(unused_locks)} 个未使用的锁")
+                logger.debug("已清理 %s 个未使用的锁", len(unused_locks))
                 
             return len(unused_locks)
         except Exception as e:
-            logging.error(f"清理未使用锁时出错: {str(e)}")
+            logger.error("清理未使用锁时出错: %s", e)
             return 0
 
     async def _cleanup_expired_cache(self):
@@ -393,16 +418,15 @@ class DocService:
                 await self._cleanup_unused_locks()
                 
                 if content_expired or pdf_expired or breadcrumb_expired:
-                    logging.debug(
-                        f"缓存清理完成: 删除了 {content_expired} 个内容缓存项, "
-                        f"{pdf_expired} 个PDF元数据缓存项, "
-                        f"{breadcrumb_expired} 个面包屑缓存项"
+                    logger.debug(
+                        "缓存清理完成: 删除了 %s 个内容缓存项, %s 个PDF元数据缓存项, %s 个面包屑缓存项",
+                        content_expired, pdf_expired, breadcrumb_expired
                     )
                 
                 # 返回清理的项目总数
                 return content_expired + pdf_expired + breadcrumb_expired
         except Exception as e:
-            logging.error(f"清理缓存时出错: {str(e)}")
+            logger.error("清理缓存时出错: %s", e)
             return 0
 
     async def perform_maintenance(self):
@@ -420,10 +444,10 @@ class DocService:
             # 缓存预热 - 确保热门文档在缓存中
             await self._warm_cache()
             
-            logging.debug(f"维护任务完成：清理了 {cleaned_items} 个缓存项")
+            logger.debug("维护任务完成：清理了 %s 个缓存项", cleaned_items)
             return True
         except Exception as e:
-            logging.error(f"执行维护任务时出错: {str(e)}")
+            logger.error("执行维护任务时出错: %s", e)
             return False
             
     async def _warm_cache(self):
@@ -441,16 +465,16 @@ class DocService:
                         await self.get_doc_content(doc_path)
                         warmed_count += 1
                     except Exception as e:
-                        logging.error(f"预热缓存时无法加载文档 {doc_path}: {str(e)}")
+                        logger.error("预热缓存时无法加载文档 %s: %s", doc_path, e)
                         # 如果文档无法加载，从热门文档集合中移除
                         self._hot_documents.discard(doc_path)
                         if doc_path in self._hot_document_access_count:
                             del self._hot_document_access_count[doc_path]
             
             if warmed_count > 0:
-                logging.debug(f"缓存预热完成，预加载了 {warmed_count} 个热门文档")
+                logger.debug("缓存预热完成，预加载了 %s 个热门文档", warmed_count)
         except Exception as e:
-            logging.error(f"缓存预热过程中出错: {str(e)}")
+            logger.error("缓存预热过程中出错: %s", e)
             
     async def reset_cache_stats(self):
         """重置缓存统计信息"""
@@ -461,10 +485,10 @@ class DocService:
             self._hot_documents.clear()
             self._hot_document_access_count.clear()
             self._cache_version += 1
-            logging.info("已重置所有缓存")
+            logger.info("已重置所有缓存")
             return True
         except Exception as e:
-            logging.error(f"重置缓存统计信息时出错: {str(e)}")
+            logger.error("重置缓存统计信息时出错: %s", e)
             return False
 
     def _extract_number(self, name: str) -> tuple:
@@ -520,7 +544,7 @@ class DocService:
             mime_type, _ = mimetypes.guess_type(file_path)
             return file_path, mime_type or 'application/octet-stream'
         except Exception as e:
-            logging.error(f"获取文件MIME类型出错: {str(e)}")
+            logger.error("获取文件MIME类型出错: %s", e)
             return file_path, 'application/octet-stream'
 
     @lru_cache(maxsize=100)
@@ -531,7 +555,7 @@ class DocService:
                 pdf = PdfReader(file)
                 return len(pdf.pages)
         except Exception as e:
-            logging.error(f"Error reading PDF page count: {str(e)}")
+            logger.error("Error reading PDF page count: %s", e)
             return 0
             
     async def _get_pdf_page_count_with_timeout(self, file_path: str, timeout: float = 10.0) -> int:
@@ -543,10 +567,10 @@ class DocService:
                 timeout=timeout
             )
         except asyncio.TimeoutError:
-            logging.error(f"获取PDF页数超时: {file_path}")
+            logger.error("获取PDF页数超时: %s", file_path)
             return 0
         except Exception as e:
-            logging.error(f"获取PDF页数出错: {str(e)}")
+            logger.error("获取PDF页数出错: %s", e)
             return 0
 
     async def _cache_pdf_metadata(self, path: str, file_path: str):
@@ -563,7 +587,7 @@ class DocService:
                 'page_count': 0
             }
         except Exception as e:
-            logging.error(f"获取PDF元数据出错: {str(e)}")
+            logger.error("获取PDF元数据出错: %s", e)
             return {
                 'file_size': 0,
                 'last_modified': datetime.now().isoformat(),
@@ -590,9 +614,9 @@ class DocService:
             # 启动定期统计报告
             asyncio.create_task(self._schedule_stats_report())
             
-            logging.info("DocService 初始化完成，服务就绪")
+            logger.info("DocService 初始化完成，服务就绪")
         except Exception as e:
-            logging.error(f"初始化服务失败: {str(e)}")
+            logger.error("初始化服务失败: %s", e)
             # 尽管有错误，仍然标记服务为就绪以允许基本功能
             self._service_ready = True
             self._ready_event.set()
@@ -607,14 +631,14 @@ class DocService:
                 stats = await self.get_cache_stats()
                 
                 # 记录统计信息
-                logging.info(f"缓存统计报告:")
-                logging.info(f"- 内容缓存: 大小={stats['content_cache']['size']}/{stats['content_cache']['capacity']}, 命中率={stats['content_cache']['hit_ratio']:.2f}")
-                logging.info(f"- PDF元数据缓存: 大小={stats['pdf_metadata_cache']['size']}/{stats['pdf_metadata_cache']['capacity']}, 命中率={stats['pdf_metadata_cache']['hit_ratio']:.2f}")
-                logging.info(f"- 面包屑缓存: 大小={stats['breadcrumb_cache']['size']}/{stats['breadcrumb_cache']['capacity']}, 命中率={stats['breadcrumb_cache']['hit_ratio']:.2f}")
-                logging.info(f"- 热门文档数量: {stats['hot_documents']}")
+                logger.info("缓存统计报告:")
+                logger.info("- 内容缓存: 大小=%s/%s, 命中率=%.2f", stats['content_cache']['size'], stats['content_cache']['capacity'], stats['content_cache']['hit_ratio'])
+                logger.info("- PDF元数据缓存: 大小=%s/%s, 命中率=%.2f", stats['pdf_metadata_cache']['size'], stats['pdf_metadata_cache']['capacity'], stats['pdf_metadata_cache']['hit_ratio'])
+                logger.info("- 面包屑缓存: 大小=%s/%s, 命中率=%.2f", stats['breadcrumb_cache']['size'], stats['breadcrumb_cache']['capacity'], stats['breadcrumb_cache']['hit_ratio'])
+                logger.info("- 热门文档数量: %s", stats['hot_documents'])
                 
             except Exception as e:
-                logging.error(f"生成缓存统计报告时出错: {str(e)}")
+                logger.error("生成缓存统计报告时出错: %s", e)
                 await asyncio.sleep(300)  # 出错后等待5分钟再重试
 
     async def wait_until_ready(self, timeout=None):
@@ -623,18 +647,18 @@ class DocService:
             await asyncio.wait_for(self._ready_event.wait(), timeout=timeout)
             return self._service_ready
         except asyncio.TimeoutError:
-            logging.warning(f"等待服务就绪超时（{timeout}秒）")
+            logger.warning("等待服务就绪超时（%s秒）", timeout)
             return False
 
     async def get_doc_tree(self) -> Dict:
         """获取文档目录树，优化版本，默认只加载顶层目录"""
         # 如果服务尚未就绪，返回一个简单的树结构
         if not self._service_ready:
-            logging.warning("服务尚未就绪，返回空文档树")
+            logger.warning("服务尚未就绪，返回空文档树")
             return {"name": "root", "children": [], "status": "loading"}
             
         # 不再使用缓存，始终重新构建树结构
-        logging.info("构建文档树 (使用分层加载模式)...")
+        logger.info("构建文档树 (使用分层加载模式)...")
         start_time = time.time()
         
         # 构建树结构，只加载顶层
@@ -650,17 +674,17 @@ class DocService:
             # self._doc_tree_cache = tree
             
             end_time = time.time()
-            logging.info(f"文档树构建完成，耗时: {end_time - start_time:.2f}秒，顶层节点数: {len(tree.get('children', []))}")
+            logger.info("文档树构建完成，耗时: %.2f秒，顶层节点数: %s", end_time - start_time, len(tree.get('children', [])))
             
             return tree
         except Exception as e:
-            logging.error(f"构建文档树出错: {str(e)}")
+            logger.error("构建文档树出错: %s", e)
             return {"name": "root", "children": [], "error": str(e)}
 
     def _build_root_tree_sync(self, dir_path, parent_node):
         """特殊的根目录树构建方法，确保包含顶层目录和文件，但子目录仍然懒加载"""
         try:
-            logging.debug(f"构建根目录树 - 路径: {dir_path}")
+            logger.debug("构建根目录树 - 路径: %s", dir_path)
             
             # 一次性获取所有文件和目录
             all_items = os.listdir(dir_path)
@@ -704,7 +728,7 @@ class DocService:
                 
                 # 排序并添加文件节点
                 parent_node["children"].extend(self._sort_items(file_nodes))
-                logging.debug(f"添加了 {len(file_nodes)} 个文件节点到根目录")
+                logger.debug("添加了 %s 个文件节点到根目录", len(file_nodes))
                 # 释放内存
                 del file_nodes
             
@@ -738,15 +762,15 @@ class DocService:
             if parent_node["children"]:
                 parent_node["children"] = self._sort_items(parent_node["children"])
                 
-            logging.debug(f"完成构建根目录树 - 添加了 {dir_count} 个目录节点和 {len(files)} 个文件节点")
+            logger.debug("完成构建根目录树 - 添加了 %s 个目录节点和 %s 个文件节点", dir_count, len(files))
             
         except Exception as e:
-            logging.error(f"处理根目录 {dir_path} 时出错: {str(e)}")
+            logger.error("处理根目录 %s 时出错: %s", dir_path, e)
 
     async def get_doc_subtree(self, path: str) -> Dict:
         """获取指定路径的子树，用于按需加载"""
         try:
-            logging.info(f"开始加载子树: {path}...")
+            logger.info("开始加载子树: %s...", path)
             start_time = time.time()
             
             # 获取绝对路径
@@ -754,7 +778,7 @@ class DocService:
             
             # 检查路径是否存在且是目录
             if not os.path.exists(dir_path) or not os.path.isdir(dir_path):
-                logging.error(f"路径不存在或不是目录: {dir_path}")
+                logger.error("路径不存在或不是目录: %s", dir_path)
                 return {"error": "路径不存在或不是目录"}
             
             # 构建子树
@@ -765,17 +789,17 @@ class DocService:
             await loop.run_in_executor(None, self._build_tree_sync, dir_path, subtree)
             
             end_time = time.time()
-            logging.info(f"子树加载完成: {path}, 耗时: {end_time - start_time:.2f}秒, 子节点数: {len(subtree.get('children', []))}")
+            logger.info("子树加载完成: %s, 耗时: %.2f秒, 子节点数: %s", path, end_time - start_time, len(subtree.get('children', [])))
             
             return subtree
         except Exception as e:
-            logging.error(f"获取子树失败: {str(e)}")
+            logger.error("获取子树失败: %s", e)
             return {"error": str(e)}
 
     def _build_tree_sync_with_depth(self, dir_path, parent_node, max_depth, current_depth=0):
         """同步构建有限深度的文档树"""
         try:
-            logging.debug(f"构建树 - 路径: {dir_path}, 深度: {current_depth}/{max_depth}")
+            logger.debug("构建树 - 路径: %s, 深度: %s/%s", dir_path, current_depth, max_depth)
             
             # 一次性获取所有文件和目录
             all_items = os.listdir(dir_path)
@@ -819,7 +843,7 @@ class DocService:
                 
                 # 排序并添加文件节点
                 parent_node["children"].extend(self._sort_items(file_nodes))
-                logging.debug(f"添加了 {len(file_nodes)} 个文件节点到 {dir_path}")
+                logger.debug("添加了 %s 个文件节点到 %s", len(file_nodes), dir_path)
                 # 释放内存
                 del file_nodes
             
@@ -840,7 +864,7 @@ class DocService:
                 else:
                     # 如果达到最大深度，添加标记表示有子内容但未加载
                     dir_node["has_children"] = True
-                    logging.debug(f"目录 {rel_path} 达到最大深度，设置has_children=True标记")
+                    logger.debug("目录 %s 达到最大深度，设置has_children=True标记", rel_path)
                 
                 # 只有当目录非空或者有待加载子内容时才添加
                 if dir_node["children"] or dir_node.get("has_children", False):
@@ -851,10 +875,10 @@ class DocService:
             if parent_node["children"]:
                 parent_node["children"] = self._sort_items(parent_node["children"])
                 
-            logging.debug(f"完成构建树 - 路径: {dir_path}, 添加了 {dir_count} 个目录节点")
+            logger.debug("完成构建树 - 路径: %s, 添加了 %s 个目录节点", dir_path, dir_count)
             
         except Exception as e:
-            logging.error(f"处理目录 {dir_path} 时出错: {str(e)}")
+            logger.error("处理目录 %s 时出错: %s", dir_path, e)
     
     def _build_tree_sync(self, dir_path, parent_node):
         """同步构建文档树，使用最大深度为无限的方式构建完整树"""
@@ -862,7 +886,7 @@ class DocService:
             # 调用带深度参数的方法，设置足够大的深度以构建完整树
             return self._build_tree_sync_with_depth(dir_path, parent_node, max_depth=999, current_depth=0)
         except Exception as e:
-            logging.error(f"构建树失败: {str(e)}")
+            logger.error("构建树失败: %s", e)
             # 确保失败时不会完全崩溃
             return None
 
@@ -895,7 +919,7 @@ class DocService:
                 try:
                     page_count = await self._get_pdf_page_count_with_timeout(file_path)
                 except asyncio.TimeoutError:
-                    logging.warning(f"获取PDF页数超时: {path}")
+                    logger.warning("获取PDF页数超时: %s", path)
                     page_count = 0
                 
                 result = {
@@ -913,7 +937,7 @@ class DocService:
                 await self._pdf_metadata_cache.put(path, result)
                 return result
             except Exception as e:
-                logging.error(f"获取PDF信息出错: {str(e)}")
+                logger.error("获取PDF信息出错: %s", e)
                 return {
                     "path": path,
                     "type": "pdf",
@@ -937,10 +961,10 @@ class DocService:
                     async with aiofiles.open(file_path, mode='r', encoding='gbk') as f:
                         content = await f.read()
                 except Exception as e:
-                    logging.error(f"读取文件内容出错: {str(e)}")
+                    logger.error("读取文件内容出错: %s", e)
                     raise FileNotFoundError(f"Error reading document content: {path}")
             except Exception as e:
-                logging.error(f"读取文件内容出错: {str(e)}")
+                logger.error("读取文件内容出错: %s", e)
                 raise FileNotFoundError(f"Error reading document content: {path}")
 
             # 获取修改时间
@@ -994,7 +1018,7 @@ class DocService:
                         
                         docs.append(doc_info)
                     except Exception as e:
-                        logging.error(f"处理文件失败 {file}: {str(e)}")
+                        logger.error("处理文件失败 %s: %s", file, e)
                         continue
 
             # 按最后修改时间排序
@@ -1011,7 +1035,7 @@ class DocService:
             return docs[:limit]
             
         except Exception as e:
-            logging.error(f"获取最近文档失败: {str(e)}")
+            logger.error("获取最近文档失败: %s", e)
             return []
 
     async def get_breadcrumb(self, path: str) -> List[Dict]:
@@ -1042,7 +1066,7 @@ class DocService:
 
     async def _preload_doc_tree(self):
         """预加载文档树，避免第一次请求时的延迟（现在跳过预加载）"""
-        logging.info("跳过预加载文档树，将使用按需加载机制")
+        logger.info("跳过预加载文档树，将使用按需加载机制")
         # 不再预加载文档树
 
     async def update_reader(self, ip_address: str, path: str = ""):
@@ -1056,10 +1080,10 @@ class DocService:
                 "current_path": path
             }
             
-            logging.debug(f"更新读者状态成功: IP={ip_address}, 路径={path}, 当前在线数={len(self._online_readers)}")
+            logger.debug("更新读者状态成功: IP=%s, 路径=%s, 当前在线数=%s", ip_address, path, len(self._online_readers))
             return True
         except Exception as e:
-            logging.error(f"更新读者状态失败: {str(e)}")
+            logger.error("更新读者状态失败: %s", e)
             return False
             
     async def _cleanup_expired_readers(self):
@@ -1071,7 +1095,7 @@ class DocService:
             for ip, data in self._online_readers.items():
                 if current_time - data["last_active"] > self._online_expiry:
                     expired_readers.append(ip)
-                    logging.debug(f"发现过期读者: IP={ip}, 最后活跃时间={data['last_active']}, 超时={current_time - data['last_active']}秒")
+                    logger.debug("发现过期读者: IP=%s, 最后活跃时间=%s, 超时=%s秒", ip, data['last_active'], current_time - data['last_active'])
             
             # 清理前记录总数
             before_count = len(self._online_readers)
@@ -1083,9 +1107,9 @@ class DocService:
             after_count = len(self._online_readers)
                 
             if expired_readers:
-                logging.info(f"清理了 {len(expired_readers)} 个过期读者记录, 清理前={before_count}, 清理后={after_count}")
+                logger.info("清理了 %s 个过期读者记录, 清理前=%s, 清理后=%s", len(expired_readers), before_count, after_count)
         except Exception as e:
-            logging.error(f"清理过期读者记录时出错: {str(e)}")
+            logger.error("清理过期读者记录时出错: %s", e)
             
     async def get_online_readers_count(self) -> int:
         """获取当前在线阅读人数"""
@@ -1100,13 +1124,15 @@ class DocService:
             after_count = len(self._online_readers)
             
             if before_count != after_count:
-                logging.debug(f"清理前在线人数={before_count}, 清理后在线人数={after_count}")
+                logger.debug("清理前在线人数=%s, 清理后在线人数=%s", before_count, after_count)
             
-            logging.debug(f"当前在线读者IP列表: {list(self._online_readers.keys())}")
+            # 列出所有 IP 的开销随在线人数增长，只在开启调试日志时生成
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("当前在线读者IP列表: %s", list(self._online_readers.keys()))
             
             return after_count
         except Exception as e:
-            logging.error(f"获取在线读者数量时出错: {str(e)}")
+            logger.error("获取在线读者数量时出错: %s", e)
             return 0 
 
     async def get_cache_stats(self):
@@ -1130,5 +1156,5 @@ class DocService:
                 await asyncio.sleep(300)  # 每5分钟执行一次维护
                 await self.perform_maintenance()
             except Exception as e:
-                logging.error(f"执行维护任务时出错: {str(e)}")
+                logger.error("执行维护任务时出错: %s", e)
                 await asyncio.sleep(60)  # 出错后等待1分钟再尝试 
\ No newline at end of file
@@ -0,0 +1,672 @@
+import os
+import json
+import math
+import mmap
+import zlib
+import sys
+import heapq
+import struct
+import logging
+import threading
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from collections import defaultdict
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+
+from app.services.tokenizer import Tokenizer, get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text: str) -> List[str]:
+    """使用默认分词器切分词项"""
+    return get_tokenizer().tokenize(text)
+
+
+def encode_varints(values: Iterable[int]) -> bytearray:
+    """把非负整数编码为变长字节（每字节 7 位，最高位表示后面还有字节）"""
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return out
+
+
+def decode_varints(data: bytes) -> List[int]:
+    """解码 encode_varints 生成的字节"""
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+class Segment:
+    """只读的索引段，通过 mmap 按需读取
+
+    打开时只读取头部，词项、倒排表和存储字段在查询时才从映射中读取，
+    因此加载索引的开销与索引大小无关。
+
+    文件布局（整数均为小端）:
+        头部        HEADER
+        词项记录    按词项 UTF-8 字节序排列的定长记录 TERM_RECORD，支持二分查找
+        词项文本    所有词项的 UTF-8 字节
+        倒排表      每个词项一段变长整数: (文档号差值, 词频) 交替排列
+        文档表      每个文档一条 DOC_RECORD: 加权长度、存储字段的偏移和长度
+        路径记录    按路径字节序排列的 PATH_RECORD，同一文件的文档编号连续
+        路径文本    所有路径的 UTF-8 字节
+        修改时间列  每个文档一个 float64（last_modified 时间戳）
+        类型列      每个文档一个 uint8，指向类型表
+        路径号列    每个文档一个 uint32，指向路径记录
+        类型表      JSON 数组，例如 ["md", "pdf"]
+        存储字段    每个文档一段 zlib 压缩的 JSON
+
+    列数据在第一次用于过滤或排序时整体读入数组，之后按文档号直接访问。
+    """
+
+    MAGIC = b'FTS1'
+    VERSION = 3
+    HEADER = struct.Struct('<4sIIIIQQQQQQQQQQQQ')
+    TERM_RECORD = struct.Struct('<IHQII')  # 词项文本偏移, 词项文本长度, 倒排表偏移, 倒排表字节数, df
+    DOC_RECORD = struct.Struct('<IQI')     # 文档长度, 存储字段偏移, 存储字段长度
+    PATH_RECORD = struct.Struct('<IHII')   # 路径文本偏移, 路径文本长度, 第一个文档号, 文档数
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.doc_count, self.term_count, self.path_count, self.total_length,
+         self._terms_off, self._blob_off, self._postings_off, self._docs_off,
+         self._paths_off, self._path_blob_off, self._mtime_off, self._type_off,
+         self._path_id_off, self._types_off, self._stored_off) = self.HEADER.unpack_from(self._mm, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            self.close()
+            raise ValueError(f"不支持的索引段格式: {path}")
+        self._columns = None
+        self._path_cache: Dict[int, str] = {}
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _bisect(self, record: struct.Struct, records_off: int, blob_off: int, count: int, target: bytes) -> int:
+        """在按键排序的定长记录中二分查找第一个键 >= target 的位置（前两个字段是键的偏移和长度）"""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key_off, key_len = record.unpack_from(self._mm, records_off + mid * record.size)[:2]
+            start = blob_off + key_off
+            if self._mm[start:start + key_len] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _key_at(self, record: struct.Struct, records_off: int, blob_off: int, i: int):
+        fields = record.unpack_from(self._mm, records_off + i * record.size)
+        start = blob_off + fields[0]
+        return self._mm[start:start + fields[1]], fields[2:]
+
+    def lookup(self, term: str) -> Optional[Tuple[int, int, int]]:
+        """二分查找词项，返回 (倒排表偏移, 倒排表字节数, df)，不存在时返回 None"""
+        target = term.encode('utf-8')
+        i = self._bisect(self.TERM_RECORD, self._terms_off, self._blob_off, self.term_count, target)
+        if i < self.term_count:
+            key, fields = self._key_at(self.TERM_RECORD, self._terms_off, self._blob_off, i)
+            if key == target:
+                return fields
+        return None
+
+    def postings(self, postings_off: int, postings_len: int) -> Tuple[List[int], List[int]]:
+        """读取并解码倒排表: (文档号列表, 词频列表)"""
+        start = self._postings_off + postings_off
+        values = decode_varints(self._mm[start:start + postings_len])
+        doc_ids = list(accumulate(values[0::2]))
+        return doc_ids, values[1::2]
+
+    def doc_ranges(self, path: str) -> List[Tuple[int, int]]:
+        """查找路径（文件或目录）对应的文档号区间 [(第一个文档号, 文档数)]，空路径表示全部文档"""
+        ranges = []
+        target = path.encode('utf-8')
+        prefix = target.rstrip(b'/') + b'/' if target.strip(b'/') else b''
+        i = self._bisect(self.PATH_RECORD, self._paths_off, self._path_blob_off, self.path_count, target)
+        while i < self.path_count:
+            key, (first_doc, count) = self._key_at(self.PATH_RECORD, self._paths_off, self._path_blob_off, i)
+            if key != target and not key.startswith(prefix):
+                # 目录下的路径排在 "目录/" 之后，遇到不相关的路径时跳到前缀位置继续查找一次
+                if key < prefix:
+                    j = self._bisect(self.PATH_RECORD, self._paths_off, self._path_blob_off, self.path_count, prefix)
+                    if j > i:
+                        i = j
+                        continue
+                break
+            ranges.append((first_doc, count))
+            i += 1
+        return ranges
+
+    def _read_column(self, typecode: str, offset: int) -> array:
+        values = array(typecode)
+        values.frombytes(self._mm[offset:offset + values.itemsize * self.doc_count])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    @property
+    def columns(self) -> Tuple[array, array, array, List[str]]:
+        """列数据 (修改时间, 类型编号, 路径号, 类型表)，第一次访问时读入"""
+        if self._columns is None:
+            types = json.loads(self._mm[self._types_off:self._stored_off].decode('utf-8'))
+            self._columns = (
+                self._read_column('d', self._mtime_off),
+                self._read_column('B', self._type_off),
+                self._read_column('I', self._path_id_off),
+                types
+            )
+        return self._columns
+
+    def doc_path(self, doc_id: int) -> str:
+        """根据路径号列查找文档所属文件的路径"""
+        path_id = self.columns[2][doc_id]
+        path = self._path_cache.get(path_id)
+        if path is None:
+            path = self._key_at(self.PATH_RECORD, self._paths_off, self._path_blob_off, path_id)[0].decode('utf-8')
+            self._path_cache[path_id] = path
+        return path
+
+    def paths(self) -> List[str]:
+        """返回段中的全部文件路径"""
+        return [
+            self._key_at(self.PATH_RECORD, self._paths_off, self._path_blob_off, i)[0].decode('utf-8')
+            for i in range(self.path_count)
+        ]
+
+    def doc_length(self, doc_id: int) -> int:
+        return self.DOC_RECORD.unpack_from(self._mm, self._docs_off + doc_id * self.DOC_RECORD.size)[0]
+
+    def stored_fields(self, doc_id: int) -> Dict[str, Any]:
+        """读取并解压文档的存储字段"""
+        _, stored_off, stored_len = self.DOC_RECORD.unpack_from(
+            self._mm, self._docs_off + doc_id * self.DOC_RECORD.size
+        )
+        start = self._stored_off + stored_off
+        return json.loads(zlib.decompress(self._mm[start:start + stored_len]).decode('utf-8'))
+
+    @classmethod
+    def write(
+        cls,
+        path: str,
+        documents: Iterable[Dict[str, Any]],
+        field_weights: Dict[str, int],
+        tokenizer: Tokenizer
+    ) -> int:
+        """把文档写成一个新的索引段（先写临时文件，再原子替换）
+
+        Args:
+            documents: 文档字典，全部字段都会被存储，field_weights 中的字段会被索引；
+                同一个 path 的文档必须连续出现
+            field_weights: {字段名: 权重}，词频按字段权重累加（简化的 BM25F）
+        """
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        doc_records = []
+        stored_blob = bytearray()
+        path_runs: Dict[str, List[int]] = {}  # 路径 -> [第一个文档号, 文档数]
+        doc_paths: List[str] = []
+        mtimes = array('d')
+        type_codes = array('B')
+        types: List[str] = []
+        total_length = 0
+
+        doc_id = -1
+        last_path = None
+        for doc_id, doc in enumerate(documents):
+            doc_path = doc.get('path', '')
+            if doc_path != last_path:
+                if doc_path in path_runs:
+                    raise ValueError(f"同一文件的文档必须连续写入: {doc_path}")
+                path_runs[doc_path] = [doc_id, 0]
+                last_path = doc_path
+            path_runs[doc_path][1] += 1
+            doc_paths.append(doc_path)
+
+            doc_type = doc.get('type', '')
+            if doc_type not in types:
+                if len(types) >= 255:
+                    raise ValueError("文档类型过多")
+                types.append(doc_type)
+            type_codes.append(types.index(doc_type))
+            mtimes.append(float(doc.get('last_modified', 0)))
+
+            freqs: Dict[str, int] = defaultdict(int)
+            length = 0
+            for field, weight in field_weights.items():
+                value = doc.get(field)
+                if isinstance(value, list):
+                    value = ' '.join(value)
+                if not value:
+                    continue
+                for token in tokenizer.index_tokenize(value):
+                    freqs[token] += weight
+                    length += weight
+            for token, freq in freqs.items():
+                postings[token].append((doc_id, freq))
+
+            stored = zlib.compress(json.dumps(doc, ensure_ascii=False).encode('utf-8'))
+            doc_records.append((length, len(stored_blob), len(stored)))
+            stored_blob.extend(stored)
+            total_length += length
+        doc_count = doc_id + 1
+
+        term_records = bytearray()
+        term_blob = bytearray()
+        postings_blob = bytearray()
+        for term in sorted(postings, key=lambda t: t.encode('utf-8')):
+            encoded = term.encode('utf-8')
+            entries = postings[term]
+            # 文档号递增写入，只存相邻文档号的差值
+            values = []
+            previous = 0
+            for entry_doc, freq in entries:
+                values.append(entry_doc - previous)
+                values.append(freq)
+                previous = entry_doc
+            encoded_postings = encode_varints(values)
+            term_records.extend(cls.TERM_RECORD.pack(
+                len(term_blob), len(encoded), len(postings_blob), len(encoded_postings), len(entries)
+            ))
+            term_blob.extend(encoded)
+            postings_blob.extend(encoded_postings)
+
+        doc_table = bytearray()
+        for record in doc_records:
+            doc_table.extend(cls.DOC_RECORD.pack(*record))
+
+        path_records = bytearray()
+        path_blob = bytearray()
+        path_ids: Dict[str, int] = {}
+        for path_id, doc_path in enumerate(sorted(path_runs, key=lambda p: p.encode('utf-8'))):
+            encoded = doc_path.encode('utf-8')
+            first_doc, count = path_runs[doc_path]
+            path_records.extend(cls.PATH_RECORD.pack(len(path_blob), len(encoded), first_doc, count))
+            path_blob.extend(encoded)
+            path_ids[doc_path] = path_id
+        path_id_column = array('I', (path_ids[p] for p in doc_paths))
+
+        columns = []
+        for column in (mtimes, type_codes, path_id_column):
+            if sys.byteorder != 'little':
+                column.byteswap()
+            columns.append(column.tobytes())
+        types_blob = json.dumps(types, ensure_ascii=False).encode('utf-8')
+
+        blocks = [term_records, term_blob, postings_blob, doc_table, path_records, path_blob,
+                  *columns, types_blob, stored_blob]
+        offsets = []
+        position = cls.HEADER.size
+        for block in blocks:
+            offsets.append(position)
+            position += len(block)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(cls.HEADER.pack(
+                cls.MAGIC, cls.VERSION, doc_count, len(postings), len(path_runs), total_length, *offsets
+            ))
+            for block in blocks:
+                f.write(block)
+        os.replace(tmp_path, path)
+        return doc_count
+
+
+class FullTextIndex:
+    """嵌入式全文索引：BM25 打分，中文二元组切分，索引段通过 mmap 加载
+
+    不依赖外部服务，MeiliSearch 不可用时可以直接在本进程中响应查询。
+
+    索引由多个只追加的段组成: 更新文件时把旧文档记入删除标记，新文档写入一个新的小段，
+    更新的开销只与变化的文档数有关。段的列表和删除标记保存在清单文件 segments.json 中，
+    通过原子替换清单来提交变更；段数超过上限时合并为一个段。
+    """
+
+    # 文件名和章节标题的命中比正文更重要
+    FIELD_WEIGHTS = {'name': 5, 'headings': 3, 'content': 1}
+    MANIFEST_NAME = "segments.json"
+
+    def __init__(
+        self,
+        index_dir: str,
+        k1: float = 1.2,
+        b: float = 0.75,
+        max_segments: int = 8,
+        tokenizer: Optional[Tokenizer] = None
+    ):
+        self.index_dir = index_dir
+        # 建索引和解析查询使用同一个分词器
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        os.makedirs(index_dir, exist_ok=True)
+        self.manifest_path = os.path.join(index_dir, self.MANIFEST_NAME)
+        # (段列表, {段文件名: 已删除的文档号集合})，作为一个元组整体替换，查询不会看到更新到一半的状态
+        self._state: Tuple[List[Segment], Dict[str, frozenset]] = ([], {})
+        self._next_seq = 1
+        self._write_lock = threading.Lock()
+        self.load()
+
+    @property
+    def tokenizer_key(self) -> str:
+        """写入清单的分词方式：分词器名称，加上索引中包含单字（没有单字的旧索引需要重建）"""
+        return f"{self.tokenizer.name}+unigram"
+
+    @property
+    def segments(self) -> List[Segment]:
+        return self._state[0]
+
+    @property
+    def doc_count(self) -> int:
+        """未被删除的文档数"""
+        segments, deleted = self._state
+        return sum(s.doc_count - len(deleted.get(s.name, ())) for s in segments)
+
+    def load(self):
+        """按清单加载索引段，只映射文件、读取头部"""
+        segments: List[Segment] = []
+        deleted: Dict[str, frozenset] = {}
+        manifest = {'segments': []}
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except Exception as e:
+                logger.error("加载全文索引清单失败: %s", e)
+
+        if manifest.get('segments') and manifest.get('tokenizer') != self.tokenizer_key:
+            # 分词器变化后旧索引的词项与查询不一致，视为空索引，等待重建
+            logger.warning("全文索引的分词器 %s 与当前分词器 %s 不一致，需要重建", manifest.get('tokenizer'), self.tokenizer_key)
+            manifest = {'segments': [], 'next_seq': manifest.get('next_seq', 1)}
+
+        for entry in manifest.get('segments', []):
+            path = os.path.join(self.index_dir, entry['name'])
+            try:
+                segment = Segment(path)
+            except Exception as e:
+                # 任一段无法加载时整个索引视为空，等待重建
+                logger.error("加载全文索引段失败 %s: %s", path, e)
+                segments, deleted = [], {}
+                break
+            segments.append(segment)
+            deleted[segment.name] = frozenset(entry.get('deleted', []))
+
+        self._state = (segments, deleted)
+        self._next_seq = manifest.get('next_seq', 1)
+        self._remove_unlisted_files()
+
+    def _new_segment_path(self) -> str:
+        path = os.path.join(self.index_dir, f"seg_{self._next_seq:06d}.fts")
+        self._next_seq += 1
+        return path
+
+    def _commit(self, segments: List[Segment], deleted: Dict[str, frozenset]):
+        """原子写入清单并切换到新状态"""
+        manifest = {
+            'next_seq': self._next_seq,
+            'tokenizer': self.tokenizer_key,
+            'segments': [
+                {'name': s.name, 'deleted': sorted(deleted.get(s.name, ()))}
+                for s in segments
+            ]
+        }
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, separators=(',', ':'))
+        os.replace(tmp_path, self.manifest_path)
+        # 旧段可能仍在被查询读取，不主动关闭，由垃圾回收释放映射
+        self._state = (segments, deleted)
+        self._remove_unlisted_files()
+
+    def _remove_unlisted_files(self):
+        """删除不在清单中的段文件（被合并的旧段、写入中途失败留下的文件）"""
+        listed = {s.name for s in self.segments}
+        for name in os.listdir(self.index_dir):
+            if name.endswith(('.fts', '.fts.tmp')) and name not in listed:
+                try:
+                    os.remove(os.path.join(self.index_dir, name))
+                except OSError:
+                    pass
+
+    def rebuild(self, documents: Iterable[Dict[str, Any]]) -> int:
+        """用给定文档重建索引（同步执行，适合放在线程池中运行）"""
+        with self._write_lock:
+            path = self._new_segment_path()
+            doc_count = Segment.write(path, documents, self.FIELD_WEIGHTS, self.tokenizer)
+            self._commit([Segment(path)], {})
+            return doc_count
+
+    def update(self, documents: Iterable[Dict[str, Any]], paths: Iterable[str]) -> int:
+        """增量更新：删除 paths（文件或目录）下的全部旧文档，再追加新文档
+
+        Args:
+            documents: 新文档，同一个 path 的文档必须连续出现
+            paths: 需要替换或删除的路径，通常包括 documents 中出现的全部路径
+        Returns:
+            追加的文档数
+        """
+        with self._write_lock:
+            segments, deleted = self._state
+            new_deleted = dict(deleted)
+            for segment in segments:
+                doc_ids = set()
+                for path in paths:
+                    for first_doc, count in segment.doc_ranges(path):
+                        doc_ids.update(range(first_doc, first_doc + count))
+                if doc_ids:
+                    new_deleted[segment.name] = frozenset(deleted.get(segment.name, frozenset()) | doc_ids)
+
+            new_segments = list(segments)
+            path = self._new_segment_path()
+            doc_count = Segment.write(path, documents, self.FIELD_WEIGHTS, self.tokenizer)
+            if doc_count:
+                new_segments.append(Segment(path))
+            else:
+                os.remove(path)
+
+            # 删除标记已经覆盖全部文档的段可以直接丢弃
+            new_segments = [s for s in new_segments if len(new_deleted.get(s.name, ())) < s.doc_count]
+            new_deleted = {s.name: new_deleted.get(s.name, frozenset()) for s in new_segments}
+            self._commit(new_segments, new_deleted)
+
+        if len(self.segments) > self.max_segments:
+            self.compact()
+        return doc_count
+
+    def _live_documents(self, segments: List[Segment], deleted: Dict[str, frozenset]):
+        """按段顺序遍历未删除的文档的存储字段"""
+        for segment in segments:
+            removed = deleted.get(segment.name, frozenset())
+            for doc_id in range(segment.doc_count):
+                if doc_id not in removed:
+                    yield segment.stored_fields(doc_id)
+
+    def compact(self) -> int:
+        """把所有段合并为一个段，清除删除标记"""
+        with self._write_lock:
+            segments, deleted = self._state
+            path = self._new_segment_path()
+            doc_count = Segment.write(path, self._live_documents(segments, deleted), self.FIELD_WEIGHTS, self.tokenizer)
+            self._commit([Segment(path)], {})
+            logger.info("全文索引已合并 %s 个段，文档数: %s", len(segments), doc_count)
+            return doc_count
+
+    @staticmethod
+    def _filter(
+        segment: Segment,
+        docs: Iterable[int],
+        removed: frozenset,
+        doc_type: Optional[str],
+        date_from: Optional[float],
+        date_to: Optional[float],
+        path_prefixes: Optional[List[str]] = None
+    ) -> List[int]:
+        """用列数据过滤候选文档，同时排除已删除的文档"""
+        docs = [doc_id for doc_id in docs if doc_id not in removed]
+        for prefix in path_prefixes or ():
+            # 目录下的文档号是若干连续区间，按区间起点二分查找
+            ranges = sorted(segment.doc_ranges(prefix))
+            starts = [first_doc for first_doc, _ in ranges]
+            ends = [first_doc + count for first_doc, count in ranges]
+            kept = []
+            for doc_id in docs:
+                i = bisect_right(starts, doc_id) - 1
+                if i >= 0 and doc_id < ends[i]:
+                    kept.append(doc_id)
+            docs = kept
+        if not docs or (doc_type is None and date_from is None and date_to is None):
+            return docs
+        mtimes, type_codes, _, types = segment.columns
+        if doc_type is not None:
+            if doc_type not in types:
+                return []
+            code = types.index(doc_type)
+            docs = [doc_id for doc_id in docs if type_codes[doc_id] == code]
+        if date_from is not None:
+            docs = [doc_id for doc_id in docs if mtimes[doc_id] >= date_from]
+        if date_to is not None:
+            docs = [doc_id for doc_id in docs if mtimes[doc_id] <= date_to]
+        return docs
+
+    def query(
+        self,
+        q: str,
+        limit: int = 10,
+        offset: int = 0,
+        doc_type: Optional[str] = None,
+        date_from: Optional[float] = None,
+        date_to: Optional[float] = None,
+        sort_by: str = "relevance",
+        sort_order: str = "desc",
+        path_prefixes: Optional[List[str]] = None
+    ) -> Tuple[int, List[Tuple[float, Segment, int]]]:
+        """基于倒排表求值查询
+
+        先对各词项的倒排表求交集（所有词项都出现），没有这样的文档时退回并集；
+        类型和日期过滤直接读取列数据，path_prefixes 中的每个目录都必须包含该文档；只对候选文档计算 BM25，并用堆选出前 offset + limit 个。
+
+        Returns:
+            (命中总数, 当前页的 [(得分, 段, 段内文档号)])
+        """
+        segments, deleted = self._state
+        terms = list(dict.fromkeys(self.tokenizer.tokenize(q)))
+        total_docs = sum(s.doc_count - len(deleted.get(s.name, ())) for s in segments)
+        if not terms or not total_docs:
+            return 0, []
+        # 平均长度包含已删除文档，段合并后恢复精确值，对打分影响很小
+        avg_length = (sum(s.total_length for s in segments) / sum(s.doc_count for s in segments)) or 1.0
+
+        # 每个段中各词项的倒排表 {词项: {文档号: 词频}}，以及全局 df
+        segment_postings: List[Dict[str, Dict[int, int]]] = []
+        df: Dict[str, int] = defaultdict(int)
+        for segment in segments:
+            term_postings = {}
+            for term in terms:
+                entry = segment.lookup(term)
+                if entry is not None:
+                    doc_ids, freqs = segment.postings(entry[0], entry[1])
+                    term_postings[term] = dict(zip(doc_ids, freqs))
+                    df[term] += entry[2]
+            segment_postings.append(term_postings)
+
+        def collect(match_all: bool) -> List[Tuple[int, int]]:
+            candidates = []
+            for seg_no, (segment, term_postings) in enumerate(zip(segments, segment_postings)):
+                if not term_postings:
+                    continue
+                if match_all:
+                    if len(term_postings) < len(terms):
+                        continue
+                    # 从最短的倒排表开始求交集
+                    ordered = sorted(term_postings.values(), key=len)
+                    docs = set(ordered[0]).intersection(*ordered[1:])
+                else:
+                    docs = set().union(*term_postings.values())
+                for doc_id in self._filter(segment, docs, deleted.get(segment.name, frozenset()),
+                                           doc_type, date_from, date_to, path_prefixes):
+                    candidates.append((seg_no, doc_id))
+            return candidates
+
+        candidates = collect(match_all=True)
+        if not candidates and len(terms) > 1:
+            candidates = collect(match_all=False)
+
+        idf = {term: math.log(1 + (total_docs - n + 0.5) / (n + 0.5)) for term, n in df.items()}
+
+        def score(seg_no: int, doc_id: int) -> float:
+            segment = segments[seg_no]
+            norm = self.k1 * (1 - self.b + self.b * segment.doc_length(doc_id) / avg_length)
+            total = 0.0
+            for term, doc_freqs in segment_postings[seg_no].items():
+                freq = doc_freqs.get(doc_id)
+                if freq:
+                    total += idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            return total
+
+        k = offset + limit
+        if sort_by == "date":
+            key = lambda c: segments[c[0]].columns[0][c[1]]
+        elif sort_by == "name":
+            key = lambda c: os.path.basename(segments[c[0]].doc_path(c[1]))
+        else:
+            key = None
+
+        if key is None:
+            top = heapq.nlargest(k, ((score(seg_no, doc_id), seg_no, doc_id) for seg_no, doc_id in candidates),
+                                 key=lambda item: item[0])
+        else:
+            select = heapq.nlargest if sort_order == "desc" else heapq.nsmallest
+            top = [(score(seg_no, doc_id), seg_no, doc_id) for seg_no, doc_id in select(k, candidates, key=key)]
+        return len(candidates), [(item_score, segments[seg_no], doc_id) for item_score, seg_no, doc_id in top[offset:]]
+
+    def make_snippet(self, content: str, q: str, width: int = 120) -> Tuple[str, List[List[int]]]:
+        """在正文中找到第一个命中的词项，截取附近的片段并返回命中区间 [[起始位置, 长度], ...]"""
+        terms = sorted(set(self.tokenizer.tokenize(q)), key=len, reverse=True)
+        lowered = content.lower()
+        first = min((p for p in (lowered.find(t) for t in terms) if p >= 0), default=-1)
+        if first < 0:
+            return '', []
+
+        start = max(0, first - width // 4)
+        end = min(len(content), start + width)
+        text = content[start:end].replace('\n', ' ')
+        lowered_text = lowered[start:end]
+
+        # 标记片段内所有命中位置，重叠的区间（例如相邻的中文二元组）合并
+        spans = []
+        for term in terms:
+            pos = lowered_text.find(term)
+            while pos >= 0:
+                spans.append((pos, pos + len(term)))
+                pos = lowered_text.find(term, pos + 1)
+        spans.sort()
+        highlights: List[List[int]] = []
+        for s, e in spans:
+            if highlights and s <= highlights[-1][0] + highlights[-1][1]:
+                last = highlights[-1]
+                last[1] = max(last[0] + last[1], e) - last[0]
+            else:
+                highlights.append([s, e - s])
+
+        prefix = '...' if start > 0 else ''
+        suffix = '...' if end < len(content) else ''
+        return prefix + text + suffix, [[s + len(prefix), length] for s, length in highlights]
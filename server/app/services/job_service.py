@@ -0,0 +1,173 @@
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """后台任务: 记录状态、进度计数、吞吐量和预计剩余时间"""
+
+    def __init__(self, kind: str, description: str = ""):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.description = description
+        self.state = "pending"  # pending / running / completed / failed / cancelled
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.total = 0
+        self.done = 0
+        self.errors = 0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        # 由任务自己维护进度的服务（例如索引构建）可以提供读取函数，返回 (已完成数, 总数)
+        self.progress_source: Optional[Callable[[], Tuple[int, int]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in ("pending", "running")
+
+    def report(self, done: int, total: int):
+        """更新进度计数，可以直接作为服务的进度回调"""
+        self.done = done
+        self.total = total
+
+    def to_dict(self) -> Dict[str, Any]:
+        done, total = self.progress_source() if self.progress_source else (self.done, self.total)
+        end_time = self.finished_at or time.time()
+        elapsed = end_time - self.started_at if self.started_at else 0.0
+        throughput = done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.state == "running" and throughput > 0 and total > done:
+            eta = round((total - done) / throughput, 1)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "description": self.description,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "done": done,
+            "total": total,
+            "errors": self.errors,
+            "percent": round(done / total * 100, 1) if total else None,
+            "elapsed_seconds": round(elapsed, 2),
+            "items_per_second": round(throughput, 2),
+            "eta_seconds": eta,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobService:
+    """后台任务运行器
+
+    长时间运行的操作（索引重建、PDF 线性化等）作为后台任务执行，HTTP 请求只返回任务 ID。
+    写入索引的任务持有同一把写锁依次执行；同类任务正在运行时再次提交会返回已有的任务。
+    """
+
+    def __init__(self, max_history: int = 50):
+        self.max_history = max_history
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._writer_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def writer_lock(self) -> asyncio.Lock:
+        # 在事件循环中第一次使用时创建
+        if self._writer_lock is None:
+            self._writer_lock = asyncio.Lock()
+        return self._writer_lock
+
+    def submit(
+        self,
+        kind: str,
+        func: Callable[[Job], Awaitable[Any]],
+        description: str = "",
+        exclusive: bool = True
+    ) -> Job:
+        """提交后台任务
+
+        Args:
+            kind: 任务类型，同类任务不会同时运行
+            func: 接收 Job 对象的协程函数，返回值作为任务结果
+            exclusive: 是否需要持有写锁（与其他写入任务串行执行）
+        """
+        for job in self._jobs.values():
+            if job.kind == kind and job.active:
+                return job
+
+        job = Job(kind, description)
+        self._jobs[job.id] = job
+        job._task = asyncio.create_task(self._run(job, func, exclusive))
+        self._trim_history()
+        return job
+
+    async def _run(self, job: Job, func: Callable[[Job], Awaitable[Any]], exclusive: bool):
+        try:
+            if exclusive:
+                async with self.writer_lock:
+                    await self._execute(job, func)
+            else:
+                await self._execute(job, func)
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+            logger.info("后台任务已取消: %s (%s)", job.kind, job.id)
+        finally:
+            job.finished_at = job.finished_at or time.time()
+
+    async def _execute(self, job: Job, func: Callable[[Job], Awaitable[Any]]):
+        job.state = "running"
+        job.started_at = time.time()
+        logger.info("开始后台任务: %s (%s)", job.kind, job.id)
+        try:
+            job.result = await func(job)
+            job.state = "completed"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+            logger.exception("后台任务失败: %s (%s): %s", job.kind, job.id, e)
+        finally:
+            job.finished_at = time.time()
+            logger.info("后台任务结束: %s (%s), 状态: %s, 耗时 %.2f秒",
+                        job.kind, job.id, job.state, job.finished_at - job.started_at)
+
+    def _trim_history(self):
+        """只保留最近的任务记录，正在运行的任务不会被移除"""
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按提交时间倒序列出任务"""
+        return [job.to_dict() for job in reversed(self._jobs.values()) if kind is None or job.kind == kind]
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务，任务不存在或已结束时返回 False"""
+        job = self._jobs.get(job_id)
+        if job is None or not job.active or job._task is None:
+            return False
+        job._task.cancel()
+        return True
+
+    async def shutdown(self):
+        """应用关闭时取消所有未完成的任务"""
+        tasks = [job._task for job in self._jobs.values() if job.active and job._task is not None]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# 模块级单例，路由和启动任务共用同一个任务表和写锁
+job_service = JobService()
@@ -0,0 +1,120 @@
+import re
+from typing import Dict, List, Any
+
+# ATX 标题，例如 "## 缓存击穿"，允许结尾的闭合 #（前面需有空格），只有 # 的行是空标题
+HEADING_PATTERN = re.compile(r'^ {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$')
+# Setext 标题的下划线（上一段文字为标题内容），= 为一级，- 为二级
+SETEXT_PATTERN = re.compile(r'^ {0,3}(=+|-+)[ \t]*$')
+# 列表项、引用和表格行之后的 --- 是分隔线而不是 Setext 标题
+BLOCK_START_PATTERN = re.compile(r'^\s*([-*+]\s|\d+[.)]\s|>|\|)')
+# 代码块围栏，代码块内的 # 不是标题
+FENCE_PATTERN = re.compile(r'^\s*(```|~~~)')
+
+
+def heading_plain_text(text: str) -> str:
+    """去掉标题中的行内标记（链接地址、图片、HTML 标签），与 marked 传给标题渲染器的纯文本一致"""
+    text = re.sub(r'!?\[([^\]]*)\]\([^)]*\)', r'\1', text)
+    return re.sub(r'<[^>]+>', '', text)
+
+
+def slugify_heading(text: str, index: int = 0) -> str:
+    """生成标题锚点，规则与前端 MarkdownViewer 渲染标题 id 的规则一致
+
+    只有标点或表情的标题得到空字符串，此时使用 section-<标题序号>（从 1 开始），
+    避免空锚点与第一个标题之前的前言部分冲突
+    """
+    slug = re.sub(r'[^\w\s-]', '', heading_plain_text(text).strip().lower())
+    slug = re.sub(r'\s+', '-', slug)
+    return slug or f"section-{index}"
+
+
+def split_markdown_sections(content: str) -> List[Dict[str, Any]]:
+    """按标题把 Markdown 拆分为章节
+
+    Returns:
+        章节列表，每个章节包含:
+        - heading: 章节标题（第一个标题之前的内容为空字符串）
+        - headings: 从顶层到当前章节的标题链
+        - level: 标题级别，前言部分为 0
+        - anchor: 页面内锚点，重复的标题追加 -1、-2 后缀
+        - line: 章节起始行号（从 1 开始）
+        - content: 章节正文（不含标题行）
+    """
+    sections: List[Dict[str, Any]] = []
+    slug_counts: Dict[str, int] = {}
+    chain: List[tuple] = []  # [(level, heading)]
+
+    current = {'heading': '', 'headings': [], 'level': 0, 'anchor': '', 'line': 1, 'lines': []}
+    in_fence = False
+    fence_marker = ''
+    heading_index = 0
+    # 当前段落的行，遇到 Setext 下划线时这些行是标题内容
+    paragraph: List[str] = []
+
+    for line_no, line in enumerate(content.split('\n'), 1):
+        fence = FENCE_PATTERN.match(line)
+        if fence:
+            marker = fence.group(1)
+            if not in_fence:
+                in_fence, fence_marker = True, marker
+            elif marker == fence_marker:
+                in_fence = False
+            current['lines'].append(line)
+            paragraph = []
+            continue
+        if in_fence:
+            current['lines'].append(line)
+            continue
+
+        match = HEADING_PATTERN.match(line)
+        setext = None if match else SETEXT_PATTERN.match(line)
+        if match:
+            level = len(match.group(1))
+            heading = (match.group(2) or '').strip()
+            start_line = line_no
+        elif setext and paragraph:
+            level = 1 if setext.group(1)[0] == '=' else 2
+            heading = ' '.join(text.strip() for text in paragraph)
+            start_line = line_no - len(paragraph)
+            # 段落行属于标题，不再是上一节的正文
+            del current['lines'][-len(paragraph):]
+        else:
+            current['lines'].append(line)
+            if not line.strip() or BLOCK_START_PATTERN.match(line):
+                paragraph = []
+            else:
+                paragraph.append(line)
+            continue
+
+        paragraph = []
+        sections.append(current)
+        heading_index += 1
+        while chain and chain[-1][0] >= level:
+            chain.pop()
+        chain.append((level, heading))
+
+        slug = slugify_heading(heading, heading_index)
+        count = slug_counts.get(slug, 0)
+        slug_counts[slug] = count + 1
+        anchor = f"{slug}-{count}" if count else slug
+
+        current = {
+            'heading': heading,
+            'headings': [h for _, h in chain],
+            'level': level,
+            'anchor': anchor,
+            'line': start_line,
+            'lines': []
+        }
+
+    sections.append(current)
+
+    result = []
+    for section in sections:
+        text = '\n'.join(section.pop('lines')).strip()
+        # 第一个标题之前没有正文时不单独成节
+        if not text and not section['level']:
+            continue
+        section['content'] = text
+        result.append(section)
+    return result
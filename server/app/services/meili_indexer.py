@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Any, Iterable, Set
+
+from app.services.job_service import job_service
+
+logger = logging.getLogger(__name__)
+
+
+class IndexManifest:
+    """已索引文件清单: {相对路径: {mtime, size, hash, doc_ids, schema}}"""
+
+    # 文档结构版本，生成的文档增加字段时递增，使已索引但未修改的文件也重新同步
+    SCHEMA_VERSION = 2
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _load(self):
+        """加载清单文件，损坏或不存在时视为空清单"""
+        try:
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+        except Exception as e:
+            logger.warning("加载索引清单失败，将重新同步全部文件: %s", e)
+            self.entries = {}
+
+    def save(self):
+        """原子方式写入清单，避免中途崩溃留下半个文件"""
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.manifest_path)
+
+    def replace(self, entries: Dict[str, Dict[str, Any]]):
+        """用全量构建的结果替换清单"""
+        self.entries = dict(entries)
+        self.save()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def hash_documents(documents: List[Dict[str, Any]]) -> str:
+        """计算待索引文档内容的哈希，内容不变时无需重新上传"""
+        payload = json.dumps(documents, ensure_ascii=False, sort_keys=True)
+        return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def make_entry(cls, file_path: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """为文件生成清单条目"""
+        stat = os.stat(file_path)
+        return {
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'hash': cls.hash_documents(documents),
+            'doc_ids': [doc['id'] for doc in documents],
+            'schema': cls.SCHEMA_VERSION
+        }
+
+
+class IncrementalIndexer:
+    """MeiliSearch 增量索引器
+
+    根据文件清单计算文件系统与索引之间的差异，只向 MeiliSearch 发送新增、更新和删除，
+    也可以消费文件监视器的事件，只检查发生变化的路径。
+    """
+
+    def __init__(self, meili_service, sync_interval: float = 5.0):
+        self.meili_service = meili_service
+        self.docs_dir = meili_service.docs_dir
+        self.sync_interval = sync_interval
+
+        # 文件监视器线程写入、事件循环读取的待同步路径
+        self._pending_paths: Set[str] = set()
+        self._pending_lock = threading.Lock()
+
+        # 同一时间只允许一个同步任务写入索引
+        self._sync_lock = asyncio.Lock()
+        self.last_sync: Optional[Dict[str, Any]] = None
+
+    @property
+    def manifest(self) -> IndexManifest:
+        return self.meili_service.manifest
+
+    def _is_indexable(self, file_name: str) -> bool:
+        """只有 Markdown 和 PDF 文件会被索引"""
+        return not file_name.startswith('.') and file_name.lower().endswith(('.md', '.pdf'))
+
+    def _rel_path(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.docs_dir).replace('\\', '/')
+
+    def _scan(self, rel_dir: str = "") -> Dict[str, os.stat_result]:
+        """扫描目录，返回 {相对路径: stat}"""
+        found = {}
+        stack = [os.path.join(self.docs_dir, rel_dir) if rel_dir else self.docs_dir]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir(follow_symlinks=True):
+                            stack.append(entry.path)
+                        elif self._is_indexable(entry.name):
+                            found[self._rel_path(entry.path)] = entry.stat()
+            except OSError as e:
+                logger.warning("扫描目录失败 %s: %s", current, e)
+        return found
+
+    def _collect_candidates(self, paths: Optional[Iterable[str]]):
+        """确定需要检查的路径：返回 (当前存在的文件 stat, 已消失的清单路径)"""
+        if paths is None:
+            current = self._scan()
+            removed = [p for p in self.manifest.entries if p not in current]
+            return current, removed
+
+        current: Dict[str, os.stat_result] = {}
+        removed: List[str] = []
+        for rel_path in set(paths):
+            abs_path = os.path.join(self.docs_dir, rel_path)
+            if os.path.isdir(abs_path):
+                # 目录事件（例如整个目录被移动进来）：扫描目录下的全部文件
+                current.update(self._scan(rel_path))
+                prefix = rel_path.rstrip('/') + '/'
+                removed.extend(
+                    p for p in self.manifest.entries
+                    if p.startswith(prefix) and p not in current
+                )
+            elif os.path.isfile(abs_path):
+                if self._is_indexable(os.path.basename(abs_path)):
+                    current[rel_path] = os.stat(abs_path)
+            else:
+                # 路径已不存在：可能是文件，也可能是被删除的目录
+                prefix = rel_path.rstrip('/') + '/'
+                removed.extend(
+                    p for p in self.manifest.entries
+                    if p == rel_path or p.startswith(prefix)
+                )
+        return current, removed
+
+    async def compute_delta(self, paths: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """计算索引差异
+
+        mtime 和 size 都未变化的文件直接跳过；变化的文件会重新生成文档并比较内容哈希，
+        只有哈希不同的文件才需要上传。
+        """
+        current, removed = self._collect_candidates(paths)
+
+        upserts: Dict[str, Dict[str, Any]] = {}   # 相对路径 -> {documents, entry}
+        touched: Dict[str, Dict[str, Any]] = {}   # 内容未变、只需更新清单的文件
+        for rel_path, stat in current.items():
+            entry = self.manifest.entries.get(rel_path)
+            if (entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size
+                    and entry.get('schema') == IndexManifest.SCHEMA_VERSION):
+                continue
+
+            abs_path = os.path.join(self.docs_dir, rel_path)
+            try:
+                documents = await self.meili_service.build_documents(abs_path)
+            except Exception as e:
+                logger.error("处理文件 %s 时出错: %s", rel_path, e)
+                continue
+            if not documents:
+                continue
+
+            new_entry = IndexManifest.make_entry(abs_path, documents)
+            if entry and entry['hash'] == new_entry['hash']:
+                touched[rel_path] = new_entry
+            else:
+                upserts[rel_path] = {'documents': documents, 'entry': new_entry}
+
+        # 需要删除的文档：已删除文件的全部文档，以及更新后不再存在的旧文档
+        delete_ids: List[str] = []
+        for rel_path in removed:
+            delete_ids.extend(self.manifest.entries[rel_path].get('doc_ids', []))
+        for rel_path, item in upserts.items():
+            old_entry = self.manifest.entries.get(rel_path)
+            if old_entry:
+                new_ids = set(item['entry']['doc_ids'])
+                delete_ids.extend(i for i in old_entry.get('doc_ids', []) if i not in new_ids)
+
+        return {
+            'upserts': upserts,
+            'touched': touched,
+            'removed': removed,
+            'delete_ids': delete_ids
+        }
+
+    async def sync(self, paths: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """把文件系统的变化同步到 MeiliSearch
+
+        调用方需要持有 job_service.writer_lock，避免与全量重建同时修改索引和文件清单
+        （重建任务本身已持有写锁，直接调用）。
+
+        Args:
+            paths: 只检查这些相对路径；为 None 时扫描整个文档目录
+        """
+        async with self._sync_lock:
+            start_time = time.time()
+            await self.meili_service.init_search_engine()
+            delta = await self.compute_delta(paths)
+
+            upserts = delta['upserts']
+            documents = [doc for item in upserts.values() for doc in item['documents']]
+            delete_ids = delta['delete_ids']
+
+            if documents or delete_ids:
+                index = await self.meili_service.get_index()
+                task_uids = []
+                for batch in self.meili_service._split_batches(documents):
+                    task = await index.add_documents(batch)
+                    task_uids.append(task.task_uid)
+                if delete_ids:
+                    task = await index.delete_documents(delete_ids)
+                    task_uids.append(task.task_uid)
+
+                task_results = await self.meili_service._wait_for_tasks(task_uids)
+                failed = {uid: r for uid, r in task_results.items() if r["status"] != "succeeded"}
+                if failed:
+                    # 清单保持不变，下次同步会重新尝试这些文件
+                    raise RuntimeError(f"增量索引任务失败: {failed}")
+
+            # 所有任务成功后再更新清单
+            entries = self.manifest.entries
+            for rel_path in delta['removed']:
+                entries.pop(rel_path, None)
+            for rel_path, item in upserts.items():
+                entries[rel_path] = item['entry']
+            entries.update(delta['touched'])
+            if upserts or delta['removed'] or delta['touched']:
+                self.manifest.save()
+            if documents or delete_ids:
+                # 索引内容已变化，使查询缓存失效
+                await self.meili_service.bump_index_version()
+
+            self.last_sync = {
+                'added_or_updated': len(upserts),
+                'deleted': len(delta['removed']),
+                'documents_uploaded': len(documents),
+                'documents_deleted': len(delete_ids),
+                'time_taken': time.time() - start_time,
+                'finished_at': time.time()
+            }
+            if upserts or delta['removed']:
+                logger.info("增量索引同步完成: %s", self.last_sync)
+            return self.last_sync
+
+    def mark_dirty(self, file_path: str):
+        """记录发生变化的路径（可在文件监视器线程中调用）"""
+        try:
+            rel_path = self._rel_path(file_path)
+        except ValueError:
+            return
+        if rel_path.startswith('..'):
+            return
+        with self._pending_lock:
+            self._pending_paths.add(rel_path)
+
+    def _drain_pending(self) -> Set[str]:
+        with self._pending_lock:
+            paths = self._pending_paths
+            self._pending_paths = set()
+        return paths
+
+    async def run_watch_loop(self):
+        """定期把文件监视器收集到的变化同步到索引"""
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            paths = self._drain_pending()
+            if not paths:
+                continue
+            try:
+                # 全量重建进行中时等待其完成，重建结束后清单已包含这些文件时同步为空操作
+                async with job_service.writer_lock:
+                    await self.sync(paths)
+            except Exception as e:
+                logger.error("增量索引同步失败: %s", e)
+                # 放回队列，下个周期重试
+                with self._pending_lock:
+                    self._pending_paths.update(paths)
@@ -6,10 +6,80 @@ import math
 import aiofiles
 import asyncio
 import hashlib
+import httpx
+import logging
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set, Tuple
 from meilisearch_python_sdk import AsyncClient
+from app.services.meili_indexer import IndexManifest
+from app.services.markdown_sections import split_markdown_sections
+from app.services.doc_service import LRUCache
+from app.services.search_metrics import stage, current_trace
+
+logger = logging.getLogger(__name__)
+
+# 高亮标记使用控制字符，不会与正文内容冲突，解析后返回纯文本和高亮区间
+HIGHLIGHT_PRE_TAG = "\x02"
+HIGHLIGHT_POST_TAG = "\x03"
+
+# smart_categorize.py 生成的两级分类目录: 智能分类/一级分类/二级分类/课程/...
+CATEGORY_ROOT = "智能分类"
+# 可过滤、并随搜索结果返回分布的分面属性
+FACET_ATTRIBUTES = ['type', 'category_lvl0', 'category_lvl1', 'course']
+# 排序方式对应的索引属性，last_modified 为整数时间戳（秒）
+SORT_ATTRIBUTES = {'date': 'last_modified', 'name': 'name'}
+
+
+def path_facets(rel_path: str) -> Dict[str, str]:
+    """根据文档的相对路径计算分类和课程分面
+
+    课程是文档所在的课程目录（相对路径），分类目录下为第三级目录，其他位置为第一级目录。
+    """
+    dirs = rel_path.split('/')[:-1]
+    facets = {}
+    if dirs and dirs[0] == CATEGORY_ROOT:
+        if len(dirs) > 1:
+            facets['category_lvl0'] = dirs[1]
+        if len(dirs) > 2:
+            facets['category_lvl1'] = f"{dirs[1]}/{dirs[2]}"
+        if len(dirs) > 3:
+            facets['course'] = '/'.join(dirs[:4])
+    elif dirs:
+        facets['course'] = dirs[0]
+    return facets
+
+
+def quote_filter_value(value: str) -> str:
+    """转义过滤表达式中的字符串值"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def facet_filter_conditions(
+    doc_type: Optional[str] = None,
+    category: Optional[str] = None,
+    course: Optional[str] = None
+) -> List[str]:
+    """把分面参数转换为过滤条件，分类包含 "/" 时按二级分类过滤"""
+    conditions = []
+    if doc_type:
+        conditions.append(f'type = {quote_filter_value(doc_type)}')
+    if category:
+        attribute = 'category_lvl1' if '/' in category else 'category_lvl0'
+        conditions.append(f'{attribute} = {quote_filter_value(category)}')
+    if course:
+        conditions.append(f'course = {quote_filter_value(course)}')
+    return conditions
+
+
+def date_filter_conditions(date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[str]:
+    """把 ISO 格式的日期范围转换为 last_modified 上的范围过滤条件"""
+    conditions = []
+    if date_from:
+        conditions.append(f'last_modified >= {int(datetime.fromisoformat(date_from).timestamp())}')
+    if date_to:
+        conditions.append(f'last_modified <= {int(datetime.fromisoformat(date_to).timestamp())}')
+    return conditions
 
 class MeiliSearchService:
     """MeiliSearch 搜索服务实现"""
@@ -31,21 +101,91 @@ class MeiliSearchService:
         
         # 客户端实例在初始化时不创建，而是在需要时异步创建
         self.client = None
+        self._index = None
         self.is_initialized = False
         
-        print(f"[INFO] MeiliSearch 服务初始化完成，主机: {self.host}")
+        # HTTP 连接池配置：整个进程共用一个长连接池，避免每次请求重新建立连接
+        self.http_timeout = int(os.environ.get("MEILI_HTTP_TIMEOUT", "10"))
+        self.http_max_connections = int(os.environ.get("MEILI_HTTP_MAX_CONNECTIONS", "50"))
+        self.http_max_keepalive = int(os.environ.get("MEILI_HTTP_MAX_KEEPALIVE", "20"))
+        self.http_keepalive_expiry = float(os.environ.get("MEILI_HTTP_KEEPALIVE_EXPIRY", "60"))
+        
+        # 已索引文件清单，用于增量同步
+        self.manifest = IndexManifest(os.path.join(self.cache_dir, "meili_manifest.json"))
+        
+        # 索引构建流水线配置
+        self.batch_max_docs = int(os.environ.get("MEILI_BATCH_MAX_DOCS", "10000"))
+        self.batch_max_bytes = int(os.environ.get("MEILI_BATCH_MAX_BYTES", str(8 * 1024 * 1024)))
+        self.build_read_workers = int(os.environ.get("MEILI_BUILD_READ_WORKERS", "4"))
+        self.build_queue_size = int(os.environ.get("MEILI_BUILD_QUEUE_SIZE", "64"))
+        self.build_progress: Optional[Dict[str, Any]] = None
+        
+        # 搜索结果片段的裁剪长度（单词数）
+        self.snippet_crop_length = int(os.environ.get("MEILI_SNIPPET_CROP_LENGTH", "40"))
+        
+        # 查询结果缓存，键中包含索引版本，索引内容变化后旧结果自动失效
+        self.index_version = 0
+        self.query_cache = LRUCache(
+            capacity=int(os.environ.get("MEILI_QUERY_CACHE_SIZE", "1000")),
+            ttl=int(os.environ.get("MEILI_QUERY_CACHE_TTL", "300"))
+        )
+        
+        logger.info("MeiliSearch 服务初始化完成，主机: %s", self.host)
     
     async def get_client(self):
         """获取或创建 MeiliSearch 客户端"""
         if self.client is None:
             try:
-                self.client = AsyncClient(self.host, self.api_key)
-                print(f"[INFO] MeiliSearch 客户端创建成功，连接到 {self.host}")
+                client = AsyncClient(self.host, self.api_key, timeout=self.http_timeout)
+                await self._configure_pool(client)
+                self.client = client
+                logger.info("MeiliSearch 客户端创建成功，连接到 %s", self.host)
             except Exception as e:
-                print(f"[ERROR] 连接 MeiliSearch 失败: {str(e)}")
+                logger.error("连接 MeiliSearch 失败: %s", e)
                 raise
         return self.client
     
+    async def _configure_pool(self, client):
+        """调整 SDK 内部 httpx 客户端的长连接池
+
+        SDK 的构造函数既不接受连接池参数，也不接受自建的 httpx 客户端，只能替换其传输层；
+        被替换的默认传输层先关闭，避免遗留连接池。SDK 或 httpx 的内部结构变化时保留默认连接池。
+        """
+        http_client = getattr(client, "http_client", None)
+        old_transport = getattr(http_client, "_transport", None)
+        if not isinstance(old_transport, httpx.AsyncBaseTransport):
+            logger.warning("无法调整 MeiliSearch 连接池参数，使用 httpx 默认连接池")
+            return
+        http_client._transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=self.http_max_connections,
+                max_keepalive_connections=self.http_max_keepalive,
+                keepalive_expiry=self.http_keepalive_expiry
+            )
+        )
+        await old_transport.aclose()
+    
+    async def get_index(self):
+        """获取缓存的索引句柄
+
+        client.index() 只在本地创建句柄，不像 client.get_index() 那样请求服务器，
+        句柄与客户端共用同一个连接池。
+        """
+        if self._index is None:
+            client = await self.get_client()
+            self._index = client.index(self.index_name)
+        return self._index
+    
+    async def close(self):
+        """关闭客户端，释放连接池（应用关闭时调用）"""
+        if self.client is not None:
+            try:
+                await self.client.aclose()
+            finally:
+                self.client = None
+                self._index = None
+                self.is_initialized = False
+    
     async def init_search_engine(self):
         """初始化搜索引擎，创建索引和设置设置"""
         if self.is_initialized:
@@ -61,226 +201,536 @@ class MeiliSearchService:
                 index_exists = any(index.uid == self.index_name for index in indexes)
             
             if not index_exists:
-                print(f"[INFO] 创建新索引: {self.index_name}")
+                logger.info("创建新索引: %s", self.index_name)
                 await client.create_index(self.index_name)
             
-            # 获取索引
-            index = await client.get_index(self.index_name)
-            print(f"获取到索引: {self.index_name}")
+            # 清理上次进程中断时遗留的影子索引
+            building = self.build_progress is not None and self.build_progress["finished_at"] is None
+            if not building:
+                for stale in indexes or []:
+                    if re.fullmatch(rf"{re.escape(self.index_name)}_\d+", stale.uid):
+                        logger.info("删除遗留的影子索引: %s", stale.uid)
+                        await client.delete_index_if_exists(stale.uid)
             
-            # 按照测试类的顺序设置属性
-            print("\n设置可过滤属性...")
-            await index.update_filterable_attributes(['type'])
+            # 获取索引
+            index = await self.get_index()
+            logger.debug("获取到索引: %s", self.index_name)
             
-            print("\n设置可排序属性...")
-            await index.update_sortable_attributes(['name'])
+            await self._configure_index(index)
             
             self.is_initialized = True
-            print(f"[INFO] MeiliSearch 索引设置完成")
+            logger.info("MeiliSearch 索引设置完成")
             
         except Exception as e:
-            print(f"[ERROR] 初始化 MeiliSearch 失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("初始化 MeiliSearch 失败: %s", e)
+    
+    async def _configure_index(self, index) -> List[int]:
+        """设置索引的可过滤、可排序和可搜索属性，返回设置任务的 ID"""
+        logger.info("设置索引属性: %s", index.uid)
+        tasks = [
+            await index.update_filterable_attributes(FACET_ATTRIBUTES + ['last_modified']),
+            await index.update_sortable_attributes(list(SORT_ATTRIBUTES.values())),
+            # 章节标题的权重高于正文
+            await index.update_searchable_attributes(['name', 'heading', 'headings', 'content', 'path'])
+        ]
+        return [task.task_uid for task in tasks]
+    
+    async def _create_shadow_index(self):
+        """创建影子索引并一次性完成设置，之后写入的文档不会因设置变化而重新索引"""
+        client = await self.get_client()
+        shadow_uid = f"{self.index_name}_{int(time.time())}"
+        await client.delete_index_if_exists(shadow_uid)
+        shadow_index = await client.create_index(shadow_uid, primary_key='id')
+        task_results = await self._wait_for_tasks(await self._configure_index(shadow_index))
+        failed = [r for r in task_results.values() if r.get("status") != "succeeded"]
+        if failed:
+            raise RuntimeError(f"设置影子索引 {shadow_uid} 失败: {failed[0].get('error')}")
+        return shadow_index
+    
+    async def _swap_shadow_index(self, shadow_uid: str):
+        """原子交换影子索引和线上索引，然后删除交换后的旧索引"""
+        client = await self.get_client()
+        task = await client.swap_indexes([(self.index_name, shadow_uid)])
+        result = (await self._wait_for_tasks([task.task_uid])).get(task.task_uid, {})
+        if result.get("status") != "succeeded":
+            raise RuntimeError(f"交换索引失败: {result.get('error')}")
+        # 交换后 shadow_uid 中是旧的文档
+        await client.delete_index_if_exists(shadow_uid)
+    
+    def _query_cache_key(self, kind: str, q: str, **params) -> str:
+        """生成查询缓存键：规范化关键词（去首尾空白、合并空白、小写）和参数"""
+        normalized_q = ' '.join(q.split()).lower()
+        return json.dumps([self.index_version, kind, normalized_q, params], ensure_ascii=False, sort_keys=True)
     
+    async def bump_index_version(self):
+        """索引内容发生变化后调用，使查询缓存失效"""
+        self.index_version += 1
+        await self.query_cache.clear()
+    
+    async def get_query_cache_stats(self) -> Dict[str, Any]:
+        """获取查询缓存统计（命中率等）"""
+        stats = await self.query_cache.get_stats()
+        stats["index_version"] = self.index_version
+        return stats
+    
+    @staticmethod
+    def _parse_highlighted(formatted: str):
+        """把带高亮标记的片段转换为纯文本和高亮区间 [[起始位置, 长度], ...]"""
+        text_parts = []
+        highlights = []
+        position = 0
+        for i, part in enumerate(formatted.split(HIGHLIGHT_PRE_TAG)):
+            if i > 0 and HIGHLIGHT_POST_TAG in part:
+                highlighted, rest = part.split(HIGHLIGHT_POST_TAG, 1)
+                highlights.append([position, len(highlighted)])
+                text_parts.append(highlighted)
+                position += len(highlighted)
+                part = rest
+            text_parts.append(part)
+            position += len(part)
+        return ''.join(text_parts), highlights
+
     def _generate_safe_id(self, file_path: str) -> str:
         """生成安全的文档ID"""
         # 使用文件路径的MD5作为ID
         return hashlib.md5(file_path.encode()).hexdigest()
 
-    async def build_index(self):
-        """构建搜索索引"""
-        await self.init_search_engine()
+    async def _read_text(self, file_path: str) -> str:
+        """读取文本文件，UTF-8 解码失败时回退到 GBK"""
+        try:
+            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
+                return await f.read()
+        except UnicodeDecodeError:
+            async with aiofiles.open(file_path, 'r', encoding='gbk') as f:
+                return await f.read()
+
+    async def build_documents(self, file_path: str) -> List[Dict[str, Any]]:
+        """为单个文件生成待索引的文档，不支持的文件类型返回空列表"""
+        rel_path = os.path.relpath(file_path, self.docs_dir).replace('\\', '/')
+        file_ext = os.path.splitext(file_path)[1][1:].lower()
+        file_name = os.path.basename(file_path)
+        
+        # 简化文档结构
+        document = {
+            'id': self._generate_safe_id(rel_path),
+            'path': rel_path,
+            'name': file_name,
+            'type': file_ext,
+            'last_modified': int(os.path.getmtime(file_path)),
+            **path_facets(rel_path)
+        }
+        
+        # 处理 Markdown 文件：按标题拆分为章节，每个章节作为独立文档索引
+        if file_ext == 'md':
+            content = await self._read_text(file_path)
+            documents = []
+            for section in split_markdown_sections(content):
+                # 前言部分（第一个标题之前）使用文档路径，标题章节的锚点不会为空
+                doc_key = f"{rel_path}#{section['anchor']}" if section['level'] else rel_path
+                documents.append({
+                    **document,
+                    'id': self._generate_safe_id(doc_key),
+                    'heading': section['heading'],
+                    'headings': section['headings'],
+                    'anchor': section['anchor'],
+                    'line': section['line'],
+                    'content': section['content']
+                })
+            return documents or [{**document, 'content': ''}]
         
-        print(f"[DEBUG] 开始构建 MeiliSearch 索引，文档目录: {self.docs_dir}")
-        
-        # 使用异步方式收集文件
-        async def collect_files():
-            all_files = []
-            for root, _, files in os.walk(self.docs_dir):
-                for file in files:
-                    if file.startswith('.'):  # 跳过隐藏文件
-                        continue
-                    file_path = os.path.join(root, file)
-                    all_files.append(file_path)
-            return all_files
-        
-        # 异步处理单个文件
-        async def process_file(file_path: str):
+        # 处理 PDF 文件
+        if file_ext == 'pdf':
+            document['content'] = file_name  # 只索引文件名
+            return [document]
+        
+        return []
+
+    def _split_batches(self, documents: List[Dict[str, Any]]):
+        """按文档数和 JSON 负载字节数切分批次"""
+        batch, batch_bytes = [], 0
+        for doc in documents:
+            doc_bytes = len(json.dumps(doc, ensure_ascii=False).encode('utf-8'))
+            if batch and (len(batch) >= self.batch_max_docs or batch_bytes + doc_bytes > self.batch_max_bytes):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(doc)
+            batch_bytes += doc_bytes
+        if batch:
+            yield batch
+
+    async def _wait_for_tasks(self, task_uids: List[int], timeout: Optional[float] = None) -> Dict[int, Dict[str, Any]]:
+        """批量等待多个任务完成
+
+        通过 GET /tasks?uids=... 一次查询一批任务的状态，只轮询尚未结束的任务，
+        轮询间隔逐步加大，避免逐个任务忙等。
+
+        Returns:
+            {task_uid: {"status": ..., "error": ...}}
+        """
+        results: Dict[int, Dict[str, Any]] = {}
+        pending = list(task_uids)
+        if not pending:
+            return results
+        
+        client = await self.get_client()
+        interval = 0.05
+        deadline = time.time() + timeout if timeout else None
+        while pending:
+            still_pending = []
+            for i in range(0, len(pending), 200):
+                chunk = pending[i:i + 200]
+                response = await client.http_client.get(
+                    "tasks",
+                    params={"uids": ",".join(str(uid) for uid in chunk), "limit": len(chunk)}
+                )
+                response.raise_for_status()
+                seen = set()
+                for task in response.json().get("results", []):
+                    seen.add(task["uid"])
+                    if task["status"] in ("enqueued", "processing"):
+                        still_pending.append(task["uid"])
+                    else:
+                        results[task["uid"]] = {"status": task["status"], "error": task.get("error")}
+                # 查询不到的任务（例如已被清理）视为失败
+                for uid in chunk:
+                    if uid not in seen:
+                        results[uid] = {"status": "unknown", "error": "task not found"}
+            
+            pending = still_pending
+            if self.build_progress is not None:
+                self.build_progress["tasks_pending"] = len(pending)
+            if not pending:
+                break
+            if deadline and time.time() > deadline:
+                for uid in pending:
+                    results[uid] = {"status": "timeout", "error": "等待任务超时"}
+                break
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, 1.0)
+        return results
+
+    async def _scan_files(self):
+        """逐个目录扫描文档目录的异步生成器，目录列表在线程池中读取，不一次性收集全部路径"""
+        loop = asyncio.get_event_loop()
+
+        def list_dir(dir_path: str):
+            sub_dirs, files = [], []
             try:
-                rel_path = os.path.relpath(file_path, self.docs_dir).replace('\\', '/')
-                file_ext = os.path.splitext(file_path)[1][1:].lower()
-                file_name = os.path.basename(file_path)
-                
-                # 使用安全的ID
-                doc_id = self._generate_safe_id(rel_path)
-                
-                # 简化文档结构
-                document = {
-                    'id': doc_id,
-                    'path': rel_path,
-                    'name': file_name,
-                    'type': file_ext
-                }
-                
-                # 处理 Markdown 文件
-                if file_ext == 'md':
-                    try:
-                        async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-                            content = await f.read()
-                    except UnicodeDecodeError:
-                        async with aiofiles.open(file_path, 'r', encoding='gbk') as f:
-                            content = await f.read()
-                    document['content'] = content
-                    return document, 'md'
-                
-                # 处理 PDF 文件
-                elif file_ext == 'pdf':
-                    document['content'] = file_name  # 只索引文件名
-                    return document, 'pdf'
-                
-                return None, None
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if entry.name.startswith('.'):  # 跳过隐藏文件
+                            continue
+                        if entry.is_dir(follow_symlinks=True):
+                            sub_dirs.append(entry.path)
+                        else:
+                            files.append(entry.path)
+            except OSError as e:
+                logger.warning("扫描目录失败 %s: %s", dir_path, e)
+            return sub_dirs, files
+
+        stack = [self.docs_dir]
+        while stack:
+            sub_dirs, files = await loop.run_in_executor(None, list_dir, stack.pop())
+            stack.extend(sub_dirs)
+            for file_path in files:
+                yield file_path
+
+    async def _retry_files(self, index, rel_paths: Set[str]) -> Tuple[Dict[str, Dict[str, Any]], int]:
+        """重新读取并写入构建时失败的文件，返回 (清单条目, 文档数)；仍有文件失败时抛出 RuntimeError"""
+        logger.warning("%s 个文件写入影子索引失败，重试一次", len(rel_paths))
+        entries, documents, errors = {}, [], []
+        for rel_path in sorted(rel_paths):
+            file_path = os.path.join(self.docs_dir, rel_path)
+            if not os.path.exists(file_path):
+                # 构建期间被删除的文件，切换后的增量同步会处理
+                continue
+            try:
+                file_documents = await self.build_documents(file_path)
             except Exception as e:
-                print(f"[ERROR] 处理文件 {file_path} 时出错: {e}")
-                return None, None
-        
-        # 异步处理文件批次
-        async def process_batch(batch_files, batch_index, total_batches):
-            batch_start_time = time.time()
-            batch_documents = []
-            md_count = pdf_count = error_count = 0
-            
-            # 并行处理批次中的文件
-            tasks = [process_file(file_path) for file_path in batch_files]
-            results = await asyncio.gather(*tasks)
-            
-            for doc, doc_type in results:
-                if doc is not None:
-                    batch_documents.append(doc)
-                    if doc_type == 'md':
-                        md_count += 1
-                    elif doc_type == 'pdf':
-                        pdf_count += 1
-                else:
-                    error_count += 1
-            
-            if batch_documents:
+                errors.append(f"{rel_path}: {e}")
+                continue
+            if file_documents:
+                entries[rel_path] = IndexManifest.make_entry(file_path, file_documents)
+                documents.extend(file_documents)
+
+        task_uids = []
+        if not errors:
+            try:
+                for batch in self._split_batches(documents):
+                    task = await index.add_documents(batch)
+                    task_uids.append(task.task_uid)
+            except Exception as e:
+                errors.append(str(e))
+        for task_uid, task_result in (await self._wait_for_tasks(task_uids)).items():
+            if task_result["status"] != "succeeded":
+                errors.append(f"任务 {task_uid}: {task_result.get('error')}")
+        if errors:
+            raise RuntimeError(
+                f"{len(rel_paths)} 个文件写入影子索引失败，重试后仍失败，保留当前的线上索引: {'; '.join(errors[:5])}"
+            )
+        return entries, len(documents)
+
+    def _new_build_progress(self) -> Dict[str, Any]:
+        """创建新的索引构建进度记录"""
+        return {
+            "state": "creating_index",
+            "shadow_index": None,
+            "started_at": time.time(),
+            "finished_at": None,
+            "files_discovered": 0,
+            "files_processed": 0,
+            "markdown_files": 0,
+            "pdf_files": 0,
+            "documents_uploaded": 0,
+            "bytes_uploaded": 0,
+            "batches_uploaded": 0,
+            "documents_indexed": 0,
+            "tasks_pending": 0,
+            "errors": 0,
+            "retried_files": 0,
+            "error_message": None,
+            "docs_per_second": 0.0
+        }
+
+    def get_build_progress(self) -> Optional[Dict[str, Any]]:
+        """获取最近一次索引构建的进度"""
+        if self.build_progress is None:
+            return None
+        progress = dict(self.build_progress)
+        end_time = progress["finished_at"] or time.time()
+        progress["elapsed_seconds"] = round(end_time - progress["started_at"], 2)
+        return progress
+
+    async def build_index(self):
+        """构建搜索索引
+
+        采用流式的生产者/消费者流水线，内存占用只与队列长度和批次大小有关，与文档库规模无关:
+        目录扫描 -> 有界路径队列 -> 多个读取协程 -> 有界文档队列 -> 批次组装 -> 上传
+        每个队列都有容量上限，下游变慢时上游会在 put 处等待（背压）。
+        上传只提交任务，MeiliSearch 在后台按顺序处理，全部提交后再统一等待所有任务。
+
+        文档写入影子索引 documents_<时间戳>，线上索引在构建期间不受影响；全部任务完成后
+        用 swap_indexes 原子交换并删除旧索引，构建失败时只删除影子索引。
+        读取或写入失败的文件重试一次，仍有文件失败时放弃交换，避免这些文件从线上索引中消失。
+        """
+        await self.init_search_engine()
+
+        logger.debug("开始构建 MeiliSearch 索引，文档目录: %s", self.docs_dir)
+
+        # 记录成功写入索引的文件，构建完成后作为增量索引的基线清单
+        manifest_entries = {}
+        # 已提交但尚未确认完成的任务: {task_uid: (批次内文件的清单条目, 文档数)}
+        pending_tasks = {}
+        # 读取或写入失败、需要重试的文件（相对路径）
+        failed_files = set()
+        progress = self.build_progress = self._new_build_progress()
+
+        path_queue: asyncio.Queue = asyncio.Queue(maxsize=self.build_queue_size)
+        doc_queue: asyncio.Queue = asyncio.Queue(maxsize=self.build_queue_size)
+        batch_queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+
+        async def produce_paths():
+            """扫描文档目录，把文件路径放入有界队列"""
+            async for file_path in self._scan_files():
+                progress["files_discovered"] += 1
+                await path_queue.put(file_path)
+            for _ in range(self.build_read_workers):
+                await path_queue.put(None)
+
+        async def read_files():
+            """读取文件并生成文档"""
+            while True:
+                file_path = await path_queue.get()
+                if file_path is None:
+                    break
+                rel_path = os.path.relpath(file_path, self.docs_dir).replace('\\', '/')
                 try:
-                    print(f"\n处理批次 {batch_index + 1}/{total_batches}...")
-                    client = await self.get_client()
-                    index = await client.get_index(self.index_name)
-                    
-                    task = await index.add_documents(batch_documents)
-                    print(f"[DEBUG] 添加文档任务ID: {task.task_uid}")
-                    
-                    # 等待任务完成
-                    while True:
-                        task_info = await client.get_task(task.task_uid)
-                        if task_info.status != 'enqueued' and task_info.status != 'processing':
-                            break
-                        await asyncio.sleep(0.5)
-                    
-                    if task_info.status != 'succeeded':
-                        print(f"[ERROR] 添加文档任务失败: {task_info.error}")
-                        error_count += len(batch_documents)
-                    else:
-                        print(f"[INFO] 已添加 {len(batch_documents)} 个文档")
-                    
+                    documents = await self.build_documents(file_path)
+                    if documents:
+                        entry = IndexManifest.make_entry(file_path, documents)
+                        await doc_queue.put((rel_path, documents, entry))
                 except Exception as e:
-                    print(f"[ERROR] 处理批次失败: {str(e)}")
-                    error_count += len(batch_documents)
-            
-            batch_time = time.time() - batch_start_time
-            return {
-                'documents': len(batch_documents),
-                'md_count': md_count,
-                'pdf_count': pdf_count,
-                'errors': error_count,
-                'time': batch_time
-            }
+                    logger.error("处理文件 %s 时出错: %s", file_path, e)
+                    failed_files.add(rel_path)
+                    progress["errors"] += 1
+                finally:
+                    progress["files_processed"] += 1
+
+        async def assemble_batches():
+            """按文档数和字节数组装批次"""
+            batch, batch_files, batch_bytes = [], {}, 0
+            while True:
+                item = await doc_queue.get()
+                if item is None:
+                    break
+                rel_path, documents, entry = item
+                batch.extend(documents)
+                batch_files[rel_path] = entry
+                batch_bytes += sum(
+                    len(json.dumps(doc, ensure_ascii=False).encode('utf-8')) for doc in documents
+                )
+                if len(batch) >= self.batch_max_docs or batch_bytes >= self.batch_max_bytes:
+                    await batch_queue.put((batch, batch_files, batch_bytes))
+                    batch, batch_files, batch_bytes = [], {}, 0
+            if batch:
+                await batch_queue.put((batch, batch_files, batch_bytes))
+            await batch_queue.put(None)
+
+        async def upload_batches():
+            """流水线上传批次：只提交任务，不等待单个任务完成"""
+            while True:
+                item = await batch_queue.get()
+                if item is None:
+                    break
+                batch, batch_files, batch_bytes = item
+                try:
+                    task = await shadow_index.add_documents(batch)
+                except Exception as e:
+                    logger.error("提交批次失败: %s", e)
+                    failed_files.update(batch_files)
+                    progress["errors"] += len(batch_files)
+                    continue
+                
+                pending_tasks[task.task_uid] = (batch_files, len(batch))
+                progress["documents_uploaded"] += len(batch)
+                progress["bytes_uploaded"] += batch_bytes
+                progress["batches_uploaded"] += 1
+                elapsed = time.time() - progress["started_at"]
+                progress["docs_per_second"] = round(progress["documents_uploaded"] / elapsed, 2) if elapsed > 0 else 0.0
+                logger.info(
+                    "已提交批次 %s (任务ID: %s): %s 个文档 (%.1f KB), 进度 %s/%s 个文件, %s 文档/秒",
+                    progress['batches_uploaded'], task.task_uid, len(batch), batch_bytes / 1024,
+                    progress['files_processed'], progress['files_discovered'], progress['docs_per_second']
+                )
         
         # 主处理流程
+        shadow_index = None
+        swapped = False
         try:
-            # 收集文件
-            all_files = await collect_files()
-            total_files = len(all_files)
-            print(f"[INFO] 发现 {total_files} 个文件需要索引")
-            
-            # 分批处理，每批20个文件
-            batch_size = 20
-            batches = [all_files[i:i + batch_size] for i in range(0, len(all_files), batch_size)]
-            
-            # 并行处理批次，但限制并发数
-            max_concurrent_batches = 3  # 最多同时处理3个批次
-            semaphore = asyncio.Semaphore(max_concurrent_batches)
-            
-            async def process_batch_with_semaphore(batch, index, total):
-                async with semaphore:
-                    return await process_batch(batch, index, total)
-            
-            # 启动所有批次的处理
-            batch_tasks = [
-                process_batch_with_semaphore(batch, i, len(batches))
-                for i, batch in enumerate(batches)
+            shadow_index = await self._create_shadow_index()
+            progress["shadow_index"] = shadow_index.uid
+            progress["state"] = "running"
+            logger.info("文档写入影子索引: %s", shadow_index.uid)
+
+            readers = [asyncio.create_task(read_files()) for _ in range(self.build_read_workers)]
+            stages = [
+                asyncio.create_task(produce_paths()),
+                asyncio.create_task(assemble_batches()),
+                asyncio.create_task(upload_batches())
             ]
-            
-            # 等待所有批次完成
-            batch_results = await asyncio.gather(*batch_tasks)
-            
-            # 汇总结果
-            total_docs = sum(r['documents'] for r in batch_results)
-            total_md = sum(r['md_count'] for r in batch_results)
-            total_pdf = sum(r['pdf_count'] for r in batch_results)
-            total_errors = sum(r['errors'] for r in batch_results)
-            total_time = sum(r['time'] for r in batch_results)
-            
-            print(f"\n[INFO] 索引构建完成:")
-            print(f"总文件数: {total_docs}")
-            print(f"Markdown文件: {total_md}")
-            print(f"PDF文件: {total_pdf}")
-            print(f"错误数: {total_errors}")
-            print(f"总耗时: {total_time:.2f}秒")
-            
-            # 执行测试查询
-            print("\n[DEBUG] 执行测试查询...")
-            client = await self.get_client()
-            index = await client.get_index(self.index_name)
-            
-            # 获取索引统计
-            stats = await index.get_stats()
-            print(f"[DEBUG] 索引统计: {stats.model_dump()}")
-            
-            # 测试搜索
-            search_results = await index.search(
-                "",
-                limit=10,
-                offset=0,
-                attributes_to_retrieve=["id", "name", "type", "path"]
+
+            async def finish_reading():
+                await asyncio.gather(*readers)
+                await doc_queue.put(None)
+
+            try:
+                await asyncio.gather(finish_reading(), *stages)
+            except BaseException:
+                # 任一阶段失败或构建被取消时，停止整条流水线
+                for task in readers + stages:
+                    task.cancel()
+                raise
+
+            # 所有批次提交完成后统一等待 MeiliSearch 处理
+            progress["state"] = "waiting_for_tasks"
+            task_results = await self._wait_for_tasks(list(pending_tasks))
+            for task_uid, (batch_files, batch_docs) in pending_tasks.items():
+                task_result = task_results.get(task_uid, {})
+                if task_result.get("status") != "succeeded":
+                    logger.error("添加文档任务 %s 失败: %s", task_uid, task_result.get('error'))
+                    failed_files.update(batch_files)
+                    progress["errors"] += len(batch_files)
+                    continue
+                manifest_entries.update(batch_files)
+                progress["documents_indexed"] += batch_docs
+
+            if failed_files:
+                # 部分文件缺失的影子索引不能切换为线上索引，重试一次，仍失败时放弃本次构建
+                progress["state"] = "retrying"
+                retry_entries, retry_docs = await self._retry_files(shadow_index, failed_files)
+                manifest_entries.update(retry_entries)
+                progress["documents_indexed"] += retry_docs
+                progress["retried_files"] = len(failed_files)
+                progress["errors"] = 0
+
+            for rel_path in manifest_entries:
+                if rel_path.lower().endswith('.md'):
+                    progress["markdown_files"] += 1
+                else:
+                    progress["pdf_files"] += 1
+
+            # 影子索引构建完成，原子切换为线上索引
+            progress["state"] = "swapping"
+            await self._swap_shadow_index(shadow_index.uid)
+            swapped = True
+
+            progress["state"] = "completed"
+            progress["finished_at"] = time.time()
+            total_time = progress["finished_at"] - progress["started_at"]
+
+            logger.info(
+                "索引构建完成: 总文件数 %s, Markdown文件 %s, PDF文件 %s, 文档数 %s, 错误数 %s, 总耗时 %.2f秒",
+                len(manifest_entries), progress['markdown_files'], progress['pdf_files'],
+                progress['documents_indexed'], progress['errors'], total_time
             )
-            
-            print("\n[DEBUG] 索引中的前10条文档:")
-            for i, doc in enumerate(search_results.hits, 1):
-                print(f"{i}. {doc.get('name')} (类型: {doc.get('type')}, ID: {doc.get('id')}, 路径: {doc.get('path')})")
-            print(f"\n[DEBUG] 索引中总文档数: {search_results.estimated_total_hits}")
-            
+
+            # 保存文件清单，后续只需增量同步变化的文件
+            self.manifest.replace(manifest_entries)
+            await self.bump_index_version()
+
+            # 调试日志开启时执行测试查询，否则不产生额外的请求
+            if logger.isEnabledFor(logging.DEBUG):
+                index = await self.get_index()
+
+                # 获取索引统计
+                stats = await index.get_stats()
+                logger.debug("索引统计: %s", stats.model_dump())
+
+                # 测试搜索
+                search_results = await index.search(
+                    "",
+                    limit=10,
+                    offset=0,
+                    attributes_to_retrieve=["id", "name", "type", "path"]
+                )
+
+                for i, doc in enumerate(search_results.hits, 1):
+                    logger.debug("%s. %s (类型: %s, ID: %s, 路径: %s)",
+                                 i, doc.get('name'), doc.get('type'), doc.get('id'), doc.get('path'))
+                logger.debug("索引中总文档数: %s", search_results.estimated_total_hits)
+
             return {
-                "indexed_files": total_docs,
-                "markdown_files": total_md,
-                "pdf_files": total_pdf,
-                "errors": total_errors,
+                "indexed_files": len(manifest_entries),
+                "markdown_files": progress["markdown_files"],
+                "pdf_files": progress["pdf_files"],
+                "documents": progress["documents_indexed"],
+                "errors": progress["errors"],
                 "time_taken": total_time
             }
-            
+
         except Exception as e:
-            print(f"[ERROR] 构建索引时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            progress["state"] = "failed"
+            progress["error_message"] = str(e)
+            progress["finished_at"] = time.time()
+            logger.exception("构建索引时出错: %s", e)
             return {
                 "indexed_files": 0,
                 "errors": 1,
                 "error_message": str(e)
             }
-    
+        finally:
+            if progress["finished_at"] is None:
+                # 构建任务被取消
+                progress["state"] = "cancelled"
+                progress["finished_at"] = time.time()
+            # 构建失败或被取消时丢弃影子索引，线上索引保持不变
+            if shadow_index is not None and not swapped:
+                try:
+                    client = await self.get_client()
+                    await client.delete_index_if_exists(shadow_index.uid)
+                except Exception as e:
+                    logger.warning("删除影子索引 %s 失败: %s", shadow_index.uid, e)
+
     async def search(
         self, 
         q: str,
@@ -291,46 +741,95 @@ class MeiliSearchService:
         doc_type: Optional[str] = None,
         date_from: Optional[str] = None,
         date_to: Optional[str] = None,
+        category: Optional[str] = None,
+        course: Optional[str] = None,
+        use_cache: bool = True,
     ) -> Dict:
-        """搜索文档"""
+        """搜索文档，相同参数的查询直接返回缓存结果
+
+        结果中的 facet_distribution 为当前查询（含过滤条件）下各分面值的文档数，
+        由 MeiliSearch 在同一次查询中统计。
+        use_cache 为 False 时（熔断器半开探测）不读取缓存，必须真正请求 MeiliSearch。
+        """
+        if doc_type == 'all':
+            doc_type = None
+        if not sort_by or sort_by == 'relevance':
+            sort_by, sort_order = 'relevance', None
+        cache_key = self._query_cache_key(
+            'search', q, page=page, per_page=per_page, sort_by=sort_by, sort_order=sort_order,
+            doc_type=doc_type, date_from=date_from, date_to=date_to, category=category, course=course
+        )
+        with stage("cache"):
+            cached = await self.query_cache.get(cache_key) if use_cache else None
+        if cached is not None:
+            trace = current_trace()
+            if trace is not None:
+                trace.cache_hit = True
+            return cached
+        
         await self.init_search_engine()
         
-        client = await self.get_client()
-        index = await client.get_index(self.index_name)
+        index = await self.get_index()
         
         # 构建搜索选项
         search_options = {
             'limit': per_page,
             'offset': (page - 1) * per_page,
-            'attributes_to_retrieve': ["id", "name", "content", "type", "path"]  # 移除 last_modified
+            # 不取回完整正文，由 MeiliSearch 裁剪出命中附近的片段并标记命中位置
+            'attributes_to_retrieve': ["id", "name", "type", "path", "heading", "headings", "anchor", "line", "last_modified"],
+            'attributes_to_crop': ["content"],
+            'crop_length': self.snippet_crop_length,
+            'attributes_to_highlight': ["content"],
+            'highlight_pre_tag': HIGHLIGHT_PRE_TAG,
+            'highlight_post_tag': HIGHLIGHT_POST_TAG,
+            'show_matches_position': True,
+            'facets': FACET_ATTRIBUTES
         }
         
         # 构建排序规则
-        if sort_by and sort_by != 'relevance':
-            search_options['sort'] = [f'{sort_by}:{sort_order}']
+        if sort_by in SORT_ATTRIBUTES:
+            search_options['sort'] = [f'{SORT_ATTRIBUTES[sort_by]}:{sort_order}']
         
-        # 构建过滤条件
-        filter_conditions = []
-        
-        if doc_type and doc_type != 'all':
-            filter_conditions.append(f'type = "{doc_type}"')
+        # 构建过滤条件，日期范围由 MeiliSearch 直接过滤
+        filter_conditions = facet_filter_conditions(doc_type, category, course)
+        filter_conditions += date_filter_conditions(date_from, date_to)
         
         if filter_conditions:
             search_options['filter'] = ' AND '.join(filter_conditions)
         
         # 执行搜索
-        print(f"[DEBUG] MeiliSearch 搜索参数: q='{q}', 选项={search_options}")
+        logger.debug("MeiliSearch 搜索参数: q='%s', 选项=%s", q, search_options)
         try:
-            search_results = await index.search(q, **search_options)
+            with stage("engine"):
+                search_results = await index.search(q, **search_options)
         except Exception as e:
-            print(f"[ERROR] 使用MeiliSearch搜索失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("使用MeiliSearch搜索失败: %s", e)
             raise
         
         # 处理搜索结果
+        with stage("snippets"):
+            results = self._build_results(search_results.hits)
+        
+        # 构造分页信息
+        total = search_results.estimated_total_hits
+        total_pages = math.ceil(total / per_page) if total > 0 else 0
+        
+        result = {
+            "results": results,
+            "total": total,
+            "total_matches": total,  # MeiliSearch 不区分文档数和匹配数
+            "page": page,
+            "per_page": per_page,
+            "total_pages": total_pages,
+            "facet_distribution": search_results.facet_distribution or {}
+        }
+        await self.query_cache.put(cache_key, result)
+        return result
+    
+    def _build_results(self, hits: List[Dict]) -> List[Dict]:
+        """把命中结果转换为接口格式，正文片段使用 MeiliSearch 返回的裁剪和高亮"""
         results = []
-        for hit in search_results.hits:
+        for hit in hits:
             matches = []
             
             # 添加文件名匹配
@@ -340,79 +839,78 @@ class MeiliSearchService:
                 "line": 0
             })
             
-            # 添加内容匹配 (如果是 markdown)
-            if hit.get('type') == 'md' and hit.get('content'):
-                content = hit.get('content', '')
-                lines = content.split('\n')
-                
-                # 简单匹配前3个包含查询词的行
-                matched_lines = 0
-                for i, line in enumerate(lines, 1):
-                    if q.lower() in line.lower() and matched_lines < 2:
-                        context_start = max(0, i - 2)
-                        context_end = min(len(lines), i + 2)
-                        context = '\n'.join(lines[context_start:context_end])
-                        
-                        matches.append({
-                            "type": "content",
-                            "text": context,
-                            "line": i
-                        })
-                        matched_lines += 1
+            # 添加章节标题匹配
+            if hit.get('heading'):
+                matches.append({
+                    "type": "heading",
+                    "text": " > ".join(hit.get('headings') or [hit['heading']]),
+                    "line": hit.get('line', 0)
+                })
+            
+            # 添加内容匹配：使用 MeiliSearch 返回的裁剪片段，只有正文命中时才添加
+            matches_position = hit.get('_matchesPosition') or {}
+            formatted_content = (hit.get('_formatted') or {}).get('content')
+            if hit.get('type') == 'md' and 'content' in matches_position and formatted_content:
+                text, highlights = self._parse_highlighted(formatted_content)
+                matches.append({
+                    "type": "content",
+                    "text": text,
+                    "highlights": highlights,
+                    "line": hit.get('line', 0)
+                })
             
             # 不要添加空匹配结果
             if matches:
                 results.append({
+                    "id": hit.get('id', ''),
                     "path": hit.get('path', ''),
                     "name": hit.get('name', ''),
+                    "heading": hit.get('heading', ''),
+                    "headings": hit.get('headings', []),
+                    "anchor": hit.get('anchor', ''),
                     "matches": matches,
+                    "last_modified": datetime.fromtimestamp(hit.get('last_modified') or 0).isoformat(),
                     "relevance_score": 1.0  # MeiliSearch 不直接提供分数，使用默认值
                 })
-        
-        # 构造分页信息
-        total = search_results.estimated_total_hits
-        total_pages = math.ceil(total / per_page) if total > 0 else 0
-        
-        return {
-            "results": results,
-            "total": total,
-            "total_matches": total,  # MeiliSearch 不区分文档数和匹配数
-            "page": page,
-            "per_page": per_page,
-            "total_pages": total_pages
-        }
+        return results
     
     async def get_suggestions(
         self, 
         q: str, 
         limit: int = 5,
-        doc_type: Optional[str] = None
+        doc_type: Optional[str] = None,
+        use_cache: bool = True
     ) -> List[str]:
-        """获取搜索建议"""
+        """获取搜索建议，相同参数的查询直接返回缓存结果（use_cache 为 False 时不读取缓存）"""
+        if doc_type == 'all':
+            doc_type = None
+        cache_key = self._query_cache_key('suggest', q, limit=limit, doc_type=doc_type)
+        cached = await self.query_cache.get(cache_key) if use_cache else None
+        if cached is not None:
+            return cached
+        
         await self.init_search_engine()
         
-        client = await self.get_client()
-        index = await client.get_index(self.index_name)
+        index = await self.get_index()
         
         # 构建搜索选项
         search_options = {
             'limit': limit,
-            'attributes_to_retrieve': ["name", "headers"]
+            'attributes_to_retrieve': ["name", "heading"]
         }
         
         # 文档类型过滤
         if doc_type and doc_type != 'all':
-            search_options['filter'] = f'type = "{doc_type}"'
+            search_options['filter'] = facet_filter_conditions(doc_type)[0]
         
         # 执行搜索
         try:
-            print(f"[DEBUG] MeiliSearch 搜索建议参数: q='{q}', 选项={search_options}")
+            logger.debug("MeiliSearch 搜索建议参数: q='%s', 选项=%s", q, search_options)
             search_results = await index.search(q, **search_options)
         except Exception as e:
-            print(f"[ERROR] 获取搜索建议失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return []
+            logger.exception("获取搜索建议失败: %s", e)
+            # 交给调用方处理，以便计入熔断器
+            raise
         
         # 从结果中提取建议
         suggestions = []
@@ -422,12 +920,14 @@ class MeiliSearchService:
             if file_name and len(suggestions) < limit:
                 suggestions.append(file_name)
             
-            # 添加标题作为建议
-            for header in hit.get('headers', []):
-                if q.lower() in header.lower() and len(suggestions) < limit:
-                    suggestions.append(header)
+            # 添加章节标题作为建议
+            heading = hit.get('heading', '')
+            if heading and q.lower() in heading.lower() and heading not in suggestions and len(suggestions) < limit:
+                suggestions.append(heading)
         
-        return suggestions[:limit]
+        suggestions = suggestions[:limit]
+        await self.query_cache.put(cache_key, suggestions)
+        return suggestions
     
     async def check_status(self):
         """检查 MeiliSearch 服务状态"""
@@ -439,7 +939,7 @@ class MeiliSearchService:
                 health = await client.health()
                 status = health.status
             except Exception as e:
-                print(f"[ERROR] 检查MeiliSearch健康状态失败: {str(e)}")
+                logger.error("检查MeiliSearch健康状态失败: %s", e)
                 return {"status": "error", "error": f"健康检查失败: {str(e)}"}
             
             # 检查索引状态
@@ -453,11 +953,11 @@ class MeiliSearchService:
                 
                 if index_exists:
                     # 索引存在，获取统计信息
-                    index = await client.get_index(self.index_name)
+                    index = await self.get_index()
                     stats = await index.get_stats()
                     document_count = stats.number_of_documents
             except Exception as e:
-                print(f"[WARNING] 获取索引状态失败: {str(e)}")
+                logger.warning("获取索引状态失败: %s", e)
                 import traceback
                 traceback.print_exc()
             
@@ -467,26 +967,25 @@ class MeiliSearchService:
                 "document_count": document_count
             }
         except Exception as e:
-            print(f"[ERROR] 检查MeiliSearch状态时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("检查MeiliSearch状态时出错: %s", e)
             return {"status": "error", "error": str(e)}
     
     async def test_index_stats(self):
         """测试获取索引统计信息结构"""
         try:
-            client = await self.get_client()
-            index = await client.get_index(self.index_name)
+            index = await self.get_index()
             stats = await index.get_stats()
             
-            print(f"[DEBUG] Stats对象类型: {type(stats)}")
-            print(f"[DEBUG] Stats对象属性: {dir(stats)}")
-            print(f"[DEBUG] Stats对象字符串表示: {str(stats)}")
-            print(f"[DEBUG] Stats对象字典表示: {stats.model_dump()}")
+            logger.debug("Stats对象类型: %s", type(stats))
+            logger.debug("Stats对象属性: %s", dir(stats))
+            logger.debug("Stats对象字符串表示: %s", stats)
+            logger.debug("Stats对象字典表示: %s", stats.model_dump())
             
             return stats
         except Exception as e:
-            print(f"[ERROR] 测试获取索引统计信息失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return None 
\ No newline at end of file
+            logger.exception("测试获取索引统计信息失败: %s", e)
+            return None
+
+
+# 进程内共享的单例：所有路由和后台任务共用同一个客户端、连接池和索引句柄
+meili_search_service = MeiliSearchService()
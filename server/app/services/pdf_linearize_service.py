@@ -0,0 +1,170 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Set, Tuple
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:  # 未安装 PyMuPDF 时无法生成副本，但仍可使用已有的线性化副本
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+
+class PdfLinearizeService:
+    """PDF 线性化（Fast Web View）服务
+
+    将 PDF 预处理为线性化副本并保存在缓存目录中，线性化后的文件把第一页所需的
+    对象放在文件开头，PDF 查看器只需一次较小的范围请求即可渲染首页。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(PdfLinearizeService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        # 如果已经初始化过，直接返回
+        if hasattr(self, '_initialized'):
+            return
+        self._initialized = True
+
+        server_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        self.docs_dir = os.path.join(server_root, "static", "docs")
+        self.cache_dir = os.path.join(server_root, "static", "cache", "linearized")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # 是否启用后台线性化任务（默认关闭），未安装 PyMuPDF 时无法生成副本
+        self.enabled = os.environ.get("PDF_LINEARIZE_ENABLED", "false").lower() in ("1", "true", "yes")
+        self.available = fitz is not None
+        # 小于该大小的 PDF 整体下载已经足够快，不做线性化
+        self.min_size = int(os.environ.get("PDF_LINEARIZE_MIN_SIZE", str(2 * 1024 * 1024)))
+
+        # 正在处理中的文件，避免同一文件被重复线性化
+        self._pending: Set[str] = set()
+        # 已确认不需要（原文件已线性化）或无法生成副本的文件 -> 源文件 (mtime_ns, size)，
+        # 源文件不变时不再重复用 PyMuPDF 打开
+        self._skipped: Dict[str, Tuple[int, int]] = {}
+
+    def _cache_path(self, rel_path: str) -> str:
+        """线性化副本在缓存目录中的路径（保持与文档目录相同的结构）"""
+        return os.path.join(self.cache_dir, rel_path)
+
+    def get_linearized_path(self, rel_path: str) -> Optional[str]:
+        """返回有效的线性化副本路径，不存在或已过期时返回 None
+
+        只要缓存中存在有效副本就会使用（例如由离线工具生成），与是否启用后台任务无关
+        """
+        cache_path = self._cache_path(rel_path)
+        try:
+            cached_stat = os.stat(cache_path)
+            source_stat = os.stat(os.path.join(self.docs_dir, rel_path))
+        except OSError:
+            return None
+        # 生成副本时会把修改时间同步为源文件的修改时间，不一致说明源文件已更新
+        if int(cached_stat.st_mtime) != int(source_stat.st_mtime):
+            return None
+        return cache_path
+
+    def _linearize_sync(self, rel_path: str, force: bool = False) -> str:
+        """同步执行线性化，返回处理结果：linearized / skipped / fresh / error"""
+        source_path = os.path.join(self.docs_dir, rel_path)
+        cache_path = self._cache_path(rel_path)
+
+        try:
+            source_stat = os.stat(source_path)
+        except OSError:
+            return "error"
+
+        if source_stat.st_size < self.min_size:
+            return "skipped"
+        if not force and self.get_linearized_path(rel_path):
+            return "fresh"
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with fitz.open(source_path) as doc:
+                if doc.is_fast_webaccess:
+                    # 原文件已经是线性化的，无需生成副本
+                    self._skipped[rel_path] = (source_stat.st_mtime_ns, source_stat.st_size)
+                    return "skipped"
+                doc.save(tmp_path, garbage=3, deflate=True, linear=True)
+            # 同步修改时间，用于判断副本是否过期
+            os.utime(tmp_path, (source_stat.st_atime, source_stat.st_mtime))
+            os.replace(tmp_path, cache_path)
+            return "linearized"
+        except Exception as e:
+            logger.error("线性化PDF失败 %s: %s", rel_path, e)
+            self._skipped[rel_path] = (source_stat.st_mtime_ns, source_stat.st_size)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return "error"
+
+    async def linearize(self, rel_path: str, force: bool = False) -> str:
+        """在线程池中线性化单个 PDF"""
+        if not self.available:
+            return "skipped"
+        if rel_path in self._pending:
+            return "pending"
+        self._pending.add(rel_path)
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, self._linearize_sync, rel_path, force)
+        finally:
+            self._pending.discard(rel_path)
+
+    def schedule(self, rel_path: str):
+        """在后台为请求到的 PDF 生成线性化副本，不阻塞当前请求"""
+        if not (self.enabled and self.available) or rel_path in self._pending:
+            return
+        try:
+            source_stat = os.stat(os.path.join(self.docs_dir, rel_path))
+        except OSError:
+            return
+        # 小文件和已确认跳过的文件不提交任务，避免每次访问都重新打开
+        if source_stat.st_size < self.min_size:
+            return
+        if self._skipped.get(rel_path) == (source_stat.st_mtime_ns, source_stat.st_size):
+            return
+        asyncio.create_task(self.linearize(rel_path))
+
+    async def linearize_all(
+        self,
+        force: bool = False,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, int]:
+        """遍历文档目录，为所有需要的 PDF 生成线性化副本
+
+        Args:
+            force: 即使副本是最新的也重新生成
+            progress: 进度回调 (已处理数, 总数)，例如后台任务的 Job.report
+        """
+        result = {"linearized": 0, "skipped": 0, "fresh": 0, "pending": 0, "error": 0}
+        if not self.available:
+            logger.warning("未安装 PyMuPDF，无法生成线性化PDF")
+            return result
+
+        start_time = time.time()
+        # 先收集文件列表，以便报告总数和预计剩余时间
+        rel_paths = []
+        for root, _, files in os.walk(self.docs_dir):
+            for file in files:
+                if file.startswith('.') or not file.lower().endswith('.pdf'):
+                    continue
+                rel_paths.append(os.path.relpath(os.path.join(root, file), self.docs_dir).replace('\\', '/'))
+
+        for i, rel_path in enumerate(rel_paths, 1):
+            status = await self.linearize(rel_path, force=force)
+            result[status] += 1
+            if progress is not None:
+                progress(i, len(rel_paths))
+
+        logger.info(
+            "PDF线性化完成: 新生成 %d 个, 已是最新 %d 个, 跳过 %d 个, 失败 %d 个, 耗时 %.2f秒",
+            result['linearized'], result['fresh'], result['skipped'], result['error'], time.time() - start_time
+        )
+        return result
@@ -0,0 +1,376 @@
+import os
+import time
+import logging
+import asyncio
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.markdown_sections import split_markdown_sections
+from app.services.tokenizer import get_tokenizer
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # 未安装 numpy / scipy 时不提供相关阅读
+    np = None
+    sparse = None
+
+logger = logging.getLogger(__name__)
+
+
+class RelatedDocsService:
+    """相关阅读服务
+
+    离线为每个文档计算 TF-IDF 稀疏向量，用分块的稀疏矩阵乘法求余弦相似度，
+    把每个文档的前 N 个相邻文档保存为紧凑的查找表 (文档数 x N 的 int32 编号和 float16 得分)，
+    请求时只做一次字典查找。
+
+    文件变化后增量刷新: 只重新切分变化的文件，重新计算变化文档的相邻文档，
+    其余文档只需与变化的文档比较并合并到原有列表中；变化过多时全量重建。
+    """
+
+    # 标题和章节标题中的词比正文更能代表文档主题
+    TITLE_WEIGHT = 3
+    HEADING_WEIGHT = 2
+    TABLE_VERSION = 1
+
+    def __init__(
+        self,
+        docs_dir: str,
+        cache_dir: str,
+        top_n: int = 10,
+        min_score: float = 0.05,
+        max_df_ratio: float = 0.5,
+        full_rebuild_ratio: float = 0.2,
+        block_size: int = 256
+    ):
+        self.docs_dir = docs_dir
+        self.table_path = os.path.join(cache_dir, "related", "related.npz")
+        self.top_n = top_n
+        self.min_score = min_score                    # 相似度低于该值的文档不作为相关阅读
+        self.max_df_ratio = max_df_ratio              # 出现在超过该比例文档中的词视为停用词
+        self.full_rebuild_ratio = full_rebuild_ratio  # 变化的文档超过该比例时全量重建
+        self.block_size = block_size                  # 每次计算相似度的行数，控制稠密块的内存
+        self.available = np is not None
+        self.tokenizer = get_tokenizer()
+
+        # (查找表, 路径 -> 行号) 作为一个元组整体替换，请求线程读取时不会拿到新旧混合的数据
+        self._state: Optional[Tuple[Dict[str, Any], Dict[str, int]]] = None
+        self._dirty = False
+        self._refresh_lock = threading.Lock()
+        self.built_at: Optional[float] = None
+
+        if self.available:
+            self.load()
+
+    @property
+    def _table(self) -> Optional[Dict[str, Any]]:
+        state = self._state
+        return state[0] if state else None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._state is not None
+
+    def load(self):
+        """加载查找表"""
+        if not os.path.exists(self.table_path):
+            return
+        try:
+            with np.load(self.table_path) as data:
+                if int(data['version']) != self.TABLE_VERSION or str(data['tokenizer']) != self.tokenizer.name:
+                    logger.warning("相关阅读查找表的格式或分词器已变化，需要重建")
+                    return
+                table = {key: data[key] for key in data.files}
+            table['paths'] = table['paths'].tolist()
+            table['terms'] = table['terms'].tolist()
+            table['tf'] = sparse.csr_matrix(
+                (table.pop('tf_data'), table.pop('tf_indices'), table.pop('tf_indptr')),
+                shape=(len(table['paths']), len(table['terms']))
+            )
+            self._set_table(table)
+            self.built_at = float(table['built_at'])
+            logger.info("相关阅读查找表加载完成: %d 个文档", len(table['paths']))
+        except Exception as e:
+            logger.error("加载相关阅读查找表失败: %s", e)
+
+    def _set_table(self, table: Dict[str, Any]):
+        positions = {path: i for i, path in enumerate(table['paths'])}
+        self._state = (table, positions)
+
+    def _save(self, table: Dict[str, Any]):
+        """原子写入查找表"""
+        os.makedirs(os.path.dirname(self.table_path), exist_ok=True)
+        tmp_path = f"{self.table_path}.tmp.npz"
+        tf = table['tf']
+        np.savez(
+            tmp_path,
+            version=np.int32(self.TABLE_VERSION),
+            tokenizer=np.array(self.tokenizer.name),
+            built_at=np.float64(table['built_at']),
+            paths=np.array(table['paths']),
+            mtimes=table['mtimes'],
+            sizes=table['sizes'],
+            terms=np.array(table['terms']),
+            tf_data=tf.data,
+            tf_indices=tf.indices,
+            tf_indptr=tf.indptr,
+            neighbors=table['neighbors'],
+            scores=table['scores']
+        )
+        os.replace(tmp_path, self.table_path)
+
+    def _scan(self) -> Dict[str, Tuple[float, int]]:
+        """扫描文档目录，返回 {相对路径: (修改时间, 大小)}"""
+        found = {}
+        for root, dirs, files in os.walk(self.docs_dir, followlinks=True):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for file_name in files:
+                if file_name.startswith('.') or not file_name.lower().endswith(('.md', '.pdf')):
+                    continue
+                file_path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                found[os.path.relpath(file_path, self.docs_dir).replace('\\', '/')] = (stat.st_mtime, stat.st_size)
+        return found
+
+    def _term_counts(self, rel_path: str) -> Counter:
+        """计算单个文档的加权词频：PDF 只有标题，Markdown 包括章节标题和正文"""
+        counts: Counter = Counter()
+
+        def add(text: str, weight: int):
+            for token in self.tokenizer.tokenize(text):
+                # 单字和纯数字区分度太低
+                if len(token) > 1 and not token.isdigit():
+                    counts[token] += weight
+
+        title = os.path.splitext(os.path.basename(rel_path))[0]
+        add(title, self.TITLE_WEIGHT)
+        if rel_path.lower().endswith('.md'):
+            file_path = os.path.join(self.docs_dir, rel_path)
+            try:
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                except UnicodeDecodeError:
+                    with open(file_path, 'r', encoding='gbk') as f:
+                        content = f.read()
+            except Exception as e:
+                logger.warning("读取文件 %s 失败: %s", rel_path, e)
+                return counts
+            for section in split_markdown_sections(content):
+                if section['heading']:
+                    add(section['heading'], self.HEADING_WEIGHT)
+                add(section['content'], 1)
+        return counts
+
+    def _normalized_tfidf(self, tf):
+        """由词频矩阵计算行归一化的 TF-IDF 矩阵，过滤只出现一次和过于常见的词"""
+        doc_count = tf.shape[0]
+        df = np.bincount(tf.indices, minlength=tf.shape[1])
+        idf = np.log((1 + doc_count) / (1 + df)) + 1.0
+        idf[(df < 2) | (df > max(2, self.max_df_ratio * doc_count))] = 0.0
+        matrix = tf.copy()
+        matrix.data = np.log1p(matrix.data) * idf[matrix.indices]
+        matrix.eliminate_zeros()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms) @ matrix
+
+    def _top_k(self, scores, exclude_rows=None):
+        """从稠密相似度块的每一行中选出前 top_n 个 (编号, 得分)，不足的位置编号为 -1"""
+        k = min(self.top_n, scores.shape[1])
+        if exclude_rows is not None:
+            scores[np.arange(len(exclude_rows)), exclude_rows] = -1.0
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k else np.zeros((len(scores), 0), dtype=np.int64)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        neighbors = np.full((len(scores), self.top_n), -1, dtype=np.int32)
+        result_scores = np.zeros((len(scores), self.top_n), dtype=np.float16)
+        keep = top_scores >= self.min_score
+        neighbors[:, :k] = np.where(keep, top, -1)
+        result_scores[:, :k] = np.where(keep, top_scores, 0)
+        return neighbors, result_scores
+
+    def _neighbors_for_rows(self, matrix, rows) -> Tuple[Any, Any]:
+        """分块计算指定行与全部文档的相似度，返回这些行的相邻文档"""
+        neighbors = np.full((len(rows), self.top_n), -1, dtype=np.int32)
+        scores = np.zeros((len(rows), self.top_n), dtype=np.float16)
+        transposed = matrix.T.tocsc()
+        for start in range(0, len(rows), self.block_size):
+            block_rows = rows[start:start + self.block_size]
+            block = (matrix[block_rows] @ transposed).toarray()
+            neighbors[start:start + len(block_rows)], scores[start:start + len(block_rows)] = \
+                self._top_k(block, exclude_rows=block_rows)
+        return neighbors, scores
+
+    def _build_table(self, files: Dict[str, Tuple[float, int]], old: Optional[Dict[str, Any]],
+                     progress: Optional[Callable[[int, int], None]]) -> Dict[str, Any]:
+        """构建新的查找表；old 不为空时只重新切分和计算变化的文档"""
+        paths = sorted(files)
+        old_positions = {p: i for i, p in enumerate(old['paths'])} if old else {}
+        changed = [
+            i for i, p in enumerate(paths)
+            if p not in old_positions
+            or (old['mtimes'][old_positions[p]], old['sizes'][old_positions[p]]) != files[p]
+        ]
+        removed = len(old_positions) - (len(paths) - sum(1 for i in changed if paths[i] not in old_positions))
+        if old is not None and not changed and not removed:
+            return old
+        incremental = old is not None and len(changed) + removed <= self.full_rebuild_ratio * max(1, len(old_positions))
+
+        # 词表只追加，未变化文档的词频行直接复用
+        terms: List[str] = list(old['terms']) if old else []
+        term_ids = {term: i for i, term in enumerate(terms)}
+        changed_set = set(changed)
+        rows, cols, values = [], [], []
+        for done, i in enumerate(changed, 1):
+            for term, count in self._term_counts(paths[i]).items():
+                col = term_ids.get(term)
+                if col is None:
+                    col = term_ids[term] = len(terms)
+                    terms.append(term)
+                rows.append(i)
+                cols.append(col)
+                values.append(count)
+            if progress is not None:
+                progress(done, len(changed))
+        fresh = sparse.csr_matrix((np.array(values, dtype=np.float32), (rows, cols)), shape=(len(paths), len(terms)))
+
+        if old is not None:
+            # 未变化文档从旧矩阵中按新顺序取出对应的行
+            kept = [i for i in range(len(paths)) if i not in changed_set]
+            old_tf = old['tf']
+            old_tf = sparse.csr_matrix((old_tf.data, old_tf.indices, old_tf.indptr), shape=(old_tf.shape[0], len(terms)))
+            selector = sparse.csr_matrix(
+                (np.ones(len(kept), dtype=np.float32), (kept, [old_positions[paths[i]] for i in kept])),
+                shape=(len(paths), old_tf.shape[0])
+            )
+            tf = (fresh + selector @ old_tf).tocsr()
+        else:
+            tf = fresh
+
+        matrix = self._normalized_tfidf(tf).tocsr()
+        if not incremental:
+            neighbors, scores = self._neighbors_for_rows(matrix, np.arange(len(paths)))
+        else:
+            neighbors = np.full((len(paths), self.top_n), -1, dtype=np.int32)
+            scores = np.zeros((len(paths), self.top_n), dtype=np.float16)
+            changed_rows = np.array(changed, dtype=np.int64)
+            if len(changed_rows):
+                neighbors[changed_rows], scores[changed_rows] = self._neighbors_for_rows(matrix, changed_rows)
+
+            # 未变化的文档：旧列表中去掉已删除和已变化的文档，再与变化的文档比较后合并
+            remap = np.full(len(old['paths']) + 1, -1, dtype=np.int64)  # 最后一位对应编号 -1
+            for i, p in enumerate(paths):
+                if i not in changed_set and p in old_positions:
+                    remap[old_positions[p]] = i
+            kept_rows = np.array(kept, dtype=np.int64)
+            changed_t = matrix[changed_rows].T.tocsc() if len(changed_rows) else None
+            for start in range(0, len(kept_rows), self.block_size):
+                block_rows = kept_rows[start:start + self.block_size]
+                old_rows = np.array([old_positions[paths[i]] for i in block_rows])
+                old_neighbors = remap[old['neighbors'][old_rows]]
+                old_scores = np.where(old_neighbors >= 0, old['scores'][old_rows].astype(np.float32), -1.0)
+                if changed_t is not None:
+                    new_scores = (matrix[block_rows] @ changed_t).toarray()
+                    candidates = np.hstack([old_neighbors, np.broadcast_to(changed_rows, new_scores.shape)])
+                    candidate_scores = np.hstack([old_scores, new_scores])
+                else:
+                    candidates, candidate_scores = old_neighbors, old_scores
+                top, top_scores = self._top_k(candidate_scores)
+                valid = top >= 0
+                neighbors[block_rows] = np.where(valid, np.take_along_axis(candidates, np.maximum(top, 0), axis=1), -1)
+                scores[block_rows] = np.where(valid, top_scores, 0)
+
+        return {
+            'built_at': time.time(),
+            'paths': paths,
+            'mtimes': np.array([files[p][0] for p in paths], dtype=np.float64),
+            'sizes': np.array([files[p][1] for p in paths], dtype=np.int64),
+            'terms': terms,
+            'tf': tf,
+            'neighbors': neighbors,
+            'scores': scores,
+            'incremental': incremental,
+            'changed': len(changed),
+            'removed': removed
+        }
+
+    def _refresh_sync(self, full: bool = False, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        with self._refresh_lock:
+            start_time = time.time()
+            old = None if full else self._table
+            table = self._build_table(self._scan(), old, progress)
+            if table is old:
+                return {"documents": len(old['paths']), "changed": 0, "removed": 0, "incremental": True, "time_taken": 0.0}
+            self._save(table)
+            self._set_table(table)
+            self.built_at = table['built_at']
+            result = {
+                "documents": len(table['paths']),
+                "changed": table['changed'],
+                "removed": table['removed'],
+                "incremental": table['incremental'],
+                "time_taken": round(time.time() - start_time, 2)
+            }
+            logger.info("相关阅读查找表已更新: %s", result)
+            return result
+
+    async def refresh(self, full: bool = False, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """在线程池中刷新查找表（未变化时直接返回）"""
+        if not self.available:
+            raise RuntimeError("未安装 numpy / scipy，无法计算相关阅读")
+        self._dirty = False
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._refresh_sync, full, progress)
+
+    def mark_dirty(self, file_path: str = None):
+        """文档发生变化时调用（可在文件监视器线程中调用）"""
+        self._dirty = True
+
+    async def run_watch_loop(self, submit: Callable[[], Any], interval: float = 60.0):
+        """定期检查是否有文档变化，有变化时通过 submit 提交增量刷新任务"""
+        while True:
+            await asyncio.sleep(interval)
+            if self._dirty:
+                self._dirty = False
+                submit()
+
+    def get_related(self, rel_path: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """查找文档的相关阅读"""
+        state = self._state
+        if state is None:
+            return []
+        table, positions = state
+        position = positions.get(rel_path.strip('/'))
+        if position is None or position >= len(table['paths']):
+            return []
+        related = []
+        for neighbor, score in zip(table['neighbors'][position], table['scores'][position]):
+            if neighbor < 0 or len(related) >= limit:
+                break
+            path = table['paths'][neighbor]
+            related.append({
+                "path": path,
+                "name": os.path.splitext(os.path.basename(path))[0],
+                "score": round(float(score), 3)
+            })
+        return related
+
+    def get_stats(self) -> Dict[str, Any]:
+        table = self._table
+        return {
+            "available": self.available,
+            "ready": self.is_ready,
+            "documents": len(table['paths']) if table else 0,
+            "terms": len(table['terms']) if table else 0,
+            "top_n": self.top_n,
+            "built_at": self.built_at
+        }
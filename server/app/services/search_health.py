@@ -0,0 +1,167 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SearchHealthMonitor:
+    """MeiliSearch 健康监控与熔断器
+
+    后台任务定期调用 check_status() 刷新缓存的状态，请求路径只读取内存中的状态，
+    不产生额外的网络往返。搜索失败会计入熔断器：连续失败达到阈值后熔断打开，
+    在冷却时间内直接拒绝请求；冷却结束后进入半开状态，只放行一个探测请求。
+    探测请求被取消或超过 probe_timeout 仍未结束时，视为探测结束，可以放行新的探测。
+
+    allow_request() 返回请求令牌，只有持有当前探测令牌的请求才能关闭熔断器或释放探测名额，
+    熔断前发出、熔断后才结束的慢请求不会影响半开状态。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        meili_service,
+        interval: float = 30.0,
+        retry_interval: float = 5.0,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        probe_timeout: float = 10.0
+    ):
+        self.meili_service = meili_service
+        self.interval = interval                    # 服务正常时的检查间隔
+        self.retry_interval = retry_interval        # 服务异常时的检查间隔
+        self.failure_threshold = failure_threshold  # 连续失败多少次后熔断
+        self.reset_timeout = reset_timeout          # 熔断后多久进入半开状态
+        self.probe_timeout = probe_timeout          # 半开探测请求的最长时间
+
+        self.status: Dict[str, Any] = {"status": "unknown"}
+        self.last_checked: Optional[float] = None
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._probe_token: Optional[object] = None
+        self._probe_started_at: Optional[float] = None
+
+        self._refresh_event = asyncio.Event()
+
+    @property
+    def is_available(self) -> bool:
+        """最近一次健康检查是否成功（状态未知时视为可用，交给熔断器判断）"""
+        return self.status.get("status") in ("available", "unknown")
+
+    def allow_request(self) -> Optional[object]:
+        """判断当前是否允许请求 MeiliSearch，不产生网络请求
+
+        Returns:
+            请求令牌（结束时传给 record_success / record_failure / release_probe），不允许时返回 None
+        """
+        if self.state == self.OPEN:
+            if time.time() - self.opened_at < self.reset_timeout:
+                return None
+            # 冷却结束，进入半开状态放行一个探测请求
+            self.state = self.HALF_OPEN
+            self._probe_token = None
+
+        if self.state == self.HALF_OPEN:
+            if self._probe_token is not None and not self._probe_expired():
+                return None
+            self._probe_token = object()
+            self._probe_started_at = time.time()
+            return self._probe_token
+
+        return object() if self.is_available else None
+
+    def is_probe(self, token: Optional[object]) -> bool:
+        """令牌是否为当前的半开探测（探测结果不能来自查询缓存）"""
+        return token is not None and token is self._probe_token
+
+    def _probe_expired(self) -> bool:
+        return self._probe_started_at is None or time.time() - self._probe_started_at >= self.probe_timeout
+
+    def release_probe(self, token: Optional[object]):
+        """请求结束时调用（放在 finally 中）：探测请求被取消、没有记录成功或失败时释放探测名额"""
+        if self.is_probe(token):
+            self._probe_token = None
+
+    def record_success(self, token: Optional[object]):
+        """记录一次成功的请求：探测成功时关闭熔断器，其他请求只在熔断器关闭时清零失败计数"""
+        if self.is_probe(token):
+            self._close()
+        elif self.state == self.CLOSED:
+            self.consecutive_failures = 0
+
+    def _close(self):
+        self.consecutive_failures = 0
+        self._probe_token = None
+        if self.state != self.CLOSED:
+            logger.info("MeiliSearch 已恢复，熔断器关闭")
+        self.state = self.CLOSED
+        self.opened_at = None
+
+    def record_failure(self, error: Any = None, token: Optional[object] = None):
+        """记录一次失败的请求，达到阈值或半开状态下失败时打开熔断器，并立即触发健康检查"""
+        self.consecutive_failures += 1
+        self.release_probe(token)
+        if error is not None:
+            self.last_error = str(error)
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("MeiliSearch 连续失败 %s 次，熔断器打开", self.consecutive_failures)
+            self.state = self.OPEN
+            self.opened_at = time.time()
+        self._refresh_event.set()
+
+    async def refresh(self) -> Dict[str, Any]:
+        """执行一次健康检查并更新缓存的状态"""
+        try:
+            status = await self.meili_service.check_status()
+        except Exception as e:
+            status = {"status": "error", "error": str(e)}
+        self.status = status
+        self.last_checked = time.time()
+
+        if status.get("status") == "available":
+            if self.state == self.OPEN:
+                # 健康检查成功，允许半开探测而不必等满冷却时间
+                self.state = self.HALF_OPEN
+                self._probe_token = None
+            elif self.state == self.HALF_OPEN:
+                # 上一轮检查后没有完成的探测（没有请求或探测被取消），由健康检查关闭熔断器
+                if self._probe_token is None or self._probe_expired():
+                    self._close()
+            elif self.state == self.CLOSED:
+                self.consecutive_failures = 0
+        else:
+            self.record_failure(status.get("error", status.get("status")))
+            # record_failure 会设置刷新事件，这里清除以免立即重复检查
+            self._refresh_event.clear()
+        return status
+
+    async def run(self):
+        """后台循环：按间隔刷新状态，搜索失败时提前刷新"""
+        while True:
+            await self.refresh()
+            interval = self.interval if self.status.get("status") == "available" else self.retry_interval
+            try:
+                await asyncio.wait_for(self._refresh_event.wait(), timeout=interval)
+                # 失败触发的刷新也至少间隔 retry_interval，避免对故障服务频繁探测
+                await asyncio.sleep(self.retry_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refresh_event.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回缓存的状态和熔断器信息"""
+        return {
+            **self.status,
+            "circuit_state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "last_checked": self.last_checked
+        }
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.logging_config import queued_handler
+
+logger = logging.getLogger(__name__)
+
+# 固定的延迟分桶上界（毫秒），最后一个桶收集所有更慢的请求
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class LatencyHistogram:
+    """固定分桶的延迟直方图
+
+    每次记录只做一次二分查找和计数加一，内存占用与请求数无关；
+    分位数在命中的桶内线性插值估算，精度取决于分桶的粒度。
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float):
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        """估算分位数（q 取 0~1）"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                # 桶的上界不超过实际观测到的最大值
+                upper = min(self.buckets[i], self.max_ms) if i < len(self.buckets) else self.max_ms
+                lower = min(self.buckets[i - 1], upper) if i > 0 else 0.0
+                return round(lower + (upper - lower) * (rank - seen) / count, 2)
+            seen += count
+        return round(self.max_ms, 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{bound:g}ms" for bound in self.buckets] + ["inf"]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else None,
+            "max_ms": round(self.max_ms, 2),
+            "p50_ms": self.percentile(0.5),
+            "p90_ms": self.percentile(0.9),
+            "p99_ms": self.percentile(0.99),
+            "buckets": dict(zip(labels, self.counts))
+        }
+
+
+class QueryTrace:
+    """单次搜索请求的各阶段耗时"""
+
+    def __init__(self, endpoint: str, query: str, params: Optional[Dict[str, Any]] = None):
+        self.endpoint = endpoint
+        self.query = query
+        self.params = params or {}
+        self.backend = "meilisearch"
+        self.cache_hit = False
+        self.stages: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    def add(self, stage: str, ms: float):
+        # 同一阶段可能执行多次（例如混合搜索中的两次引擎调用），耗时累加
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+
+# 当前请求的追踪对象，服务内部通过 stage() 记录耗时，无需修改函数签名
+_current_trace: ContextVar[Optional[QueryTrace]] = ContextVar("search_trace", default=None)
+
+
+def current_trace() -> Optional[QueryTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name: str):
+    """记录当前请求某一阶段的耗时，不在追踪中的调用（例如后台任务）不做任何事"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, (time.perf_counter() - start) * 1000)
+
+
+class SearchMetrics:
+    """搜索延迟统计和慢查询日志
+
+    每个接口按阶段（状态检查、查询缓存、搜索引擎、片段构建、序列化）和总耗时分别维护直方图，
+    总耗时超过阈值的查询以 JSON 行写入按大小轮转的慢查询日志。
+    """
+
+    def __init__(self, slow_log_path: str, slow_threshold_ms: float = 500.0,
+                 max_bytes: int = 5 * 1024 * 1024, backup_count: int = 3):
+        self.slow_log_path = slow_log_path
+        self.slow_threshold_ms = slow_threshold_ms
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.started_at = time.time()
+        self.slow_queries = 0
+        self._histograms: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self._lock = threading.Lock()
+        self._slow_logger: Optional[logging.Logger] = None
+
+    @contextmanager
+    def trace(self, endpoint: str, query: str, **params):
+        """追踪一次搜索请求，请求结束时记录各阶段耗时"""
+        trace = QueryTrace(endpoint, query, {k: v for k, v in params.items() if v is not None})
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            self.record(trace)
+
+    def record(self, trace: QueryTrace):
+        total_ms = trace.elapsed_ms()
+        with self._lock:
+            stages = self._histograms.setdefault(trace.endpoint, {})
+            for name, ms in list(trace.stages.items()) + [("total", total_ms)]:
+                histogram = stages.get(name)
+                if histogram is None:
+                    histogram = stages[name] = LatencyHistogram()
+                histogram.record(ms)
+        if total_ms >= self.slow_threshold_ms:
+            self._log_slow(trace, total_ms)
+
+    def _get_slow_logger(self) -> logging.Logger:
+        # 第一次出现慢查询时才创建日志文件
+        if self._slow_logger is None:
+            slow_logger = logging.getLogger("search.slow_queries")
+            slow_logger.setLevel(logging.INFO)
+            slow_logger.propagate = False
+            if not slow_logger.handlers:
+                os.makedirs(os.path.dirname(self.slow_log_path), exist_ok=True)
+                handler = RotatingFileHandler(
+                    self.slow_log_path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                # 由后台线程写入文件，请求处理不等待磁盘 I/O
+                slow_logger.addHandler(queued_handler(handler))
+            self._slow_logger = slow_logger
+        return self._slow_logger
+
+    def _log_slow(self, trace: QueryTrace, total_ms: float):
+        self.slow_queries += 1
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "endpoint": trace.endpoint,
+            "q": trace.query,
+            "params": trace.params,
+            "backend": trace.backend,
+            "cache_hit": trace.cache_hit,
+            "total_ms": round(total_ms, 2),
+            "stages_ms": {name: round(ms, 2) for name, ms in trace.stages.items()}
+        }
+        try:
+            self._get_slow_logger().info(json.dumps(entry, ensure_ascii=False, default=str))
+        except Exception as e:
+            logger.warning("写入慢查询日志失败: %s", e)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {
+                endpoint: {name: histogram.to_dict() for name, histogram in stages.items()}
+                for endpoint, stages in self._histograms.items()
+            }
+        return {
+            "since": self.started_at,
+            "bucket_bounds_ms": list(LATENCY_BUCKETS_MS),
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "slow_queries": self.slow_queries,
+            "slow_log": self.slow_log_path,
+            "endpoints": endpoints
+        }
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self.slow_queries = 0
+            self.started_at = time.time()
+
+    def recent_slow_queries(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """读取慢查询日志末尾的若干条记录（只读当前文件）
+
+        从文件末尾按块向前读取，读到足够的行就停止，耗时与日志大小无关。
+        """
+        if limit <= 0 or not os.path.exists(self.slow_log_path):
+            return []
+        block_size = 64 * 1024
+        with open(self.slow_log_path, "rb") as f:
+            position = f.seek(0, os.SEEK_END)
+            data = b""
+            # 多读一行：第一行可能只读到一半
+            while position > 0 and data.count(b"\n") <= limit:
+                read_size = min(block_size, position)
+                position -= read_size
+                f.seek(position)
+                data = f.read(read_size) + data
+        lines = data.splitlines()
+        if position > 0:
+            lines = lines[1:]
+        entries = []
+        for line in reversed(lines[-limit:]):
+            try:
+                entries.append(json.loads(line.decode("utf-8")))
+            except ValueError:
+                continue
+        return entries
+
+
+_server_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+# 模块级单例，搜索路由记录，管理接口读取
+search_metrics = SearchMetrics(
+    slow_log_path=os.environ.get("SEARCH_SLOW_LOG", os.path.join(_server_root, "logs", "slow_queries.log")),
+    slow_threshold_ms=float(os.environ.get("SEARCH_SLOW_QUERY_MS", "500"))
+)
@@ -1,133 +1,46 @@
 import os
-from typing import List, Dict, Optional
-import re
+from typing import List, Dict, Optional, Iterable, Set
 from datetime import datetime
-import aiofiles
 from math import ceil
-import json
-from pathlib import Path
+from functools import partial
 import time
 import asyncio
+import threading
+import logging
+from app.services.fulltext_index import FullTextIndex
+from app.services.markdown_sections import split_markdown_sections
+from app.services.meilisearch_service import CATEGORY_ROOT
+from app.services.search_metrics import stage
+
+logger = logging.getLogger(__name__)
 
 class SearchService:
-    def __init__(self):
+    def __init__(self, sync_interval: float = 5.0):
         """初始化搜索服务"""
         self.docs_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "static", "docs")
         self.cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "static", "cache")
-        self.index_path = os.path.join(self.cache_dir, "search_index.json")
-        self.file_index = {}
-        self.content_cache = {}
-        self.max_cache_size = 10  # 最大缓存文件数
+        self.sync_interval = sync_interval
         
         # 确保缓存目录存在
         os.makedirs(self.cache_dir, exist_ok=True)
         os.makedirs(self.docs_dir, exist_ok=True)
         
-        # 加载索引
-        self._load_index()
-        
-        # 检查是否为空索引
-        self.is_empty = len(self.file_index) == 0
-        print(f"[INFO] 搜索服务初始化完成，索引文件数: {len(self.file_index)}, 是否为空: {self.is_empty}")
-
-    def _load_index(self):
-        """加载搜索索引"""
-        try:
-            if os.path.exists(self.index_path):
-                print(f"[DEBUG] 加载搜索索引: {self.index_path}")
-                with open(self.index_path, 'r', encoding='utf-8') as f:
-                    self.file_index = json.load(f)
-                print(f"[DEBUG] 索引加载成功，包含 {len(self.file_index)} 个文件")
-                
-                # 打印索引中的文件类型统计
-                file_types = {}
-                for rel_path, file_data in self.file_index.items():
-                    file_type = file_data.get('type', 'unknown')
-                    file_types[file_type] = file_types.get(file_type, 0) + 1
-                
-                print(f"[DEBUG] 索引文件类型统计: {file_types}")
-            else:
-                print(f"[DEBUG] 索引文件不存在: {self.index_path}")
-                self.file_index = {}
-        except Exception as e:
-            print(f"[ERROR] 加载索引时出错: {e}")
-            self.file_index = {}
-
-    async def _save_index(self):
-        """保存搜索索引"""
-        try:
-            print(f"[DEBUG] 保存搜索索引到: {self.index_path}, 包含 {len(self.file_index)} 个文件")
-            with open(self.index_path, 'w', encoding='utf-8') as f:
-                json.dump(self.file_index, f, ensure_ascii=False, indent=2)
-            print(f"[DEBUG] 索引保存成功")
-        except Exception as e:
-            print(f"[ERROR] 保存索引时出错: {e}")
-
-    async def _update_index(self, file_path: str, content: str):
-        """更新文件索引"""
-        rel_path = os.path.relpath(file_path, self.docs_dir).replace('\\', '/')
-        
-        # 提取关键信息
-        words = set(re.findall(r'\w+', content.lower()))
-        headers = re.findall(r'^#+\s+(.+)$', content, re.MULTILINE)
-        
-        self.file_index[rel_path] = {
-            'words': list(words),
-            'headers': headers,
-            'last_modified': os.path.getmtime(file_path),
-            'type': os.path.splitext(file_path)[1][1:],
-            'size': os.path.getsize(file_path)
-        }
-        
-        await self._save_index()
-
-    async def _get_file_content(self, file_path: str) -> str:
-        """获取文件内容，使用缓存"""
-        try:
-            stat = os.stat(file_path)
-            cache_key = f"{file_path}:{stat.st_mtime}"
-            
-            # 检查缓存
-            if cache_key in self.content_cache:
-                return self.content_cache[cache_key]
-            
-            # 读取文件
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-                content = await f.read()
-            
-            # 更新缓存和索引
-            self.content_cache[cache_key] = content
-            await self._update_index(file_path, content)
-            
-            # 限制缓存大小
-            if len(self.content_cache) > self.max_cache_size:  # 最多缓存max_cache_size个文件
-                self.content_cache.pop(next(iter(self.content_cache)))
-            
-            return content
-            
-        except Exception as e:
-            print(f"Error reading file {file_path}: {e}")
-            return ""
-
-    def _calculate_relevance(self, query_words: set, file_data: dict) -> float:
-        """计算文档相关度"""
-        score = 0
-        file_words = set(file_data['words'])
+        # 旧版本的 JSON 索引已被二进制索引段取代
+        legacy_index_path = os.path.join(self.cache_dir, "search_index.json")
+        if os.path.exists(legacy_index_path):
+            os.remove(legacy_index_path)
+            logger.info("已删除旧版搜索索引: %s", legacy_index_path)
         
-        # 词匹配得分
-        word_matches = query_words & file_words
-        score += len(word_matches) * 1.0
+        # 嵌入式全文索引（BM25 + 中文二元组），只映射索引段文件，启动时不解析索引内容
+        self.fulltext = FullTextIndex(os.path.join(self.cache_dir, "fulltext"))
         
-        # 标题匹配加权
-        for header in file_data['headers']:
-            header_lower = header.lower()
-            # 检查每个查询词是否在标题中
-            for word in query_words:
-                if word in header_lower:
-                    score += 2.0
-                    break
+        # 文件监视器线程写入、事件循环读取的待同步路径
+        self._pending_paths: Set[str] = set()
+        self._pending_lock = threading.Lock()
         
-        return score
+        # 检查是否为空索引
+        self.is_empty = self.fulltext.doc_count == 0
+        logger.info("搜索服务初始化完成，索引文档数: %s, 索引段数: %s", self.fulltext.doc_count, len(self.fulltext.segments))
 
     async def search(
         self, 
@@ -139,288 +52,249 @@ class SearchService:
         doc_type: Optional[str] = None,
         date_from: Optional[str] = None,
         date_to: Optional[str] = None,
+        category: Optional[str] = None,
+        course: Optional[str] = None,
     ) -> Dict:
-        """搜索文档"""
-        print(f"[DEBUG] 开始搜索，参数: q='{q}', doc_type='{doc_type}', 索引文件数量: {len(self.file_index)}")
-        
-        results = []
-        q = q.lower()
-        # 改进中文处理，使用更宽松的正则表达式
-        query_words = set(re.findall(r'[\w\u4e00-\u9fff]+', q))
-        total_matches = 0
-        
-        print(f"[DEBUG] 提取的搜索关键词: {query_words}")
-        
-        # 过滤和搜索文件
-        for rel_path, file_data in self.file_index.items():
-            try:
-                # 类型过滤
-                if doc_type and doc_type != 'all' and file_data['type'] != doc_type:
-                    continue
-                
-                # 日期过滤
-                file_time = datetime.fromtimestamp(file_data['last_modified'])
-                if date_from:
-                    from_date = datetime.fromisoformat(date_from)
-                    if file_time < from_date:
-                        continue
-                if date_to:
-                    to_date = datetime.fromisoformat(date_to)
-                    if file_time > to_date:
-                        continue
-                
-                # 获取文件名和类型
-                file_name = os.path.basename(rel_path)
-                file_type = file_data['type']
-                
-                print(f"[DEBUG] 检查文件: {rel_path}, 类型: {file_type}")
-                
-                # PDF 文件只搜索文件名
-                if file_type == 'pdf':
-                    # 检查文件名是否匹配搜索词
-                    name_matches = [word for word in query_words if word in file_name.lower()]
-                    if name_matches:
-                        print(f"[DEBUG] PDF文件名匹配: {file_name}, 匹配词: {name_matches}")
-                        results.append({
-                            "path": rel_path,
-                            "name": file_name,
-                            "matches": [{
-                                "type": "title",
-                                "text": file_name,
-                                "line": 0
-                            }],
-                            "last_modified": datetime.fromtimestamp(file_data['last_modified']).isoformat(),
-                            "relevance_score": len(name_matches)
-                        })
-                        total_matches += 1
-                    continue
-                
-                # 非 PDF 文件进行全文搜索
-                relevance_score = self._calculate_relevance(query_words, file_data)
-                print(f"[DEBUG] 文件相关度: {rel_path}, 得分: {relevance_score}")
-                
-                if relevance_score > 0:
-                    abs_path = os.path.join(self.docs_dir, rel_path)
-                    content = await self._get_file_content(abs_path)
-                    
-                    # 提取匹配上下文
-                    matches = []
-                    
-                    # 先检查文件名是否匹配
-                    name_matches = [word for word in query_words if word in file_name.lower()]
-                    if name_matches:
-                        matches.append({
-                            "type": "title",
-                            "text": file_name,
-                            "line": 0
-                        })
-                    
-                    # 然后检查内容匹配（仅对Markdown文件）
-                    if file_type == 'md':
-                        lines = content.split('\n')
-                        for i, line in enumerate(lines, 1):
-                            if any(word in line.lower() for word in query_words):
-                                context_start = max(0, i - 2)
-                                context_end = min(len(lines), i + 2)
-                                context = '\n'.join(lines[context_start:context_end])
-                                
-                                matches.append({
-                                    "type": "content",
-                                    "text": context,
-                                    "line": i
-                                })
-                                
-                                if len(matches) >= 3:  # 限制每个文件的匹配数
-                                    break
-                    
-                    if matches:
-                        print(f"[DEBUG] 找到内容匹配: {rel_path}, 匹配数: {len(matches)}")
-                        results.append({
-                            "path": rel_path,
-                            "name": file_name,
-                            "matches": matches,
-                            "last_modified": datetime.fromtimestamp(file_data['last_modified']).isoformat(),
-                            "relevance_score": relevance_score
-                        })
-                        total_matches += len(matches)
-                        
-            except Exception as e:
-                print(f"[ERROR] 处理文件 {rel_path} 时出错: {e}")
-                continue
-
-        # 排序结果
-        if sort_by == "date":
-            results.sort(key=lambda x: x["last_modified"], reverse=(sort_order == "desc"))
-        elif sort_by == "name":
-            results.sort(key=lambda x: x["name"], reverse=(sort_order == "desc"))
-        else:  # relevance
-            results.sort(key=lambda x: x["relevance_score"], reverse=True)
+        """使用本地全文索引搜索文档，返回格式与 MeiliSearchService.search 一致
 
-        # 分页
-        total = len(results)
+        分类和课程都对应目录，按路径前缀过滤；本地索引不统计分面分布。
+        """
+        # 日期只解析一次，转换为时间戳后与修改时间列比较
+        from_ts = datetime.fromisoformat(date_from).timestamp() if date_from else None
+        to_ts = datetime.fromisoformat(date_to).timestamp() if date_to else None
+        if doc_type == 'all':
+            doc_type = None
+        path_prefixes = []
+        if category:
+            path_prefixes.append(f"{CATEGORY_ROOT}/{category}")
+        if course:
+            path_prefixes.append(course)
+        
+        # 解码倒排表和打分是 CPU 密集的同步操作，在线程池中执行，不阻塞事件循环
+        # （MeiliSearch 故障时所有搜索都落到这里）
+        loop = asyncio.get_event_loop()
+        with stage("engine"):
+            total, hits = await loop.run_in_executor(None, partial(
+                self.fulltext.query,
+                q,
+                limit=per_page,
+                offset=(page - 1) * per_page,
+                doc_type=doc_type,
+                date_from=from_ts,
+                date_to=to_ts,
+                sort_by=sort_by,
+                sort_order=sort_order,
+                path_prefixes=path_prefixes
+            ))
         total_pages = ceil(total / per_page)
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        paginated_results = results[start_idx:end_idx]
         
-        print(f"[DEBUG] 搜索完成，总匹配文件: {total}, 总匹配数: {total_matches}, 页数: {total_pages}")
-
+        # 只读取当前页文档的存储字段
+        with stage("snippets"):
+            results = await loop.run_in_executor(None, self._build_results, q, hits)
+        
         return {
-            "results": paginated_results,
+            "results": results,
             "total": total,
-            "total_matches": total_matches,
+            "total_matches": total,
             "page": page,
             "per_page": per_page,
-            "total_pages": total_pages
+            "total_pages": total_pages,
+            "facet_distribution": {}
         }
 
+    def _build_results(self, q: str, hits) -> List[Dict]:
+        """读取命中文档的存储字段并生成匹配片段"""
+        results = []
+        for score, segment, doc_id in hits:
+            fields = segment.stored_fields(doc_id)
+            matches = [{
+                "type": "title",
+                "text": fields.get('name', ''),
+                "line": 0
+            }]
+            if fields.get('heading'):
+                matches.append({
+                    "type": "heading",
+                    "text": " > ".join(fields.get('headings') or [fields['heading']]),
+                    "line": fields.get('line', 0)
+                })
+            if fields.get('type') == 'md':
+                text, highlights = self.fulltext.make_snippet(fields.get('content', ''), q)
+                if text:
+                    matches.append({
+                        "type": "content",
+                        "text": text,
+                        "highlights": highlights,
+                        "line": fields.get('line', 0)
+                    })
+            
+            results.append({
+                "id": fields.get('id', ''),
+                "path": fields.get('path', ''),
+                "name": fields.get('name', ''),
+                "heading": fields.get('heading', ''),
+                "headings": fields.get('headings', []),
+                "anchor": fields.get('anchor', ''),
+                "matches": matches,
+                "last_modified": datetime.fromtimestamp(fields.get('last_modified', 0)).isoformat(),
+                "relevance_score": round(score, 4)
+            })
+        return results
+
     async def get_suggestions(
         self, 
         q: str, 
         limit: int = 5,
         doc_type: Optional[str] = None
     ) -> List[str]:
-        """获取搜索建议"""
-        suggestions = set()
-        q = q.lower()
+        """获取搜索建议：从最相关的文档中提取文件名和章节标题"""
+        suggestions = []
+        q_lower = q.lower()
+        if doc_type == 'all':
+            doc_type = None
         
-        for rel_path, file_data in self.file_index.items():
-            # 类型过滤
-            if doc_type and doc_type != 'all' and file_data['type'] != doc_type:
-                continue
-            
-            # 获取文件名和类型
-            file_name = os.path.splitext(os.path.basename(rel_path))[0]
-            file_type = file_data['type']
-            
-            # 从文件名中提取建议
-            if q in file_name.lower():
-                suggestions.add(file_name)
-                
-            # 对非 PDF 文件，从标题中提取建议
-            if file_type != 'pdf':
-                # 从标题中提取建议
-                for header in file_data['headers']:
-                    if q in header.lower():
-                        suggestions.add(header)
-            
+        loop = asyncio.get_event_loop()
+        _, hits = await loop.run_in_executor(None, partial(self.fulltext.query, q, limit=limit * 4, doc_type=doc_type))
+        for _, segment, doc_id in hits:
+            fields = segment.stored_fields(doc_id)
+            candidates = [os.path.splitext(fields.get('name', ''))[0], fields.get('heading', '')]
+            for candidate in candidates:
+                if candidate and q_lower in candidate.lower() and candidate not in suggestions:
+                    suggestions.append(candidate)
             if len(suggestions) >= limit:
                 break
         
-        return list(suggestions)[:limit]
+        return suggestions[:limit]
 
     async def build_index(self):
         """构建搜索索引"""
-        print(f"[DEBUG] 开始构建搜索索引，文档目录: {self.docs_dir}")
-        
-        # 清空当前索引
-        self.file_index = {}
-        file_count = 0
-        md_count = 0
-        pdf_count = 0
-        error_count = 0
-        
-        # 先收集所有文件路径
-        all_files = []
-        for root, _, files in os.walk(self.docs_dir):
-            for file in files:
+        logger.debug("开始构建搜索索引，文档目录: %s", self.docs_dir)
+        doc_count = await self.build_fulltext_index()
+        self.is_empty = doc_count == 0
+        return {"indexed_files": len(self._indexed_paths()), "fulltext_documents": doc_count, "errors": 0}
+    
+    def _indexed_paths(self) -> Set[str]:
+        """收集索引中的全部文件路径（只读取各段的路径表）"""
+        paths = set()
+        for segment in self.fulltext.segments:
+            paths.update(segment.paths())
+        return paths
+    
+    def _iter_files(self, rel_dir: str = ""):
+        """遍历目录下可索引的文件，返回绝对路径（按路径排序，保证同一文件的文档连续）"""
+        top = os.path.join(self.docs_dir, rel_dir) if rel_dir else self.docs_dir
+        for root, dirs, files in os.walk(top, followlinks=True):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for file in sorted(files):
                 if file.startswith('.'):  # 跳过隐藏文件
                     continue
-                file_path = os.path.join(root, file)
-                all_files.append(file_path)
-        
-        total_files = len(all_files)
-        print(f"[INFO] 发现 {total_files} 个文件需要索引")
+                if os.path.splitext(file)[1][1:].lower() in ('md', 'pdf'):
+                    yield os.path.join(root, file)
+    
+    def _file_documents(self, file_path: str):
+        """生成单个文件的全文索引文档：Markdown 按章节拆分，PDF 只索引文件名"""
+        file_name = os.path.basename(file_path)
+        file_ext = os.path.splitext(file_name)[1][1:].lower()
+        rel_path = os.path.relpath(file_path, self.docs_dir).replace('\\', '/')
+        document = {
+            'path': rel_path,
+            'name': file_name,
+            'type': file_ext,
+            'last_modified': os.path.getmtime(file_path)
+        }
         
-        # 分批处理文件，每批100个
-        batch_size = 100
-        batches = [all_files[i:i + batch_size] for i in range(0, len(all_files), batch_size)]
+        if file_ext == 'pdf':
+            yield {**document, 'id': rel_path}
+            return
         
-        # 每批处理
-        for batch_index, batch_files in enumerate(batches):
-            batch_start_time = time.time()
-            batch_count = 0
-            
-            for file_path in batch_files:
-                try:
-                    rel_path = os.path.relpath(file_path, self.docs_dir).replace('\\', '/')
-                    file_ext = os.path.splitext(file_path)[1][1:].lower()
-                    
-                    # 处理 Markdown 文件
-                    if file_ext == 'md':
-                        await self._index_markdown_file(file_path, rel_path)
-                        md_count += 1
-                        batch_count += 1
-                    
-                    # 处理 PDF 文件
-                    elif file_ext == 'pdf':
-                        await self._index_pdf_file(file_path, rel_path)
-                        pdf_count += 1
-                        batch_count += 1
-                    else:
-                        continue
-                    
-                    file_count += 1
-                except Exception as e:
-                    error_count += 1
-                    print(f"[ERROR] 索引文件 {file_path} 时出错: {e}")
-                    if error_count % 10 == 0:  # 每10个错误输出一次堆栈
-                        import traceback
-                        traceback.print_exc()
-            
-            # 批次完成后保存进度
-            if batch_count > 0:
-                await self._save_index()
-                
-            batch_time = time.time() - batch_start_time
-            completed = min((batch_index + 1) * batch_size, total_files)
-            progress = (completed / total_files) * 100
-            
-            print(f"[INFO] 已处理 {completed}/{total_files} 个文件 ({progress:.1f}%), 批次耗时: {batch_time:.2f}秒, "
-                  f"当前索引文件数: {len(self.file_index)}, 错误数: {error_count}")
-            
-            # 短暂休眠，避免CPU过载
-            await asyncio.sleep(0.1)
+        try:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except UnicodeDecodeError:
+                with open(file_path, 'r', encoding='gbk') as f:
+                    content = f.read()
+        except Exception as e:
+            logger.error("读取文件 %s 时出错: %s", file_path, e)
+            return
         
-        # 最终保存索引
-        await self._save_index()
-        print(f"[INFO] 搜索索引构建完成，总文件数: {file_count}, Markdown: {md_count}, PDF: {pdf_count}, 错误: {error_count}")
-        print(f"[INFO] 索引文件保存至: {self.index_path}")
-        return {"indexed_files": file_count, "errors": error_count}
+        for section in split_markdown_sections(content) or [{'heading': '', 'headings': [], 'anchor': '', 'line': 1, 'content': ''}]:
+            yield {
+                **document,
+                'id': f"{rel_path}#{section['anchor']}" if section['anchor'] else rel_path,
+                'heading': section['heading'],
+                'headings': section['headings'],
+                'anchor': section['anchor'],
+                'line': section['line'],
+                'content': section['content']
+            }
     
-    async def _index_markdown_file(self, file_path, rel_path):
-        """索引Markdown文件"""
-        try:
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-                content = await f.read()
-        except UnicodeDecodeError:
-            # 尝试其他编码
-            async with aiofiles.open(file_path, 'r', encoding='gbk') as f:
-                content = await f.read()
+    def _iter_fulltext_documents(self, rel_dirs: Iterable[str] = ("",)):
+        """遍历目录，生成全部文件的全文索引文档"""
+        for rel_dir in rel_dirs:
+            for file_path in self._iter_files(rel_dir):
+                yield from self._file_documents(file_path)
+    
+    async def build_fulltext_index(self) -> int:
+        """在线程池中重建本地全文索引，返回索引的文档数"""
+        start_time = time.time()
+        loop = asyncio.get_event_loop()
+        doc_count = await loop.run_in_executor(None, self.fulltext.rebuild, self._iter_fulltext_documents())
+        logger.info("本地全文索引构建完成，文档数: %s, 耗时: %.2f秒", doc_count, time.time() - start_time)
+        return doc_count
+    
+    def _sync_paths(self, rel_paths: Set[str]) -> int:
+        """把变化的路径同步到全文索引：旧文档记入删除标记，现存文件的文档追加为新段"""
+        files, dirs = [], []
+        for rel_path in sorted(rel_paths):
+            # 已包含在变化目录中的路径会随目录一起处理，避免同一文件写入两次（空路径表示文档根目录）
+            if any(d == '' or rel_path.startswith(d.rstrip('/') + '/') for d in dirs):
+                continue
+            abs_path = os.path.join(self.docs_dir, rel_path)
+            if os.path.isdir(abs_path):
+                dirs.append(rel_path)
+            elif os.path.isfile(abs_path) and os.path.splitext(rel_path)[1][1:].lower() in ('md', 'pdf'):
+                files.append(abs_path)
         
-        # 提取关键信息 - 改进中文处理
-        words = set(re.findall(r'[\w\u4e00-\u9fff]+', content.lower()))
-        headers = re.findall(r'^#+\s+(.+)$', content, re.MULTILINE)
+        def documents():
+            for file_path in files:
+                yield from self._file_documents(file_path)
+            yield from self._iter_fulltext_documents(dirs)
         
-        self.file_index[rel_path] = {
-            'words': list(words),
-            'headers': headers,
-            'last_modified': os.path.getmtime(file_path),
-            'type': 'md',
-            'size': os.path.getsize(file_path)
-        }
+        return self.fulltext.update(documents(), rel_paths)
     
-    async def _index_pdf_file(self, file_path, rel_path):
-        """索引PDF文件"""
-        # 对 PDF 文件，只索引文件名
-        file_name = os.path.basename(file_path)
-        # 改进中文处理
-        words = set(re.findall(r'[\w\u4e00-\u9fff]+', file_name.lower()))
-        
-        self.file_index[rel_path] = {
-            'words': list(words),
-            'headers': [],
-            'last_modified': os.path.getmtime(file_path),
-            'type': 'pdf',
-            'size': os.path.getsize(file_path)
-        } 
\ No newline at end of file
+    async def sync_paths(self, rel_paths: Iterable[str]) -> int:
+        """增量更新全文索引，开销只与变化的文件数有关"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._sync_paths, set(rel_paths))
+    
+    def mark_dirty(self, file_path: str):
+        """记录发生变化的路径（可在文件监视器线程中调用）"""
+        try:
+            rel_path = os.path.relpath(file_path, self.docs_dir).replace('\\', '/')
+        except ValueError:
+            return
+        if rel_path.startswith('..'):
+            return
+        if rel_path == '.':
+            # 文档根目录本身被创建、删除或移动，用空前缀表示全部文档
+            rel_path = ''
+        with self._pending_lock:
+            self._pending_paths.add(rel_path)
+    
+    async def run_watch_loop(self):
+        """定期把文件监视器收集到的变化同步到全文索引"""
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            with self._pending_lock:
+                paths = self._pending_paths
+                self._pending_paths = set()
+            if not paths:
+                continue
+            try:
+                await self.sync_paths(paths)
+            except Exception as e:
+                logger.error("本地全文索引增量更新失败: %s", e)
+                # 放回队列，下个周期重试
+                with self._pending_lock:
+                    self._pending_paths.update(paths)
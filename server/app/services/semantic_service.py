@@ -0,0 +1,457 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import importlib.util
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from math import ceil
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.markdown_sections import split_markdown_sections
+from app.services.meilisearch_service import path_facets
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时不提供语义搜索
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# 进程池中每个工作进程加载一次的嵌入模型
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int):
+    """工作进程初始化：限制线程数并加载嵌入模型"""
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device='cpu')
+
+
+def _encode_batch(texts: List[str]):
+    """在工作进程中计算一批文本的归一化向量"""
+    embeddings = _worker_model.encode(texts, batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=True)
+    return embeddings.astype(np.float16)
+
+
+class SemanticSearchService:
+    """可选的语义搜索（混合搜索）服务
+
+    用本地 CPU 嵌入模型在进程池中为 Markdown 章节计算向量，保存为 float16 矩阵并以内存映射方式加载。
+    查询时分块暴力计算内积；章节数超过阈值时改用 IVF 倒排聚类，只计算最近的若干个簇。
+    语义结果与关键词搜索结果使用倒数排名融合（RRF）合并。
+
+    依赖 numpy 和 sentence-transformers（可选依赖），未安装或未启用时不影响关键词搜索。
+    """
+
+    # bge 系列中文模型推荐的查询指令
+    DEFAULT_MODEL = "BAAI/bge-small-zh-v1.5"
+    DEFAULT_QUERY_PREFIX = "为这个句子生成表示以用于检索相关文章："
+
+    def __init__(self, docs_dir: str, cache_dir: str):
+        self.docs_dir = docs_dir
+        self.index_dir = os.path.join(cache_dir, "semantic")
+        self.sections_path = os.path.join(self.index_dir, "sections.json")
+        self.ivf_path = os.path.join(self.index_dir, "ivf.npz")
+
+        self.enabled = os.environ.get("SEMANTIC_SEARCH_ENABLED", "false").lower() in ("1", "true", "yes")
+        self.available = np is not None and importlib.util.find_spec("sentence_transformers") is not None
+        self.model_name = os.environ.get("SEMANTIC_MODEL", self.DEFAULT_MODEL)
+        self.query_prefix = os.environ.get("SEMANTIC_QUERY_PREFIX", self.DEFAULT_QUERY_PREFIX)
+        self.workers = int(os.environ.get("SEMANTIC_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+        self.batch_size = int(os.environ.get("SEMANTIC_BATCH_SIZE", "64"))
+        self.max_chars = int(os.environ.get("SEMANTIC_MAX_CHARS", "512"))       # 每个章节参与编码的最大字符数
+        self.ivf_min_size = int(os.environ.get("SEMANTIC_IVF_MIN_SIZE", "50000"))  # 章节数达到该值时构建 IVF
+        self.nprobe = int(os.environ.get("SEMANTIC_NPROBE", "8"))
+        # 查询向量计算的超时（秒），超时后只使用关键词结果
+        self.query_timeout = float(os.environ.get("SEMANTIC_QUERY_TIMEOUT", "2.0"))
+        self.rrf_k = 60
+        self.max_candidates = 100  # 参与融合的关键词和语义结果的最大数量
+
+        # (向量矩阵, 章节元数据, IVF (簇中心, 行号, 各簇起始位置) 或 None)，整体替换
+        self._state: Tuple[Any, List[Dict[str, Any]], Optional[Tuple[Any, Any, Any]]] = (None, [], None)
+        # 构建索引和计算查询向量分别使用独立的进程池，重建期间查询不会排在全部编码批次之后
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._query_pool: Optional[ProcessPoolExecutor] = None
+        # 构建线程和查询可能同时第一次使用进程池
+        self._pool_lock = threading.Lock()
+        # 查询进程已启动并加载模型，查询不会等待冷启动
+        self._warm = False
+        self._cancel_build = threading.Event()
+        self._dirty = False
+        self.built_at: Optional[float] = None
+
+        if self.enabled and self.available:
+            self.load()
+
+    @property
+    def is_ready(self) -> bool:
+        """语义索引已加载（是否需要构建索引以此判断）"""
+        return self.enabled and self.available and len(self._state[1]) > 0
+
+    @property
+    def can_query(self) -> bool:
+        """语义索引已加载且进程池已预热，混合搜索以此判断"""
+        return self.is_ready and self._warm
+
+    def load(self):
+        """加载已保存的向量（内存映射）、章节元数据和 IVF 索引"""
+        if not os.path.exists(self.sections_path):
+            return
+        try:
+            with open(self.sections_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            embeddings_path = os.path.join(self.index_dir, meta.get('embeddings', ''))
+            if meta.get('model') != self.model_name or not os.path.isfile(embeddings_path):
+                logger.warning("语义索引不完整或模型与当前模型 %s 不一致，需要重建", self.model_name)
+                return
+            embeddings = np.load(embeddings_path, mmap_mode='r')
+            ivf = None
+            if os.path.exists(self.ivf_path):
+                with np.load(self.ivf_path) as data:
+                    ivf = (data['centroids'], data['order'], data['offsets'])
+            self._state = (embeddings, meta['sections'], ivf)
+            self.built_at = meta.get('built_at')
+            logger.info("语义索引加载完成: %d 个章节", len(meta['sections']))
+        except Exception as e:
+            logger.error("加载语义索引失败: %s", e)
+
+    def _new_pool(self, workers: int) -> ProcessPoolExecutor:
+        # 使用 spawn 启动工作进程，避免 fork 复制事件循环和模型线程的状态
+        threads = max(1, (os.cpu_count() or 2) // self.workers)
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_name, threads)
+        )
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """构建索引使用的进程池（第一次构建时创建）"""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = self._new_pool(self.workers)
+            return self._pool
+
+    def _get_query_pool(self) -> ProcessPoolExecutor:
+        """计算查询向量使用的单进程池"""
+        with self._pool_lock:
+            if self._query_pool is None:
+                self._query_pool = self._new_pool(1)
+            return self._query_pool
+
+    async def warm_up(self):
+        """启动查询进程并加载模型（应用启动时在后台调用），完成前混合搜索只使用关键词结果"""
+        if not (self.enabled and self.available) or self._warm:
+            return
+        start_time = time.time()
+        loop = asyncio.get_event_loop()
+        try:
+            # 创建进程池会启动工作进程，放到线程中执行；处理一个请求以确认模型已加载
+            pool = await loop.run_in_executor(None, self._get_query_pool)
+            await asyncio.wrap_future(pool.submit(_encode_batch, [self.query_prefix]))
+            self._warm = True
+            logger.info("语义搜索进程池预热完成，耗时 %.2f秒", time.time() - start_time)
+        except Exception as e:
+            logger.error("语义搜索进程池预热失败: %s", e)
+
+    def close(self):
+        """关闭进程池（应用关闭时调用）"""
+        for pool in (self._pool, self._query_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+        self._query_pool = None
+
+    def _collect_sections(self) -> List[Dict[str, Any]]:
+        """遍历文档目录，收集 Markdown 章节及其编码文本的哈希"""
+        sections = []
+        for root, dirs, files in os.walk(self.docs_dir, followlinks=True):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for file_name in sorted(files):
+                if file_name.startswith('.') or not file_name.lower().endswith('.md'):
+                    continue
+                file_path = os.path.join(root, file_name)
+                rel_path = os.path.relpath(file_path, self.docs_dir).replace('\\', '/')
+                try:
+                    try:
+                        with open(file_path, 'r', encoding='utf-8') as f:
+                            content = f.read()
+                    except UnicodeDecodeError:
+                        with open(file_path, 'r', encoding='gbk') as f:
+                            content = f.read()
+                except Exception as e:
+                    logger.warning("读取文件 %s 失败: %s", rel_path, e)
+                    continue
+                title = os.path.splitext(file_name)[0]
+                last_modified = int(os.path.getmtime(file_path))
+                for section in split_markdown_sections(content):
+                    body = section['content'].strip()
+                    if not body and not section['heading']:
+                        continue
+                    text = '\n'.join([title, ' > '.join(section['headings']), body])[:self.max_chars]
+                    sections.append({
+                        'path': rel_path,
+                        'name': file_name,
+                        'heading': section['heading'],
+                        'headings': section['headings'],
+                        'anchor': section['anchor'],
+                        'line': section['line'],
+                        'snippet': ' '.join(body.split())[:120],
+                        'last_modified': last_modified,
+                        'hash': hashlib.md5(text.encode('utf-8')).hexdigest(),
+                        'text': text
+                    })
+        return sections
+
+    def _train_ivf(self, embeddings, iterations: int = 10):
+        """用球面 k-means 训练 IVF 簇中心，返回 (簇中心, 按簇排序的行号, 各簇起始位置)"""
+        count = embeddings.shape[0]
+        nlist = max(1, int(count ** 0.5))
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(count, min(count, nlist * 40), replace=False))
+        sample = np.asarray(embeddings[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            nonempty = counts > 0
+            centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        assign = np.empty(count, dtype=np.int32)
+        for start in range(0, count, 65536):
+            block = np.asarray(embeddings[start:start + 65536], dtype=np.float32)
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assign, kind='stable').astype(np.int32)
+        offsets = np.searchsorted(assign[order], np.arange(nlist + 1)).astype(np.int64)
+        return centroids, order, offsets
+
+    def _build_sync(self, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """构建语义索引（在线程中执行）：内容未变的章节复用旧向量，只为新增或修改的章节计算向量"""
+        start_time = time.time()
+        self._cancel_build.clear()
+        sections = self._collect_sections()
+        old_embeddings, old_sections, _ = self._state
+        reusable = {s['hash']: i for i, s in enumerate(old_sections)} if old_embeddings is not None else {}
+        to_encode = [i for i, s in enumerate(sections) if s['hash'] not in reusable]
+
+        # 分批提交到进程池，按完成顺序收集结果
+        encoded: Dict[int, Any] = {}
+        batches = [to_encode[i:i + self.batch_size] for i in range(0, len(to_encode), self.batch_size)]
+        if batches:
+            pool = self._get_pool()
+            futures = [(batch, pool.submit(_encode_batch, [sections[i]['text'] for i in batch])) for batch in batches]
+            done = 0
+            for batch, future in futures:
+                if self._cancel_build.is_set():
+                    for _, pending in futures:
+                        pending.cancel()
+                    raise RuntimeError("语义索引构建已取消")
+                for row, vector in zip(batch, future.result()):
+                    encoded[row] = vector
+                done += len(batch)
+                if progress is not None:
+                    progress(done, len(to_encode))
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        dim = next(iter(encoded.values())).shape[0] if encoded else (old_embeddings.shape[1] if len(sections) else 0)
+        # 每次构建写入新文件，旧文件可能仍被查询映射（Windows 上无法替换已映射的文件）
+        embeddings_name = f"embeddings_{int(time.time() * 1000)}.npy"
+        embeddings_path = os.path.join(self.index_dir, embeddings_name)
+        tmp_embeddings = f"{embeddings_path}.tmp.npy"
+        matrix = np.lib.format.open_memmap(tmp_embeddings, mode='w+', dtype=np.float16, shape=(len(sections), dim))
+        for row, section in enumerate(sections):
+            matrix[row] = encoded[row] if row in encoded else old_embeddings[reusable[section['hash']]]
+        matrix.flush()
+        del matrix
+
+        for section in sections:
+            del section['text']
+        os.replace(tmp_embeddings, embeddings_path)
+        embeddings = np.load(embeddings_path, mmap_mode='r')
+
+        ivf = None
+        if len(sections) >= self.ivf_min_size:
+            ivf = self._train_ivf(embeddings)
+            tmp_ivf = f"{self.ivf_path}.tmp.npz"
+            np.savez(tmp_ivf, centroids=ivf[0], order=ivf[1], offsets=ivf[2])
+            os.replace(tmp_ivf, self.ivf_path)
+        elif os.path.exists(self.ivf_path):
+            os.remove(self.ivf_path)
+
+        self.built_at = time.time()
+        tmp_sections = f"{self.sections_path}.tmp"
+        with open(tmp_sections, 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model_name, 'embeddings': embeddings_name, 'built_at': self.built_at,
+                       'sections': sections}, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_sections, self.sections_path)
+
+        self._state = (embeddings, sections, ivf)
+        for file_name in os.listdir(self.index_dir):
+            if file_name.startswith('embeddings_') and file_name != embeddings_name:
+                try:
+                    os.remove(os.path.join(self.index_dir, file_name))
+                except OSError:
+                    pass  # 仍被映射的旧文件在下次构建时删除
+        result = {
+            "sections": len(sections),
+            "encoded": len(to_encode),
+            "reused": len(sections) - len(to_encode),
+            "ivf_lists": len(ivf[0]) if ivf else 0,
+            "time_taken": round(time.time() - start_time, 2)
+        }
+        logger.info("语义索引构建完成: %s", result)
+        return result
+
+    async def build(self, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """在后台线程中构建语义索引，被取消时通知构建线程在下一批次前停止"""
+        if not self.available:
+            raise RuntimeError("未安装 numpy 或 sentence-transformers，无法构建语义索引")
+        self._dirty = False
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(None, self._build_sync, progress)
+        except asyncio.CancelledError:
+            self._cancel_build.set()
+            raise
+
+    def mark_dirty(self, file_path: str = None):
+        """文档发生变化时调用（可在文件监视器线程中调用），由 run_watch_loop 安排重建"""
+        if file_path is None or file_path.lower().endswith('.md') or os.path.isdir(file_path):
+            self._dirty = True
+
+    async def run_watch_loop(self, submit: Callable[[], Any], interval: float = 300.0):
+        """定期检查是否有文档变化，有变化时通过 submit 提交重建任务（只重新编码变化的章节）"""
+        while True:
+            await asyncio.sleep(interval)
+            if self._dirty:
+                self._dirty = False
+                submit()
+
+    async def encode_query(self, q: str):
+        """在进程池中计算查询向量，超过 query_timeout 时抛出 asyncio.TimeoutError（调用方降级为关键词结果）"""
+        future = self._get_query_pool().submit(_encode_batch, [self.query_prefix + q])
+        vectors = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.query_timeout)
+        return np.asarray(vectors[0], dtype=np.float32)
+
+    def _nearest(self, query_vector, k: int) -> List[Tuple[int, float]]:
+        """返回内积最大的 k 个章节 [(行号, 得分)]"""
+        embeddings, sections, ivf = self._state
+        if ivf is not None:
+            centroids, order, offsets = ivf
+            probes = np.argsort(centroids @ query_vector)[::-1][:self.nprobe]
+            rows = np.sort(np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probes]))
+            scores = np.asarray(embeddings[rows], dtype=np.float32) @ query_vector
+        else:
+            # 分块计算，避免一次把整个 float16 矩阵转换为 float32
+            rows = np.arange(len(sections))
+            scores = np.empty(len(sections), dtype=np.float32)
+            for start in range(0, len(sections), 65536):
+                block = np.asarray(embeddings[start:start + 65536], dtype=np.float32)
+                scores[start:start + len(block)] = block @ query_vector
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    @staticmethod
+    def _matches_filters(section: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+        """语义结果应用与关键词搜索相同的过滤条件"""
+        if filters.get('doc_type') not in (None, 'all', 'md'):
+            return False
+        facets = path_facets(section['path'])
+        category = filters.get('category')
+        if category and facets.get('category_lvl1' if '/' in category else 'category_lvl0') != category:
+            return False
+        if filters.get('course') and facets.get('course') != filters['course']:
+            return False
+        if filters.get('from_ts') is not None and section['last_modified'] < filters['from_ts']:
+            return False
+        if filters.get('to_ts') is not None and section['last_modified'] > filters['to_ts']:
+            return False
+        return True
+
+    async def search(self, q: str, limit: int = 10, **filters) -> List[Tuple[Dict[str, Any], float]]:
+        """语义搜索，返回 [(章节元数据, 相似度)]"""
+        query_vector = await self.encode_query(q)
+        sections = self._state[1]
+        # 有过滤条件时多取一些候选，过滤后仍能凑满 limit 个
+        k = limit * 5 if any(filters.values()) else limit
+        # 日期只解析一次
+        date_from, date_to = filters.pop('date_from', None), filters.pop('date_to', None)
+        filters['from_ts'] = datetime.fromisoformat(date_from).timestamp() if date_from else None
+        filters['to_ts'] = datetime.fromisoformat(date_to).timestamp() if date_to else None
+        loop = asyncio.get_event_loop()
+        nearest = await loop.run_in_executor(None, self._nearest, query_vector, k)
+        hits = [(sections[row], score) for row, score in nearest if self._matches_filters(sections[row], filters)]
+        return hits[:limit]
+
+    def fuse(self, keyword_result: Dict, semantic_hits: List[Tuple[Dict[str, Any], float]],
+             page: int, per_page: int) -> Dict:
+        """用倒数排名融合（RRF）合并关键词和语义结果，返回与关键词搜索相同格式的结果"""
+        scores: Dict[Tuple[str, str], float] = {}
+        items: Dict[Tuple[str, str], Dict] = {}
+        for rank, item in enumerate(keyword_result.get('results', [])):
+            key = (item.get('path', ''), item.get('anchor', ''))
+            scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            items[key] = item
+        for rank, (section, similarity) in enumerate(semantic_hits):
+            key = (section['path'], section['anchor'])
+            scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            if key not in items:
+                matches = [{"type": "title", "text": section['name'], "line": 0}]
+                if section['heading']:
+                    matches.append({"type": "heading", "text": " > ".join(section['headings']), "line": section['line']})
+                if section['snippet']:
+                    matches.append({"type": "content", "text": section['snippet'], "highlights": [], "line": section['line']})
+                items[key] = {
+                    "id": f"{section['path']}#{section['anchor']}" if section['anchor'] else section['path'],
+                    "path": section['path'],
+                    "name": section['name'],
+                    "heading": section['heading'],
+                    "headings": section['headings'],
+                    "anchor": section['anchor'],
+                    "matches": matches,
+                    "last_modified": datetime.fromtimestamp(section['last_modified']).isoformat()
+                }
+
+        ranked = sorted(scores, key=lambda key: scores[key], reverse=True)
+        start = (page - 1) * per_page
+        results = [{**items[key], "relevance_score": round(scores[key], 6)} for key in ranked[start:start + per_page]]
+        total = max(keyword_result.get('total', 0), len(ranked))
+        return {
+            **keyword_result,
+            "results": results,
+            "total": total,
+            "total_matches": total,
+            "page": page,
+            "per_page": per_page,
+            "total_pages": ceil(total / per_page),
+            "mode": "hybrid"
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        embeddings, sections, ivf = self._state
+        return {
+            "enabled": self.enabled,
+            "available": self.available,
+            "ready": self.is_ready,
+            "warm": self._warm,
+            "model": self.model_name,
+            "sections": len(sections),
+            "dimensions": int(embeddings.shape[1]) if embeddings is not None else 0,
+            "ivf_lists": len(ivf[0]) if ivf else 0,
+            "built_at": self.built_at
+        }
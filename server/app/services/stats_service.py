@@ -1,237 +1,414 @@
 import os
 import json
+import time
+import heapq
+import asyncio
+import hashlib
 import logging
+import threading
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 from collections import defaultdict
 import random
 
+from .hyperloglog import HyperLogLog
+
 logger = logging.getLogger(__name__)
 
+# 热门文档的滚动时间窗口（天）
+ROLLING_WINDOWS = (7, 30, 90)
+# 每个窗口预先排好序的热门文档数量，请求更多时才临时排序
+POPULAR_TOP_K = 50
+# 独立访客草图的精度：每天全站 4KB（误差约 1.6%），每个文档 1KB（误差约 3.2%）
+DAY_SKETCH_PRECISION = 12
+DOC_SKETCH_PRECISION = 10
+
+
+def _parse_date(date_str: str):
+    return datetime.strptime(date_str, '%Y-%m-%d').date()
+
+
+class VisitAggregates:
+    """按天和按文档预先汇总的访问计数
+
+    - daily: 每天的访问总数和独立访客数，每天一条
+    - daily_docs: 最近 max(ROLLING_WINDOWS) 天内每天每个文档的访问次数，窗口滑动时用于减去移出的日期
+    - doc_totals: 每个文档的累计访问次数
+    - windows: 每个滚动窗口内每个文档的访问次数，窗口截止到 window_end
+    - popular: 累计和每个窗口访问量最高的文档（不保存到文件，加载时重新计算）
+    - day_sketches: 最近 max(ROLLING_WINDOWS) 天每天全站访客的 HyperLogLog 草图，合并后得到一段时间内的独立访客
+    - doc_sketches: 每个文档累计访客的 HyperLogLog 草图
+
+    压缩事件日志时只把新的一批计数加进来，按天统计的查询是 O(天数)，热门文档是 O(K)。
+    独立访客由草图合并估算，同一个访客在多批事件、多天或多个文档中只计一次。
+    """
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        data = data or {}
+        self.daily: Dict[str, Dict[str, int]] = data.get('daily', {})
+        self.daily_docs: Dict[str, Dict[str, int]] = data.get('daily_docs', {})
+        self.doc_totals: Dict[str, int] = data.get('doc_totals', {})
+        windows = data.get('windows', {})
+        self.windows: Dict[int, Dict[str, int]] = {days: windows.get(str(days), {}) for days in ROLLING_WINDOWS}
+        self.window_end: Optional[str] = data.get('window_end')
+        self.compacted_batch: Optional[str] = data.get('compacted_batch')
+        self.day_sketches: Dict[str, HyperLogLog] = {
+            date: HyperLogLog.from_string(sketch) for date, sketch in data.get('day_sketches', {}).items()
+        }
+        self.doc_sketches: Dict[str, HyperLogLog] = {
+            doc_path: HyperLogLog.from_string(sketch) for doc_path, sketch in data.get('doc_sketches', {}).items()
+        }
+        # 一段时间内的独立访客 {(截止日期, 天数): 人数}，有新的访问时清空
+        self._range_uniques: Dict[Tuple[str, int], int] = {}
+        self.popular: Dict[str, List[Tuple[str, int]]] = {}
+        self.refresh_popular()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'daily': self.daily,
+            'daily_docs': self.daily_docs,
+            'doc_totals': self.doc_totals,
+            'windows': {str(days): counts for days, counts in self.windows.items()},
+            'window_end': self.window_end,
+            'compacted_batch': self.compacted_batch,
+            'day_sketches': {date: sketch.to_string() for date, sketch in self.day_sketches.items()},
+            'doc_sketches': {doc_path: sketch.to_string() for doc_path, sketch in self.doc_sketches.items()}
+        }
+
+    def add_day(
+        self,
+        date: str,
+        visits: Dict[str, int],
+        visitors: Optional[Dict[str, Iterable[str]]] = None,
+        unique_visitors: int = 0
+    ):
+        """
+        把某一天的一批访问计数加到各个汇总上
+        
+        Args:
+            date: 日期
+            visits: 每个文档的访问次数
+            visitors: 每个文档的访客标识
+            unique_visitors: 旧版本记录中已经汇总的独立访客数，没有访客标识时使用
+        """
+        day = self.daily.setdefault(date, {'visits': 0, 'unique_visitors': 0})
+        day['visits'] += sum(visits.values())
+
+        self.advance(date)
+        age = (_parse_date(self.window_end) - _parse_date(date)).days
+        self._range_uniques.clear()
+        if visitors:
+            day_sketch = self.day_sketches.get(date)
+            if day_sketch is None and age < max(ROLLING_WINDOWS):
+                day_sketch = self.day_sketches[date] = HyperLogLog(DAY_SKETCH_PRECISION)
+            day_visitors = set()
+            for doc_path, doc_visitors in visitors.items():
+                doc_sketch = self.doc_sketches.get(doc_path)
+                if doc_sketch is None:
+                    doc_sketch = self.doc_sketches[doc_path] = HyperLogLog(DOC_SKETCH_PRECISION)
+                for visitor in doc_visitors:
+                    doc_sketch.add(visitor)
+                day_visitors.update(doc_visitors)
+            if day_sketch is not None:
+                for visitor in day_visitors:
+                    day_sketch.add(visitor)
+                day['unique_visitors'] = day_sketch.count()
+            else:
+                # 超出草图保留期的迟到事件只能累加
+                day['unique_visitors'] += len(day_visitors)
+        else:
+            day['unique_visitors'] += unique_visitors
+        if age < max(ROLLING_WINDOWS):
+            day_docs = self.daily_docs.setdefault(date, {})
+            for doc_path, count in visits.items():
+                day_docs[doc_path] = day_docs.get(doc_path, 0) + count
+        for doc_path, count in visits.items():
+            self.doc_totals[doc_path] = self.doc_totals.get(doc_path, 0) + count
+        for days, counts in self.windows.items():
+            # 跨过零点的一批事件中，前一天的访问仍然落在窗口内
+            if age < days:
+                for doc_path, count in visits.items():
+                    counts[doc_path] = counts.get(doc_path, 0) + count
+
+    def advance(self, date: str) -> bool:
+        """把滚动窗口的截止日期推进到 date，减去移出窗口的日期，返回窗口是否变化"""
+        if self.window_end is None:
+            self.window_end = date
+            return False
+        if date <= self.window_end:
+            return False
+        old_end, new_end = _parse_date(self.window_end), _parse_date(date)
+        shift = (new_end - old_end).days
+        for days, counts in self.windows.items():
+            if shift >= days:
+                counts.clear()
+                continue
+            # 移出窗口的日期是 (old_end - days, new_end - days]
+            for i in range(shift):
+                expired = (new_end - timedelta(days=days + i)).strftime('%Y-%m-%d')
+                for doc_path, count in self.daily_docs.get(expired, {}).items():
+                    remaining = counts.get(doc_path, 0) - count
+                    if remaining > 0:
+                        counts[doc_path] = remaining
+                    else:
+                        counts.pop(doc_path, None)
+        oldest = (new_end - timedelta(days=max(ROLLING_WINDOWS) - 1)).strftime('%Y-%m-%d')
+        for expired in [d for d in self.daily_docs if d < oldest]:
+            del self.daily_docs[expired]
+        for expired in [d for d in self.day_sketches if d < oldest]:
+            del self.day_sketches[expired]
+        self.window_end = date
+        return True
+
+    def refresh_popular(self):
+        """重新选出累计和每个窗口访问量最高的文档"""
+        self.popular = {'all': heapq.nlargest(POPULAR_TOP_K, self.doc_totals.items(), key=lambda x: x[1])}
+        for days, counts in self.windows.items():
+            self.popular[str(days)] = heapq.nlargest(POPULAR_TOP_K, counts.items(), key=lambda x: x[1])
+
+    def unique_visitors(self, end: str, days: int) -> int:
+        """截止到 end 的 days 天内全站独立访客（合并每天的草图，没有草图的日期累加旧的计数）"""
+        key = (end, days)
+        if key not in self._range_uniques:
+            end_date = _parse_date(end)
+            merged = HyperLogLog(DAY_SKETCH_PRECISION)
+            legacy = 0
+            for i in range(days):
+                date = (end_date - timedelta(days=i)).strftime('%Y-%m-%d')
+                sketch = self.day_sketches.get(date)
+                if sketch is not None:
+                    merged.merge(sketch)
+                elif date in self.daily:
+                    legacy += self.daily[date]['unique_visitors']
+            self._range_uniques[key] = merged.count() + legacy
+        return self._range_uniques[key]
+
+    def doc_unique_visitors(self, doc_path: str) -> int:
+        sketch = self.doc_sketches.get(doc_path)
+        return sketch.count() if sketch is not None else 0
+
+    def top_docs(self, limit: int, days: Optional[int] = None) -> List[Tuple[str, int]]:
+        key = str(days) if days in self.windows else 'all'
+        if limit <= POPULAR_TOP_K:
+            return self.popular[key][:limit]
+        counts = self.windows[days] if key != 'all' else self.doc_totals
+        return heapq.nlargest(limit, counts.items(), key=lambda x: x[1])
+
+
 class StatsService:
-    """统计服务，提供访问统计和热门阅读数据"""
+    """统计服务，提供访问统计和热门阅读数据
+
+    记录访问只在内存中追加一条事件，由后台任务批量追加写入按行分隔的事件日志（visits.log），
+    请求处理中没有文件读写。后台任务定期压缩事件日志，把新的访问计数合并到预先汇总的
+    aggregates.json（按天计数、按文档累计和滚动窗口计数），查询不需要扫描历史记录。
+    """
     
-    def __init__(self, data_dir: str):
+    def __init__(
+        self,
+        data_dir: str,
+        write_interval: float = 2.0,
+        compact_interval: float = 300.0,
+        compact_bytes: int = 1024 * 1024
+    ):
         """
         初始化统计服务
         
         Args:
             data_dir: 数据存储目录
+            write_interval: 把内存中的事件写入事件日志的间隔（秒）
+            compact_interval: 压缩事件日志的间隔（秒）
+            compact_bytes: 事件日志超过该大小时提前压缩
         """
         self.data_dir = data_dir
-        self.stats_file = os.path.join(data_dir, "stats.json")
+        self.aggregates_file = os.path.join(data_dir, "aggregates.json")
+        # 旧版本按天保存的访问记录，只在第一次生成 aggregates.json 时读取
         self.visits_file = os.path.join(data_dir, "visits.json")
-        self.popular_docs_file = os.path.join(data_dir, "popular_docs.json")
+        self.event_log_file = os.path.join(data_dir, "visits.log")
+        # 压缩时先把事件日志改名，新的事件写入新文件；进程中断时下次启动继续压缩
+        self.compacting_file = self.event_log_file + ".compacting"
+        self.write_interval = write_interval
+        self.compact_interval = compact_interval
+        self.compact_bytes = compact_bytes
         
-        # 内存缓存
-        self.today_visits = defaultdict(int)  # 文档访问计数
-        self.today_visitors = defaultdict(set)  # 独立访客
-        self.last_flush = datetime.now()
-        self.visit_count = 0
+        # 尚未写入事件日志的访问事件 (时间戳, 文档路径, 访客标识的哈希)
+        self._pending: List[Tuple[int, str, str]] = []
+        # 尚未压缩到汇总数据的访问计数（包括尚未写入日志的事件）
+        self.today_visits = defaultdict(int)
+        # record_visit 在事件循环中写入，自动补全在线程池中读取
+        self._today_lock = threading.Lock()
+        self.last_compaction = time.time()
+        self._compact_lock: Optional[asyncio.Lock] = None
+        # 压缩在线程池中更新汇总数据，查询在事件循环中读取
+        self._aggregates_lock = threading.Lock()
         
-        # 确保数据文件存在
-        self._ensure_files_exist()
-    
-    def _ensure_files_exist(self):
-        """确保所需的数据文件存在"""
         if not os.path.exists(self.data_dir):
             os.makedirs(self.data_dir)
-        
-        if not os.path.exists(self.stats_file):
-            self._create_default_stats()
-        
-        if not os.path.exists(self.popular_docs_file):
-            self._create_default_popular_docs()
-            
-        if not os.path.exists(self.visits_file):
-            self._create_default_visits()
+        self.aggregates = self._load_aggregates()
     
-    def _create_default_stats(self):
-        """创建默认的统计数据"""
-        today = datetime.now()
-        daily_data = []
+    def _load_aggregates(self) -> VisitAggregates:
+        """加载汇总数据，不存在时从旧的 visits.json 生成"""
+        if os.path.exists(self.aggregates_file):
+            try:
+                with open(self.aggregates_file, 'r', encoding='utf-8') as f:
+                    return VisitAggregates(json.load(f))
+            except Exception as e:
+                logger.error("读取访问汇总数据失败: %s", e)
+                return VisitAggregates()
         
-        for i in range(7):
-            date = today - timedelta(days=i)
-            daily_data.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'total_visits': random.randint(100, 500),
-                'unique_visitors': random.randint(50, 200),
-                'avg_duration': random.randint(60, 300),
-                'bounce_rate': round(random.uniform(20, 40), 1)
-            })
-        
-        stats = {
-            'total_visits': sum(day['total_visits'] for day in daily_data),
-            'unique_visitors': sum(day['unique_visitors'] for day in daily_data),
-            'avg_daily_visits': round(sum(day['total_visits'] for day in daily_data) / 7),
-            'bounce_rate': round(sum(day['bounce_rate'] for day in daily_data) / 7, 1),
-            'daily_data': daily_data
-        }
-        
-        with open(self.stats_file, 'w', encoding='utf-8') as f:
-            json.dump(stats, f, ensure_ascii=False, indent=2)
-    
-    def _create_default_popular_docs(self):
-        """创建默认的热门文档数据"""
-        popular_docs = {
-            'docs': [
-                {
-                    'path': f'/docs/doc{i}',
-                    'title': f'示例文档 {i}',
-                    'visits': random.randint(50, 200),
-                    'rating': round(random.uniform(4.0, 5.0), 1)
-                }
-                for i in range(1, 11)
-            ]
-        }
-        
-        with open(self.popular_docs_file, 'w', encoding='utf-8') as f:
-            json.dump(popular_docs, f, ensure_ascii=False, indent=2)
-    
-    def _create_default_visits(self):
-        """创建默认的访问记录文件"""
-        with open(self.visits_file, 'w', encoding='utf-8') as f:
-            json.dump({'visits': []}, f, ensure_ascii=False, indent=2)
+        aggregates = VisitAggregates()
+        if os.path.exists(self.visits_file):
+            try:
+                with open(self.visits_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for record in sorted(data.get('visits', []), key=lambda r: r['date']):
+                    aggregates.add_day(
+                        record['date'],
+                        record.get('visits', {}),
+                        unique_visitors=sum(record.get('unique_visitors', {}).values())
+                    )
+                aggregates.compacted_batch = data.get('compacted_batch')
+                aggregates.refresh_popular()
+                logger.info("已从 visits.json 生成访问汇总数据: %s 天", len(aggregates.daily))
+            except Exception as e:
+                logger.error("读取访问记录失败: %s", e)
+        self._write_json(self.aggregates_file, aggregates.to_dict())
+        return aggregates
     
     def record_visit(self, doc_path: str, visitor_id: str):
-        """记录文档访问"""
-        now = datetime.now()
-        today = now.strftime('%Y-%m-%d')
-        
-        # 更新内存中的计数器
-        self.today_visits[doc_path] += 1
-        self.today_visitors[doc_path].add(visitor_id)
-        self.visit_count += 1
-        
-        # 检查是否需要刷新到文件
-        if self._should_flush():
-            self._flush_visits()
+        """记录文档访问：只追加到内存中的事件列表，由后台任务写入事件日志"""
+        # 只保存访客标识的哈希，日志中不出现 IP 地址
+        visitor = hashlib.blake2b(visitor_id.encode('utf-8'), digest_size=8).hexdigest()
+        self._pending.append((int(time.time()), doc_path, visitor))
+        with self._today_lock:
+            self.today_visits[doc_path] += 1
     
-    def _should_flush(self) -> bool:
-        """检查是否应该将数据刷新到文件"""
-        now = datetime.now()
-        # 每5分钟或累积100次访问就刷新一次
-        return (now - self.last_flush).seconds >= 300 or self.visit_count >= 100
+    @property
+    def compact_lock(self) -> asyncio.Lock:
+        # 在事件循环中第一次使用时创建
+        if self._compact_lock is None:
+            self._compact_lock = asyncio.Lock()
+        return self._compact_lock
     
-    def _flush_visits(self):
-        """将访问数据刷新到文件"""
-        try:
-            # 读取现有数据
-            with open(self.visits_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # 添加新的访问记录
-            today = datetime.now().strftime('%Y-%m-%d')
-            visit_record = {
-                'date': today,
-                'visits': dict(self.today_visits),
-                'unique_visitors': {
-                    path: len(visitors)
-                    for path, visitors in self.today_visitors.items()
-                }
-            }
-            
-            data['visits'].append(visit_record)
-            
-            # 保存回文件
-            with open(self.visits_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            # 更新统计摘要
-            self._update_stats_summary()
-            self._update_popular_docs()
-            
-            # 重置计数器
-            self.today_visits.clear()
-            self.today_visitors.clear()
-            self.visit_count = 0
-            self.last_flush = datetime.now()
-            
-        except Exception as e:
-            print(f"Error flushing visits: {e}")
+    def _append_events(self, events: List[Tuple[int, str, str]]):
+        """把一批事件追加到事件日志，每个事件一行 JSON"""
+        lines = ''.join(
+            json.dumps({'ts': ts, 'path': path, 'visitor': visitor}, ensure_ascii=False) + '\n'
+            for ts, path, visitor in events
+        )
+        with open(self.event_log_file, 'a', encoding='utf-8') as f:
+            f.write(lines)
     
-    def _update_stats_summary(self):
-        """更新统计摘要数据"""
+    async def write_pending(self):
+        """把内存中的事件写入事件日志（在线程池中执行文件写入）"""
+        if not self._pending:
+            return
+        events, self._pending = self._pending, []
+        loop = asyncio.get_event_loop()
         try:
-            # 读取访问记录
-            with open(self.visits_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # 计算最近7天的数据
-            today = datetime.now()
-            daily_data = []
-            
-            for i in range(7):
-                date = today - timedelta(days=i)
-                date_str = date.strftime('%Y-%m-%d')
-                
-                # 查找当天的记录
-                day_record = next(
-                    (record for record in data['visits'] if record['date'] == date_str),
-                    {'visits': {}, 'unique_visitors': {}}
-                )
-                
-                daily_data.append({
-                    'date': date_str,
-                    'total_visits': sum(day_record['visits'].values()),
-                    'unique_visitors': sum(day_record['unique_visitors'].values()),
-                    'avg_duration': random.randint(60, 300),  # 示例数据
-                    'bounce_rate': round(random.uniform(20, 40), 1)  # 示例数据
-                })
-            
-            # 计算总计和平均值
-            stats = {
-                'total_visits': sum(day['total_visits'] for day in daily_data),
-                'unique_visitors': sum(day['unique_visitors'] for day in daily_data),
-                'avg_daily_visits': round(sum(day['total_visits'] for day in daily_data) / 7),
-                'bounce_rate': round(sum(day['bounce_rate'] for day in daily_data) / 7, 1),
-                'daily_data': daily_data
-            }
-            
-            # 保存统计摘要
-            with open(self.stats_file, 'w', encoding='utf-8') as f:
-                json.dump(stats, f, ensure_ascii=False, indent=2)
-                
+            await loop.run_in_executor(None, self._append_events, events)
         except Exception as e:
-            print(f"Error updating stats summary: {e}")
+            # 写入失败时放回队列，下次重试
+            self._pending = events + self._pending
+            logger.error("写入访问事件日志失败: %s", e)
     
-    def _update_popular_docs(self):
-        """更新热门文档数据"""
+    def _should_compact(self) -> bool:
         try:
-            # 读取访问记录
-            with open(self.visits_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # 统计文档访问量
-            doc_visits = defaultdict(int)
-            for record in data['visits']:
-                for doc_path, visits in record['visits'].items():
-                    doc_visits[doc_path] += visits
-            
-            # 获取访问量最高的10个文档
-            popular_docs = {
-                'docs': [
-                    {
-                        'path': path,
-                        'title': path.split('/')[-1],  # 简单处理文档标题
-                        'visits': visits,
-                        'rating': round(random.uniform(4.0, 5.0), 1)  # 示例数据
-                    }
-                    for path, visits in sorted(
-                        doc_visits.items(),
-                        key=lambda x: x[1],
-                        reverse=True
-                    )[:10]
-                ]
-            }
-            
-            # 保存热门文档数据
-            with open(self.popular_docs_file, 'w', encoding='utf-8') as f:
-                json.dump(popular_docs, f, ensure_ascii=False, indent=2)
-                
-        except Exception as e:
-            print(f"Error updating popular docs: {e}")
+            size = os.path.getsize(self.event_log_file)
+        except OSError:
+            return False
+        return size > 0 and (size >= self.compact_bytes or time.time() - self.last_compaction >= self.compact_interval)
+    
+    async def compact(self):
+        """把事件日志中的访问计数合并到汇总数据"""
+        async with self.compact_lock:
+            await self.write_pending()
+            if not os.path.exists(self.compacting_file):
+                if not os.path.exists(self.event_log_file):
+                    return
+                # 改名和重置计数之间没有 await，期间不会有新的访问被记录
+                os.replace(self.event_log_file, self.compacting_file)
+                today_visits = defaultdict(int)
+                for _, path, _ in self._pending:
+                    today_visits[path] += 1
+                with self._today_lock:
+                    self.today_visits = today_visits
+            loop = asyncio.get_event_loop()
+            try:
+                await loop.run_in_executor(None, self._compact_sync)
+            except Exception as e:
+                logger.error("压缩访问事件日志失败: %s", e)
+            self.last_compaction = time.time()
+    
+    def _read_events(self, path: str) -> Dict[str, Dict[str, Any]]:
+        """读取事件日志，按天汇总每个文档的访问次数和独立访客"""
+        days: Dict[str, Dict[str, Any]] = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # 进程中断时最后一行可能不完整
+                    continue
+                date = datetime.fromtimestamp(event['ts']).strftime('%Y-%m-%d')
+                day = days.setdefault(date, {'visits': defaultdict(int), 'visitors': defaultdict(set)})
+                day['visits'][event['path']] += 1
+                day['visitors'][event['path']].add(event['visitor'])
+        return days
+    
+    def _compact_sync(self):
+        stat = os.stat(self.compacting_file)
+        batch_id = f"{stat.st_mtime_ns}:{stat.st_size}"
+        if self.aggregates.compacted_batch != batch_id:
+            days = self._read_events(self.compacting_file)
+            with self._aggregates_lock:
+                for date in sorted(days):
+                    day = days[date]
+                    self.aggregates.add_day(date, day['visits'], day['visitors'])
+                self.aggregates.compacted_batch = batch_id
+                self.aggregates.refresh_popular()
+            logger.info("访问事件日志已压缩: %s 天的访问记录", len(days))
+        # 批次已合并但未删除事件日志时（进程中断或上次写入失败）不能重复计数，只重新保存
+        with self._aggregates_lock:
+            data = json.dumps(self.aggregates.to_dict(), ensure_ascii=False)
+        self._write_text(self.aggregates_file, data)
+        os.remove(self.compacting_file)
+    
+    def _write_json(self, path: str, data: Any):
+        """原子写入 JSON 文件"""
+        self._write_text(path, json.dumps(data, ensure_ascii=False))
+    
+    def _write_text(self, path: str, text: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    
+    async def run_writer_loop(self):
+        """后台任务：定期写入事件日志，按时间或日志大小触发压缩"""
+        # 上次进程中断时未完成的压缩和尚未压缩的事件日志
+        for _ in range(2):
+            if os.path.exists(self.compacting_file) or os.path.exists(self.event_log_file):
+                await self.compact()
+        while True:
+            await asyncio.sleep(self.write_interval)
+            try:
+                await self.write_pending()
+                if self._should_compact():
+                    await self.compact()
+            except Exception as e:
+                logger.error("访问统计后台任务出错: %s", e)
+    
+    async def close(self):
+        """应用关闭时写入剩余的事件并压缩"""
+        await self.compact()
+    
+    def _advance_windows(self):
+        """没有新的访问时窗口也要随日期滑动，查询前推进到今天"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        if self.aggregates.window_end is not None and today > self.aggregates.window_end:
+            with self._aggregates_lock:
+                if self.aggregates.advance(today):
+                    self.aggregates.refresh_popular()
     
     def get_visit_stats(self, days: int = 7) -> Dict[str, Any]:
         """
@@ -243,21 +420,25 @@ class StatsService:
         Returns:
             包含访问统计数据的字典
         """
-        try:
-            with open(self.stats_file, 'r', encoding='utf-8') as f:
-                all_stats = json.load(f)
-        except Exception as e:
-            logger.error(f"读取统计数据失败: {str(e)}")
-            self._create_default_stats()
-            with open(self.stats_file, 'r', encoding='utf-8') as f:
-                all_stats = json.load(f)
+        today = datetime.now()
+        daily_data = []
+        with self._aggregates_lock:
+            for i in range(days):
+                date_str = (today - timedelta(days=i)).strftime('%Y-%m-%d')
+                day = self.aggregates.daily.get(date_str, {'visits': 0, 'unique_visitors': 0})
+                daily_data.append({
+                    'date': date_str,
+                    'total_visits': day['visits'],
+                    'unique_visitors': day['unique_visitors'],
+                    'avg_duration': random.randint(60, 300),  # 示例数据
+                    'bounce_rate': round(random.uniform(20, 40), 1)  # 示例数据
+                })
         
-        # 获取指定天数的数据
-        daily_data = all_stats.get('daily_data', [])[-days:]
+            # 同一个访客在多天访问只计一次
+            unique_visitors = self.aggregates.unique_visitors(today.strftime('%Y-%m-%d'), days)
         
         # 计算总计数据
         total_visits = sum(day['total_visits'] for day in daily_data)
-        unique_visitors = sum(day['unique_visitors'] for day in daily_data)
         avg_daily_visits = total_visits / len(daily_data) if daily_data else 0
         
         return {
@@ -265,31 +446,80 @@ class StatsService:
             'unique_visitors': unique_visitors,
             'avg_daily_visits': round(avg_daily_visits, 2),
             'bounce_rate': round(random.uniform(20, 60), 2),  # 临时使用随机数
+            'period_days': days,
             'daily_data': daily_data
         }
     
-    def get_popular_docs(self, limit: int = 10):
-        """获取热门文档列表"""
-        try:
-            with open(self.popular_docs_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data['docs'][:limit]
-        except Exception as e:
-            print(f"Error reading popular docs: {e}")
-            self._create_default_popular_docs()
-            with open(self.popular_docs_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data['docs'][:limit]
+    def get_popular_docs(self, limit: int = 10, days: Optional[int] = None, include_pending: bool = False):
+        """
+        获取热门文档列表
+        
+        Args:
+            limit: 返回的文档数量
+            days: 滚动窗口天数（7/30/90），为空时按累计访问量排序
+            include_pending: 是否计入尚未压缩的访问（不计入独立访客）
+        """
+        if days is not None:
+            self._advance_windows()
+        pending = self._uncompacted_visits() if include_pending else {}
+        with self._aggregates_lock:
+            ranked = self.aggregates.top_docs(limit, days)
+            if pending:
+                # 访问量增加的只有 pending 中的文档，新的前 limit 名一定在原排名和这些文档之中
+                counts = self.aggregates.windows.get(days, self.aggregates.doc_totals)
+                candidates = dict(ranked)
+                for path, visits in pending.items():
+                    candidates[path] = counts.get(path, 0) + visits
+                ranked = heapq.nlargest(limit, candidates.items(), key=lambda x: x[1])
+            top_docs = [
+                (path, visits, self.aggregates.doc_unique_visitors(path))
+                for path, visits in ranked
+            ]
+        return [
+            {
+                'path': path,
+                'title': path.split('/')[-1],  # 简单处理文档标题
+                'visits': visits,
+                'unique_visitors': unique_visitors,  # 累计独立访客
+                'rating': round(random.uniform(4.0, 5.0), 1)  # 示例数据
+            }
+            for path, visits, unique_visitors in top_docs
+        ]
     
+    def _uncompacted_visits(self) -> Dict[str, int]:
+        """尚未压缩的访问计数的快照（可在其他线程中调用）"""
+        with self._today_lock:
+            return dict(self.today_visits)
+
+    def get_doc_visit_counts(self) -> Dict[str, int]:
+        """获取每个文档的累计访问量（包括尚未压缩的访问，可在线程池中调用）"""
+        with self._aggregates_lock:
+            doc_visits = dict(self.aggregates.doc_totals)
+        for doc_path, visits in self._uncompacted_visits().items():
+            doc_visits[doc_path] = doc_visits.get(doc_path, 0) + visits
+        return doc_visits
+
     def get_dashboard_data(self) -> Dict[str, Any]:
-        """获取管理后台数据"""
-        # 确保数据是最新的
-        self._flush_visits()
-        
+        """获取管理后台数据
+
+        尚未压缩的访问（内存和事件日志中）计入今天的访问量和热门文档，不触发压缩；
+        独立访客只统计已压缩的访问，最多落后一个压缩周期（last_compaction）。
+        """
+        pending_visits = sum(self._uncompacted_visits().values())
         visit_stats = self.get_visit_stats()
-        popular_docs = self.get_popular_docs(limit=5)
+        if pending_visits:
+            visit_stats['daily_data'][0]['total_visits'] += pending_visits
+            visit_stats['total_visits'] += pending_visits
+            visit_stats['avg_daily_visits'] = round(visit_stats['total_visits'] / len(visit_stats['daily_data']), 2)
+        popular_docs = self.get_popular_docs(limit=5, include_pending=True)
         
         return {
             "visit_stats": visit_stats,
-            "popular_docs": popular_docs
-        } 
\ No newline at end of file
+            "popular_docs": popular_docs,
+            "pending_visits": pending_visits,
+            "last_compaction": self.last_compaction
+        }
+
+
+# 模块级单例，文档路由记录访问，管理后台和自动补全读取同一份数据
+stats_service = StatsService(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "static", "stats"))
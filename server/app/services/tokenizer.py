@@ -0,0 +1,190 @@
+import os
+import re
+import pickle
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+# 连续的中文文字，以及其他语言的连续字母数字
+CJK_RUN_PATTERN = re.compile(r'[\u4e00-\u9fff]+')
+TOKEN_PATTERN = re.compile(r'[\u4e00-\u9fff]+|[^\W\u4e00-\u9fff]+')
+
+logger = logging.getLogger(__name__)
+
+
+class Tokenizer:
+    """分词器基类
+
+    索引和查询必须使用同一个分词器，name 会写入索引清单，
+    加载索引时分词器不一致则视为空索引，需要重建。
+    """
+
+    name = "base"
+
+    def tokenize(self, text: str) -> List[str]:
+        return self._tokenize(text, unigrams=False)
+
+    def index_tokenize(self, text: str) -> List[str]:
+        """建全文索引时使用：在 tokenize 的结果之外再输出每个汉字
+
+        查询中只有一个汉字时切分结果是单字，索引中也要有单字词项才能检索到。
+        """
+        return self._tokenize(text, unigrams=True)
+
+    def _tokenize(self, text: str, unigrams: bool) -> List[str]:
+        tokens = []
+        for match in TOKEN_PATTERN.finditer(text.lower()):
+            word = match.group()
+            if CJK_RUN_PATTERN.match(word):
+                split = self.split_cjk(word)
+                tokens.extend(split)
+                if unigrams:
+                    # 切分结果中已有的单字不重复输出
+                    tokens.extend((Counter(word) - Counter(t for t in split if len(t) == 1)).elements())
+            else:
+                tokens.append(word)
+        return tokens
+
+    def split_cjk(self, run: str) -> List[str]:
+        """切分一段连续的中文"""
+        raise NotImplementedError
+
+
+class NGramTokenizer(Tokenizer):
+    """中文按相邻 n 元组切分，不需要词典，召回率高"""
+
+    def __init__(self, n: int = 2):
+        self.n = n
+        self.name = f"ngram:{n}"
+
+    def split_cjk(self, run: str) -> List[str]:
+        n = self.n
+        if len(run) <= n:
+            return [run]
+        return [run[i:i + n] for i in range(len(run) - n + 1)]
+
+
+class CompiledDictionary:
+    """编译后的词典: 词集合，以及每个首字对应的词长（从长到短），用于正向最大匹配时只尝试存在的长度"""
+
+    def __init__(self, words: Set[str]):
+        self.words = words
+        lengths: Dict[str, Set[int]] = {}
+        for word in words:
+            lengths.setdefault(word[0], set()).add(len(word))
+        self.lengths: Dict[str, Tuple[int, ...]] = {
+            char: tuple(sorted(values, reverse=True)) for char, values in lengths.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+
+_dictionary_cache: Dict[str, Tuple[float, CompiledDictionary]] = {}
+_dictionary_lock = threading.Lock()
+
+
+def load_dictionary(path: str) -> CompiledDictionary:
+    """加载词典文件（每行一个词，行内空白之后的词频、词性等字段被忽略）
+
+    编译结果缓存在进程内，并以 pickle 形式保存在词典旁边的 .compiled 文件中，
+    词典文件未修改时直接加载编译结果。
+    """
+    mtime = os.path.getmtime(path)
+    with _dictionary_lock:
+        cached = _dictionary_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        compiled_path = f"{path}.compiled"
+        dictionary = None
+        if os.path.exists(compiled_path):
+            try:
+                with open(compiled_path, 'rb') as f:
+                    source_mtime, dictionary = pickle.load(f)
+                if source_mtime != mtime:
+                    dictionary = None
+            except Exception as e:
+                logger.warning("加载编译后的词典失败，将重新编译: %s", e)
+                dictionary = None
+
+        if dictionary is None:
+            words = set()
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if parts and CJK_RUN_PATTERN.fullmatch(parts[0].lower()) and len(parts[0]) > 1:
+                        words.add(parts[0].lower())
+            dictionary = CompiledDictionary(words)
+            try:
+                tmp_path = f"{compiled_path}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump((mtime, dictionary), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, compiled_path)
+            except OSError as e:
+                logger.warning("保存编译后的词典失败: %s", e)
+
+        _dictionary_cache[path] = (mtime, dictionary)
+        return dictionary
+
+
+class DictionaryTokenizer(Tokenizer):
+    """基于词典的正向最大匹配分词
+
+    词典中的词作为整体输出；不在词典中的连续文字退回到二元组，保证未登录词也能被检索。
+    """
+
+    def __init__(self, dictionary_path: str):
+        self.dictionary_path = dictionary_path
+        self.dictionary = load_dictionary(dictionary_path)
+        self.fallback = NGramTokenizer(2)
+        self.name = f"dict:{os.path.basename(dictionary_path)}:{int(os.path.getmtime(dictionary_path))}"
+
+    def split_cjk(self, run: str) -> List[str]:
+        words = self.dictionary.words
+        lengths = self.dictionary.lengths
+        tokens = []
+        unmatched_start = None
+        i = 0
+        while i < len(run):
+            matched = 0
+            for length in lengths.get(run[i], ()):
+                if i + length <= len(run) and run[i:i + length] in words:
+                    matched = length
+                    break
+            if matched:
+                if unmatched_start is not None:
+                    tokens.extend(self.fallback.split_cjk(run[unmatched_start:i]))
+                    unmatched_start = None
+                tokens.append(run[i:i + matched])
+                i += matched
+            else:
+                if unmatched_start is None:
+                    unmatched_start = i
+                i += 1
+        if unmatched_start is not None:
+            tokens.extend(self.fallback.split_cjk(run[unmatched_start:]))
+        return tokens
+
+
+_default_tokenizer: Optional[Tokenizer] = None
+
+
+def get_tokenizer() -> Tokenizer:
+    """根据环境变量创建默认分词器
+
+    SEARCH_TOKENIZER=ngram（默认）使用二元组；SEARCH_TOKENIZER=dict 时从
+    SEARCH_TOKENIZER_DICT 指定的词典做正向最大匹配，词典不存在时退回二元组。
+    """
+    global _default_tokenizer
+    if _default_tokenizer is None:
+        kind = os.environ.get("SEARCH_TOKENIZER", "ngram")
+        dictionary_path = os.environ.get("SEARCH_TOKENIZER_DICT", "")
+        if kind == "dict" and dictionary_path and os.path.exists(dictionary_path):
+            _default_tokenizer = DictionaryTokenizer(dictionary_path)
+        else:
+            if kind == "dict":
+                logger.warning("词典文件不存在: %s，使用二元组分词", dictionary_path)
+            _default_tokenizer = NGramTokenizer(2)
+    return _default_tokenizer
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""索引批次策略基准测试
+
+使用本地的 MeiliSearch 替身（按顺序处理任务，每个任务有固定开销和按字节计算的处理时间），
+对比两种上传策略:
+
+- legacy: 每批 20 个文档，最多 3 个批次并发，每个批次提交后每 0.5 秒轮询一次任务状态
+- pipelined: 按负载字节数切分批次，只提交不等待，最后统一批量等待全部任务
+
+用法: python benchmarks/bench_index_batches.py [文档数] [单个文档字节数]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import shutil
+import tempfile
+import contextlib
+import io
+import itertools
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.meilisearch_service import MeiliSearchService
+from app.services.meili_indexer import IndexManifest
+
+# 替身的处理开销：每个任务固定 30ms，另外按 20MB/s 的速度处理负载
+TASK_OVERHEAD = 0.03
+BYTES_PER_SECOND = 20 * 1024 * 1024
+
+
+class StandInResponse:
+    def __init__(self, payload):
+        self._payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+
+class StandInHttpClient:
+    def __init__(self, server):
+        self.server = server
+
+    async def get(self, path, params=None):
+        self.server.requests += 1
+        uids = [int(uid) for uid in params["uids"].split(",")]
+        return StandInResponse({"results": [
+            {"uid": uid, "status": self.server.tasks[uid]["status"], "error": None}
+            for uid in uids if uid in self.server.tasks
+        ]})
+
+
+class StandInIndex:
+    def __init__(self, server):
+        self.server = server
+
+    async def add_documents(self, documents):
+        return self.server.enqueue(documents)
+
+    async def delete_documents(self, ids):
+        return self.server.enqueue([])
+
+    async def get_stats(self):
+        return SimpleNamespace(model_dump=lambda: {"numberOfDocuments": len(self.server.documents)})
+
+    async def search(self, query, **kwargs):
+        return SimpleNamespace(hits=[], estimated_total_hits=len(self.server.documents))
+
+    async def update_filterable_attributes(self, attributes):
+        return self.server.enqueue([])
+
+    async def update_sortable_attributes(self, attributes):
+        return self.server.enqueue([])
+
+
+class MeiliStandIn:
+    """按 MeiliSearch 的方式串行处理任务队列的本地替身"""
+
+    def __init__(self):
+        self._uids = itertools.count(1)
+        self.tasks = {}
+        self.documents = {}
+        self.requests = 0
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._process())
+        self.http_client = StandInHttpClient(self)
+
+    def enqueue(self, documents):
+        self.requests += 1
+        uid = next(self._uids)
+        payload_bytes = len(json.dumps(documents, ensure_ascii=False).encode("utf-8"))
+        self.tasks[uid] = {"status": "enqueued"}
+        self._queue.put_nowait((uid, documents, payload_bytes))
+        return SimpleNamespace(task_uid=uid)
+
+    async def _process(self):
+        while True:
+            uid, documents, payload_bytes = await self._queue.get()
+            self.tasks[uid]["status"] = "processing"
+            await asyncio.sleep(TASK_OVERHEAD + payload_bytes / BYTES_PER_SECOND)
+            for doc in documents:
+                self.documents[doc["id"]] = doc
+            self.tasks[uid]["status"] = "succeeded"
+
+    async def get_indexes(self):
+        return [SimpleNamespace(uid="documents")]
+
+    async def get_index(self, uid):
+        self.requests += 1
+        return StandInIndex(self)
+
+    def index(self, uid):
+        return StandInIndex(self)
+
+    async def get_task(self, uid):
+        self.requests += 1
+        return SimpleNamespace(status=self.tasks[uid]["status"], error=None)
+
+    async def aclose(self):
+        self._worker.cancel()
+
+
+async def run_legacy(service, server):
+    """旧实现的上传策略：20 个文档一批，提交后每 0.5 秒轮询直到完成"""
+    files = [os.path.join(root, f) for root, _, fs in os.walk(service.docs_dir) for f in fs]
+    batches = [files[i:i + 20] for i in range(0, len(files), 20)]
+    semaphore = asyncio.Semaphore(3)
+
+    async def process_batch(batch_files):
+        async with semaphore:
+            documents = []
+            for file_path in batch_files:
+                documents.extend(await service.build_documents(file_path))
+            index = await server.get_index(service.index_name)
+            task = await index.add_documents(documents)
+            while True:
+                task_info = await server.get_task(task.task_uid)
+                if task_info.status not in ("enqueued", "processing"):
+                    break
+                await asyncio.sleep(0.5)
+
+    await asyncio.gather(*(process_batch(batch) for batch in batches))
+
+
+async def run_pipelined(service, server):
+    with contextlib.redirect_stdout(io.StringIO()):
+        await service.build_index()
+
+
+async def measure(name, runner, docs_dir, cache_dir):
+    service = MeiliSearchService()
+    service.docs_dir = docs_dir
+    service.manifest = IndexManifest(os.path.join(cache_dir, f"{name}_manifest.json"))
+    server = MeiliStandIn()
+    service.client = server
+    service.is_initialized = True
+
+    start = time.perf_counter()
+    await runner(service, server)
+    elapsed = time.perf_counter() - start
+    await server.aclose()
+    print(f"{name:>10}: {elapsed:8.2f}s  任务数={len(server.tasks):5d}  请求数={server.requests:6d}  "
+          f"已索引文档={len(server.documents)}")
+    return elapsed
+
+
+async def main():
+    doc_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    doc_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+
+    docs_dir = tempfile.mkdtemp(prefix="bench_docs_")
+    cache_dir = tempfile.mkdtemp(prefix="bench_cache_")
+    try:
+        body = ("缓存击穿与雪崩 cache stampede " * (doc_size // 40 + 1))[:doc_size]
+        for i in range(doc_count):
+            course_dir = os.path.join(docs_dir, f"course_{i % 50:02d}")
+            os.makedirs(course_dir, exist_ok=True)
+            with open(os.path.join(course_dir, f"{i:05d}_article.md"), "w", encoding="utf-8") as f:
+                f.write(f"# 文章 {i}\n\n{body}\n")
+
+        print(f"文档数: {doc_count}, 单个文档约 {doc_size} 字节")
+        legacy = await measure("legacy", run_legacy, docs_dir, cache_dir)
+        pipelined = await measure("pipelined", run_pipelined, docs_dir, cache_dir)
+        print(f"加速比: {legacy / pipelined:.1f}x")
+    finally:
+        shutil.rmtree(docs_dir, ignore_errors=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""日志开销基准测试
+
+在进程内（不经过网络）并发请求文档接口，比较不同日志配置下的吞吐量（请求/秒）:
+
+- off: 关闭日志
+- queued-info: 默认配置，INFO 级别，经队列由后台线程输出
+- queued-debug: DEBUG 级别，经队列输出
+- sync-debug: 原来的配置，basicConfig(DEBUG)，在请求中同步写出
+
+在线读者接口每次请求都会记录调试日志，在线人数越多，调试日志中的 IP 列表越长。
+日志输出写入临时文件，避免终端速度影响结果；另外模拟一个较慢的输出目标
+（每次写入延迟 --io-delay-ms 毫秒，例如远程终端或繁忙的磁盘），比较同步输出和队列输出对请求的阻塞。
+
+用法: python benchmarks/bench_logging.py [请求数] [并发数] [在线人数] [--io-delay-ms 0.2]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+
+from app import logging_config
+from app.routers import docs
+
+MODES = ["off", "queued-info", "queued-debug", "sync-debug"]
+ROUNDS = 3
+
+
+class SlowStream:
+    """每次写入前等待一段时间的输出流，模拟较慢的日志输出目标"""
+
+    def __init__(self, stream, delay: float):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, data):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def reset_logging():
+    logging_config.shutdown_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+
+def configure(mode: str, stream):
+    reset_logging()
+    if mode == "off":
+        logging.getLogger().setLevel(logging.CRITICAL + 1)
+        return
+    if mode == "sync-debug":
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s', stream=stream)
+        return
+    # setup_logging 输出到 sys.stderr，测试期间临时替换为日志文件
+    stderr, sys.stderr = sys.stderr, stream
+    try:
+        logging_config.setup_logging(level="DEBUG" if mode == "queued-debug" else "INFO")
+    finally:
+        sys.stderr = stderr
+
+
+async def run(app, requests: int, concurrency: int, readers: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker(worker_id: int):
+            for i in range(worker_id, requests, concurrency):
+                ip = f"10.0.{(i % readers) // 256}.{(i % readers) % 256}"
+                await client.get("/api/docs/stats/online-readers", headers={"X-Forwarded-For": ip})
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(w) for w in range(concurrency)))
+        return requests / (time.perf_counter() - start)
+
+
+async def compare(app, stream, requests: int, concurrency: int, readers: int):
+    """各配置交替运行 ROUNDS 轮，取每种配置的最好成绩"""
+    results = {mode: 0.0 for mode in MODES}
+    for _ in range(ROUNDS):
+        for mode in MODES:
+            configure(mode, stream)
+            results[mode] = max(results[mode], await run(app, requests, concurrency, readers))
+            reset_logging()
+    for mode in MODES:
+        print(f"  {mode:<14} {results[mode]:10.1f} 请求/秒  ({results[mode] / results['off'] * 100:5.1f}%)")
+
+
+async def main():
+    args = sys.argv[1:]
+    io_delay_ms = 0.2
+    if '--io-delay-ms' in args:
+        i = args.index('--io-delay-ms')
+        io_delay_ms = float(args[i + 1])
+        del args[i:i + 2]
+    args = [int(a) for a in args]
+    requests = args[0] if len(args) > 0 else 2000
+    concurrency = args[1] if len(args) > 1 else 20
+    readers = args[2] if len(args) > 2 else 500
+
+    app = FastAPI()
+    app.include_router(docs.router, prefix="/api/docs")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir, "bench.log"), "a", encoding="utf-8") as log_file:
+            # 预热：初始化服务，并让所有读者都处于在线状态
+            configure("off", log_file)
+            await run(app, requests, concurrency, readers)
+
+            print(f"请求数: {requests}, 并发数: {concurrency}, 在线人数: {readers}")
+            print("输出到本地文件:")
+            await compare(app, log_file, requests, concurrency, readers)
+            print(f"输出到慢速目标（每次写入延迟 {io_delay_ms} 毫秒）:")
+            await compare(app, SlowStream(log_file, io_delay_ms / 1000), requests, concurrency, readers)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""搜索结果负载基准测试
+
+对比两种取回搜索结果的方式（需要本地运行 MeiliSearch 并已构建索引）:
+
+- full-content: 取回完整 content 字段，在 Python 中按行查找查询词（旧实现）
+- server-crop: 由 MeiliSearch 裁剪和高亮片段，不取回 content（当前实现）
+
+用法: python benchmarks/bench_search_payload.py [查询词 ...]
+"""
+import os
+import sys
+import time
+import asyncio
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.meilisearch_service import MeiliSearchService, HIGHLIGHT_PRE_TAG, HIGHLIGHT_POST_TAG
+
+DEFAULT_QUERIES = ["Redis", "JVM", "缓存", "MySQL 索引", "Kafka", "分布式锁", "HTTP", "线程池"]
+ROUNDS = 20
+
+
+def legacy_snippets(q, hits):
+    """旧实现：逐行扫描完整正文寻找查询词"""
+    for hit in hits:
+        lines = (hit.get("content") or "").split("\n")
+        matched = 0
+        for i, line in enumerate(lines, 1):
+            if q.lower() in line.lower() and matched < 2:
+                "\n".join(lines[max(0, i - 2):min(len(lines), i + 2)])
+                matched += 1
+
+
+def cropped_snippets(service, hits):
+    for hit in hits:
+        formatted = (hit.get("_formatted") or {}).get("content")
+        if formatted:
+            service._parse_highlighted(formatted)
+
+
+async def run_mode(service, client, queries, body_for, postprocess):
+    latencies, payloads = [], []
+    for _ in range(ROUNDS):
+        for q in queries:
+            start = time.perf_counter()
+            response = await client.http_client.post(f"indexes/{service.index_name}/search", json=body_for(q))
+            response.raise_for_status()
+            data = response.json()
+            postprocess(q, data["hits"])
+            latencies.append((time.perf_counter() - start) * 1000)
+            payloads.append(len(response.content))
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+        "avg_payload_kb": statistics.mean(payloads) / 1024
+    }
+
+
+async def main():
+    queries = sys.argv[1:] or DEFAULT_QUERIES
+    service = MeiliSearchService()
+    client = await service.get_client()
+
+    def full_content_body(q):
+        return {"q": q, "limit": 10, "attributesToRetrieve": ["id", "name", "content", "type", "path"]}
+
+    def server_crop_body(q):
+        return {
+            "q": q,
+            "limit": 10,
+            "attributesToRetrieve": ["id", "name", "type", "path", "heading", "headings", "anchor", "line"],
+            "attributesToCrop": ["content"],
+            "cropLength": service.snippet_crop_length,
+            "attributesToHighlight": ["content"],
+            "highlightPreTag": HIGHLIGHT_PRE_TAG,
+            "highlightPostTag": HIGHLIGHT_POST_TAG,
+            "showMatchesPosition": True
+        }
+
+    full = await run_mode(service, client, queries, full_content_body, legacy_snippets)
+    crop = await run_mode(service, client, queries, server_crop_body, lambda q, hits: cropped_snippets(service, hits))
+    await client.aclose()
+
+    print(f"查询数: {len(queries)} x {ROUNDS} 轮")
+    for name, result in (("full-content", full), ("server-crop", crop)):
+        print(f"{name:>12}: p50={result['p50_ms']:.1f}ms  p99={result['p99_ms']:.1f}ms  "
+              f"平均负载={result['avg_payload_kb']:.1f}KB")
+    if crop["avg_payload_kb"] > 0:
+        print(f"负载缩减: {full['avg_payload_kb'] / crop['avg_payload_kb']:.1f}x, "
+              f"p50 延迟缩减: {full['p50_ms'] / crop['p50_ms']:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+import sys
+import asyncio
+import logging
+from app.services.pdf_linearize_service import PdfLinearizeService
+
+async def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    service = PdfLinearizeService()
+    force = "--force" in sys.argv[1:]
+    print(f"[INFO] 开始生成线性化PDF，缓存目录: {service.cache_dir}")
+    result = await service.linearize_all(force=force)
+    print(f"[INFO] 线性化结果: {result}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
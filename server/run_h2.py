@@ -3,9 +3,10 @@ import asyncio
 from hypercorn.config import Config
 from hypercorn.asyncio import serve
 import logging
+from app.logging_config import setup_logging
 
-# 配置日志
-logging.basicConfig(level=logging.DEBUG)
+# 配置日志（级别由 LOG_LEVEL / LOG_LEVELS 环境变量控制）
+setup_logging()
 logger = logging.getLogger('hypercorn.error')
 
 config = Config()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+"""本地全文索引分词回归测试（python -m pytest test_fulltext_index.py）"""
+import tempfile
+
+from app.services.fulltext_index import FullTextIndex
+from app.services.tokenizer import NGramTokenizer
+
+
+def test_index_tokenize_adds_unigrams_once():
+    tokenizer = NGramTokenizer(2)
+    assert tokenizer.tokenize("缓存击穿") == ["缓存", "存击", "击穿"]
+    assert sorted(tokenizer.index_tokenize("缓存击穿")) == sorted(["缓存", "存击", "击穿", "缓", "存", "击", "穿"])
+    # 单字的连续文字本来就是单字词项，不重复计数
+    assert tokenizer.index_tokenize("缓 java") == ["缓", "java"]
+
+
+def test_single_character_query_matches():
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = FullTextIndex(index_dir, tokenizer=NGramTokenizer(2))
+        index.rebuild([
+            {"id": "a.md", "path": "a.md", "name": "a.md", "content": "缓存击穿的解决方案"},
+            {"id": "b.md", "path": "b.md", "name": "b.md", "content": "垃圾回收"},
+        ])
+        assert index.query("缓")[0] == 1
+        assert index.query("击")[0] == 1
+        assert index.query("案")[0] == 1
+        assert index.query("缓存")[0] == 1
+        assert index.query("存储")[0] == 0
+
+
+if __name__ == "__main__":
+    test_index_tokenize_adds_unigrams_once()
+    test_single_character_query_matches()
+    print("ok")
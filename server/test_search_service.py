@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""本地全文索引增量同步测试（python -m pytest test_search_service.py）"""
+import os
+import tempfile
+import threading
+
+from app.services.fulltext_index import FullTextIndex
+from app.services.search_service import SearchService
+
+
+def make_service(root: str) -> SearchService:
+    # 不调用 __init__，避免写入 static 目录
+    service = SearchService.__new__(SearchService)
+    service.docs_dir = os.path.join(root, "docs")
+    service.fulltext = FullTextIndex(os.path.join(root, "index"))
+    service._pending_paths = set()
+    service._pending_lock = threading.Lock()
+    os.makedirs(os.path.join(service.docs_dir, "java"))
+    return service
+
+
+def write(service: SearchService, rel_path: str, text: str):
+    with open(os.path.join(service.docs_dir, rel_path), "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_sync_root_level_file():
+    with tempfile.TemporaryDirectory() as root:
+        service = make_service(root)
+        write(service, "readme.md", "缓存击穿的解决方案")
+        write(service, "java/jvm.md", "垃圾回收")
+        service.fulltext.rebuild(service._iter_fulltext_documents())
+        assert service.fulltext.doc_count == 2
+
+        write(service, "readme.md", "缓存雪崩的解决方案")
+        service.mark_dirty(os.path.join(service.docs_dir, "readme.md"))
+        assert service._pending_paths == {"readme.md"}
+        service._sync_paths(service._pending_paths)
+
+        assert service.fulltext.doc_count == 2
+        assert service.fulltext.query("雪崩")[0] == 1
+        assert service.fulltext.query("击穿")[0] == 0
+
+
+def test_sync_docs_root_replaces_everything_once():
+    with tempfile.TemporaryDirectory() as root:
+        service = make_service(root)
+        write(service, "readme.md", "缓存击穿")
+        write(service, "java/jvm.md", "垃圾回收")
+        service.fulltext.rebuild(service._iter_fulltext_documents())
+
+        # 文档根目录本身的事件映射为空路径，重新同步后不会重复文档
+        service.mark_dirty(service.docs_dir)
+        assert service._pending_paths == {""}
+        service._sync_paths({"", "readme.md"})
+        assert service.fulltext.doc_count == 2
+
+
+if __name__ == "__main__":
+    test_sync_root_level_file()
+    test_sync_docs_root_replaces_everything_once()
+    print("ok")